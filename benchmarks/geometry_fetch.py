@@ -0,0 +1,76 @@
+"""Compare the two ways of turning the suburbs layer into a GeoDataFrame.
+
+- fetchall: the rows come back as Python tuples, rebuilt into a DataFrame
+  and the WKB parsed afterwards (what the map page used to do)
+- arrow: the result is fetched as an Arrow table and the WKB column parsed in
+  one vectorized call (``db.to_geodataframe``)
+
+    python benchmarks/geometry_fetch.py --database rentals.duckdb
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import duckdb
+import geopandas as gpd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "visualisation"))
+from db import to_geodataframe  # noqa: E402
+
+QUERY = "SELECT ST_AsWKB(geometry) AS geometry, postcode FROM suburbs"
+
+
+def with_fetchall(con: duckdb.DuckDBPyConnection) -> gpd.GeoDataFrame:
+    df = gpd.GeoDataFrame.from_records(
+        con.sql(QUERY).fetchall(), columns=["geometry", "postcode"]
+    )
+    df["geometry"] = gpd.GeoSeries.from_wkb(df["geometry"], crs="4326")
+    return df.set_geometry("geometry")
+
+
+def with_arrow(con: duckdb.DuckDBPyConnection) -> gpd.GeoDataFrame:
+    return to_geodataframe(con.execute(QUERY).arrow())
+
+
+def measure(func, con, repeat):
+    """Return the best wall time and the peak of Python allocations"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(con)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    df = func(con)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="rentals.duckdb")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    con = duckdb.connect(args.database, read_only=True)
+    con.load_extension("spatial")
+
+    results = {}
+    for name, func in [("fetchall", with_fetchall), ("arrow", with_arrow)]:
+        df, seconds, peak = measure(func, con, args.repeat)
+        results[name] = df
+        print(
+            f"{name:>8}: {len(df)} geometries, {seconds * 1000:.1f} ms, "
+            f"peak {peak / 1024 / 1024:.1f} MB of Python allocations"
+        )
+
+    # both paths must build the same layer
+    assert results["fetchall"].geometry.equals(results["arrow"].geometry)
+
+
+if __name__ == "__main__":
+    main()
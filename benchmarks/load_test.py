@@ -0,0 +1,118 @@
+"""Simulate concurrent dashboard sessions against the cursor pool.
+
+Each session is a thread which views pages in a loop: every page view runs
+the queries of one dashboard page with random filters. The results cache is
+bypassed so every query reaches DuckDB. The run is repeated for each pool
+size, a pool of 1 is what a single shared connection gives.
+
+    python benchmarks/load_test.py --database rentals.duckdb --sessions 8 --pool-sizes 1 4 8
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "visualisation"))
+import db as dashboard_db  # noqa: E402
+from filters import RentalFilters  # noqa: E402
+
+
+class UncachedConnection(dashboard_db.DuckDBConnection):
+    """Every query reaches the database, the results cache would hide the pool"""
+
+    def query(self, query: str, ttl: int = 3600, **kwargs) -> pd.DataFrame:
+        with self.lease() as cursor:
+            cursor.execute(query, **kwargs)
+            return cursor.df()
+
+
+def random_filters(years: tuple[int, int], postcodes: list[str]) -> RentalFilters:
+    first_year = random.randint(*years)
+    selected = random.sample(postcodes, random.choice([0, 0, 1, 5]))
+    return RentalFilters.from_selection(
+        (first_year, random.randint(first_year, years[1])), selected
+    )
+
+
+def view_page(db, filters: RentalFilters):
+    """Run the queries of a random page"""
+    page = random.randrange(4)
+    if page == 0:
+        dashboard_db.rent_summary(db, ["bedrooms_corrected"], filters, median=True)
+        dashboard_db.rent_summary(db, ["month_of_year"], filters)
+    elif page == 1:
+        bounds = dashboard_db.rent_bounds(db, filters)
+        dashboard_db.trimmed_monthly_stats(db, filters, bounds)
+        dashboard_db.rent_histogram(db, filters, bounds)
+    elif page == 2:
+        dashboard_db.rent_trends(db, filters, 4)
+    else:
+        dashboard_db.rent_summary(db, ["postcode"], filters)
+
+
+def run(db, sessions: int, duration: float, years, postcodes) -> list[float]:
+    timings = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def session():
+        while time.perf_counter() < deadline:
+            filters = random_filters(years, postcodes)
+            start = time.perf_counter()
+            view_page(db, filters)
+            with lock:
+                timings.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="rentals.duckdb")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for pool_size in args.pool_sizes:
+        random.seed(args.seed)
+        db = UncachedConnection(
+            "load-test", database=args.database, read_only=True, pool_size=pool_size
+        )
+        min_date, max_date = (
+            db.cursor()
+            .sql('SELECT MIN("lodgement_date"), MAX("lodgement_date") FROM rentals')
+            .fetchone()
+        )
+        postcodes = db.query('SELECT DISTINCT "postcode"::VARCHAR AS p FROM rentals')
+        timings = run(
+            db,
+            args.sessions,
+            args.duration,
+            (min_date.year, max_date.year),
+            postcodes["p"].tolist(),
+        )
+        timings.sort()
+        print(
+            f"pool of {pool_size}, {args.sessions} sessions: "
+            f"{len(timings) / args.duration:.1f} page views/s, "
+            f"p50 {statistics.median(timings) * 1000:.0f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:.0f} ms"
+        )
+        db._instance.close()
+
+
+if __name__ == "__main__":
+    main()
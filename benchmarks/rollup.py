@@ -0,0 +1,112 @@
+"""Time the rollup tables against scanning ``rentals`` for the same results.
+
+For each grouping of the pages, the counts and means are computed from
+``rentals_monthly`` and from the raw rows, and the $10 rent bins of the
+histogram from ``rent_bins`` and from the raw rows. The rollup tables only
+pay off when they are read faster than the rows they summarise.
+
+    python benchmarks/rollup.py --database rentals.duckdb
+"""
+
+import argparse
+import time
+
+import duckdb
+
+DIMENSIONS = {
+    "bedrooms_corrected": (
+        '"bedrooms_corrected"',
+        'CASE WHEN "bedrooms" > 5 THEN 5 ELSE "bedrooms" END',
+    ),
+    "month_of_year": (
+        "datepart('month', \"month\")",
+        "datepart('month', \"lodgement_date\")",
+    ),
+    "postcode": ('"postcode"', '"postcode"'),
+}
+
+ROLLUP_QUERY = """
+SELECT {dimension}, SUM("bonds"), SUM("rent_sum") / SUM("rent_count"),
+    MIN("rent_min"), MAX("rent_max")
+FROM rentals_monthly WHERE "month" >= ? AND "month" < ?
+GROUP BY ALL
+"""
+
+RAW_QUERY = """
+SELECT {dimension}, COUNT(*), AVG("weekly_rent"),
+    MIN("weekly_rent"), MAX("weekly_rent")
+FROM rentals WHERE "lodgement_date" >= ? AND "lodgement_date" < ?
+GROUP BY ALL
+"""
+
+BINS_QUERY = """
+SELECT "bedrooms_corrected", "rent_bin", SUM("bonds")
+FROM rent_bins WHERE "month" >= ? AND "month" < ?
+GROUP BY ALL
+"""
+
+RAW_BINS_QUERY = """
+SELECT CASE WHEN "bedrooms" > 5 THEN 5 ELSE "bedrooms" END, "weekly_rent" // 10, COUNT(*)
+FROM rentals WHERE "lodgement_date" >= ? AND "lodgement_date" < ?
+    AND "weekly_rent" IS NOT NULL
+GROUP BY ALL
+"""
+
+
+def time_query(con, query, parameters, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        con.execute(query, parameters).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="rentals.duckdb")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    con = duckdb.connect(args.database, read_only=True)
+    first, last = con.execute(
+        'SELECT MIN("lodgement_date"), MAX("lodgement_date") FROM rentals'
+    ).fetchone()
+    for name, table in [
+        ("rentals", "rentals"),
+        ("rentals_monthly", "rentals_monthly"),
+        ("rent_bins", "rent_bins"),
+    ]:
+        rows = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"{name}: {rows} rows")
+
+    ranges = {
+        "all": (first.replace(day=1), last.replace(year=last.year + 1, day=1)),
+        "last year": (
+            last.replace(month=1, day=1),
+            last.replace(year=last.year + 1, month=1, day=1),
+        ),
+    }
+    print(f"{'':40} {'rollup':>10} {'rentals':>10}")
+    for label, parameters in ranges.items():
+        for dimension, (rollup, raw) in DIMENSIONS.items():
+            rollup_time = time_query(
+                con, ROLLUP_QUERY.format(dimension=rollup), parameters, args.repeat
+            )
+            raw_time = time_query(
+                con, RAW_QUERY.format(dimension=raw), parameters, args.repeat
+            )
+            print(
+                f"{f'summary by {dimension}, {label}':40} "
+                f"{rollup_time * 1000:8.1f}ms {raw_time * 1000:8.1f}ms"
+            )
+        bins_time = time_query(con, BINS_QUERY, parameters, args.repeat)
+        raw_time = time_query(con, RAW_BINS_QUERY, parameters, args.repeat)
+        print(
+            f"{f'rent bins, {label}':40} "
+            f"{bins_time * 1000:8.1f}ms {raw_time * 1000:8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
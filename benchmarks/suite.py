@@ -0,0 +1,391 @@
+"""Time every pipeline stage and every dashboard query, and flag regressions.
+
+Two groups of benchmarks, each recording the wall time and the peak memory:
+
+- stages: convert_xlsx_to_csv.py, the two cleanup scripts and
+  build_database.py, each run in a new process on a copy of the inputs
+  (--input, by default data/input) in a scratch directory, from scratch.
+  With --raw, the cleanup scripts read these converted Parquet files instead
+  (generate_synthetic.py --format parquet) and there is no conversion
+- queries: every query of the four dashboard pages, for each selection of
+  selections(), with the results cache bypassed. Median time of --repeat
+  runs, after a first one measuring the memory
+
+Each run is appended to a JSON Lines history (--history). The results are
+compared with the median of the last runs on the same machine and the same
+data (see dataset_digest), the exit status is 1 when one of them got slower
+or bigger than THRESHOLDS.
+
+    python benchmarks/suite.py --database rentals.duckdb
+    python benchmarks/suite.py --stages --input data/synthetic/input
+    python benchmarks/suite.py --stages --raw data/synthetic/output/parquet/raw
+"""
+
+import argparse
+import dataclasses
+import datetime
+import hashlib
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import duckdb
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT_DIR, "visualisation"))
+import db as dashboard_db  # noqa: E402
+from constants import map_areas  # noqa: E402
+from filters import RentalFilters  # noqa: E402
+from tiles import TileServer  # noqa: E402
+
+# relative increase over the baseline flagged as a regression, and the
+# smallest absolute increase which counts, below it is noise
+THRESHOLDS = {"seconds": 0.20, "peak_mb": 0.25}
+NOISE_FLOORS = {"seconds": 0.005, "peak_mb": 16}
+# previous runs the baseline is the median of
+BASELINE_RUNS = 5
+
+# runs a stage, prints its time and the peak memory of its processes (kB)
+STAGE_RUNNER = """
+import resource, subprocess, sys, time
+start = time.perf_counter()
+subprocess.run(sys.argv[1:], stdout=subprocess.DEVNULL, check=True)
+seconds = time.perf_counter() - start
+print(seconds, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+"""
+
+
+class UncachedConnection(dashboard_db.DuckDBConnection):
+    """Every query reaches the database"""
+
+    def arrow(self, query: str, ttl: int = 3600, **kwargs):
+        with self.lease() as cursor:
+            cursor.execute(query, **kwargs)
+            return cursor.arrow()
+
+
+def selections(db) -> dict[str, RentalFilters]:
+    """The filter selections every query is timed with"""
+    domains = dashboard_db.rental_domains(db)
+    first_year, last_year = domains["min_date"].year, domains["max_date"].year
+    busiest = db.query(
+        'SELECT "postcode"::VARCHAR AS "postcode" FROM rentals '
+        "GROUP BY ALL ORDER BY COUNT(*) DESC LIMIT 10"
+    )["postcode"].tolist()
+    return {
+        "all": RentalFilters.from_selection((first_year, last_year)),
+        "last year": RentalFilters.from_selection((last_year, last_year)),
+        "1 postcode": RentalFilters.from_selection(
+            (first_year, last_year), busiest[:1]
+        ),
+        "10 postcodes": RentalFilters.from_selection((first_year, last_year), busiest),
+        "flats": RentalFilters.from_selection((first_year, last_year), (), ["F"]),
+    }
+
+
+def tile_at(lon: float, lat: float, z: int) -> tuple[int, int, int]:
+    """The Web Mercator tile containing a point"""
+    n = 2**z
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2
+    return z, int((lon + 180) / 360 * n), int(y * n)
+
+
+def page_queries(db) -> dict:
+    """The queries of the pages by name, each a function of the filters"""
+    queries = {
+        "1-Globals_stats/rent_summary[bedrooms]": lambda f: dashboard_db.rent_summary(
+            db, ["bedrooms_corrected"], f, median=True
+        ),
+        "1-Globals_stats/rent_summary[month_of_year]": lambda f: (
+            dashboard_db.rent_summary(db, ["month_of_year"], f)
+        ),
+        "2-Rent stats/rent_bounds": lambda f: dashboard_db.rent_bounds(db, f),
+        "2-Rent stats/trimmed_monthly_stats": lambda f: (
+            dashboard_db.trimmed_monthly_stats(db, f, dashboard_db.rent_bounds(db, f))
+        ),
+        "2-Rent stats/rent_histogram": lambda f: dashboard_db.rent_histogram(
+            db, f, dashboard_db.rent_bounds(db, f)
+        ),
+        # the page only keeps up to 5 bedrooms
+        "3-Rent change/rent_trends[4 months]": lambda f: dashboard_db.rent_trends(
+            db, dataclasses.replace(f, max_bedrooms=5), 4
+        ),
+        "3-Rent change/rent_trends[12 months]": lambda f: dashboard_db.rent_trends(
+            db, dataclasses.replace(f, max_bedrooms=5), 12
+        ),
+    }
+    # the map page needs the geometry, see build_database.py --no-geometry
+    if not dashboard_db.has_table(db, "suburbs"):
+        return queries
+
+    # as the map page, restricted to the postcodes of the area
+    sydney = map_areas["Greater Sydney"]
+    in_sydney = dashboard_db.postcodes_in_bbox(db, sydney)
+
+    # the page stops when none of the selected postcodes is in the area,
+    # there is nothing to fetch
+    def map_metrics(filters):
+        filters = filters.within_postcodes(in_sydney)
+        if filters is None:
+            return None
+        return dashboard_db.rent_summary(db, ["postcode"], filters)
+
+    def map_shapes(filters):
+        metrics = map_metrics(filters)
+        if metrics is None:
+            return None
+        return dashboard_db.postcode_shapes(db, metrics["postcode"].tolist())
+
+    queries["4-Maps/postcodes_in_bbox"] = lambda f: dashboard_db.postcodes_in_bbox(
+        db, sydney
+    )
+    queries["4-Maps/rent_summary[postcode]"] = map_metrics
+    queries["4-Maps/postcode_shapes"] = map_shapes
+    if dashboard_db.has_table(db, "postcode_tiles"):
+        # port 0: the server is never started, only its tiles are encoded
+        server = TileServer(db, 0)
+        center = ((sydney[0] + sydney[2]) / 2, (sydney[1] + sydney[3]) / 2)
+
+        def tile(filters, z):
+            filters = filters.within_postcodes(in_sydney)
+            if filters is None:
+                return None
+            return server.tile(*tile_at(*center, z), filters.to_token())
+
+        queries["4-Maps/tile[z=6]"] = lambda f: tile(f, 6)
+        queries["4-Maps/tile[z=10]"] = lambda f: tile(f, 10)
+    return queries
+
+
+def memory_status(field: str) -> float | None:
+    """A memory field of /proc/self/status in MiB, None if unsupported"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def measure_peak_memory(run) -> float:
+    """Run ``run``, the peak resident memory it added to the process in MiB"""
+    try:
+        # resets the peak to the current resident memory
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    before = memory_status("VmRSS")
+    run()
+    peak = memory_status("VmHWM")
+    if before is None or peak is None:
+        # only the peak since the start of the process, kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak - before
+
+
+def bench_queries(database: str, repeat: int) -> dict:
+    db = UncachedConnection("benchmark", database=database, read_only=True)
+    results = {}
+    queries = page_queries(db)
+    for selection, filters in selections(db).items():
+        for name, run in queries.items():
+            # the first run also reads the blocks from disk, not timed
+            peak_mb = measure_peak_memory(lambda: run(filters))
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run(filters)
+                timings.append(time.perf_counter() - start)
+            seconds = statistics.median(timings)
+            results[f"query:{name}/{selection}"] = {
+                "seconds": seconds,
+                "peak_mb": peak_mb,
+            }
+            print(
+                f"  {seconds * 1000:8.1f} ms {peak_mb:7.1f} MiB  {name} / {selection}"
+            )
+    db._instance.close()
+    return results
+
+
+def run_stage(command: list[str], cwd: str) -> dict:
+    """Run a stage in a new process, its time and peak memory"""
+    # started from a small process: a forked process starts with the peak
+    # memory of its parent, the one of this process would be reported
+    result = subprocess.run(
+        [sys.executable, "-c", STAGE_RUNNER, sys.executable, *command],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    seconds, peak_kb = result.stdout.split()
+    return {"seconds": float(seconds), "peak_mb": int(peak_kb) / 1024}
+
+
+def bench_stages(input_dir: str, work_dir: str, raw_dir: str | None = None) -> dict:
+    """Run the pipeline from scratch in ``work_dir``, reading ``input_dir``, or
+    the converted files of ``raw_dir``"""
+    scripts = os.path.abspath(os.path.join(ROOT_DIR, "scripts"))
+    os.makedirs(os.path.join(work_dir, "data", "output", "parquet"), exist_ok=True)
+    if raw_dir is not None:
+        os.symlink(
+            os.path.abspath(raw_dir),
+            os.path.join(work_dir, "data", "output", "parquet", "raw"),
+        )
+    else:
+        os.symlink(os.path.abspath(input_dir), os.path.join(work_dir, "data", "input"))
+    shapefile = os.path.join(ROOT_DIR, "data", "shp", "suburbs", "Suburb.shp")
+    build = [f"{scripts}/build_database.py", "--database", "rentals.duckdb"]
+    if os.path.exists(shapefile):
+        os.symlink(
+            os.path.abspath(os.path.dirname(os.path.dirname(shapefile))),
+            os.path.join(work_dir, "data", "shp"),
+        )
+    else:
+        build.append("--no-geometry")
+
+    stages = {
+        "convert_xlsx_to_csv": [f"{scripts}/convert_xlsx_to_csv.py"],
+        "cleanup_lodgements": [f"{scripts}/cleanup_lodgements.py", "--full"],
+        "cleanup_refunds": [f"{scripts}/cleanup_refunds.py", "--full"],
+        "build_database": build,
+    }
+    if raw_dir is not None:
+        del stages["convert_xlsx_to_csv"]
+    results = {}
+    for name, command in stages.items():
+        results[f"stage:{name}"] = run_stage(command, work_dir)
+        result = results[f"stage:{name}"]
+        print(f"  {result['seconds']:8.1f} s  {result['peak_mb']:7.1f} MiB  {name}")
+    return results
+
+
+def dataset_digest(con: duckdb.DuckDBPyConnection) -> str:
+    """Identity of the data of the database, the same for every build of the
+    same inputs. The version stamped by the builds changes every time"""
+    summary = con.execute(
+        """
+SELECT COUNT(*), SUM("weekly_rent"), MIN("lodgement_date"), MAX("lodgement_date")
+FROM rentals
+"""
+    ).fetchone()
+    return hashlib.sha256(repr(summary).encode()).hexdigest()[:16]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regressions(run: dict, history: list[dict]) -> list[str]:
+    """The results of ``run`` worse than the baseline of the previous runs of
+    the same machine on the same data"""
+    found = []
+    for name, result in run["results"].items():
+        previous = [
+            x["results"][name]
+            for x in history
+            if x["host"] == run["host"]
+            # the runs recorded before the digest are never compared
+            and x.get("dataset") == run["dataset"]
+            and name in x["results"]
+        ][-BASELINE_RUNS:]
+        if not previous:
+            continue
+        for metric, threshold in THRESHOLDS.items():
+            baseline = statistics.median(x[metric] for x in previous)
+            value = result[metric]
+            if (
+                value > baseline * (1 + threshold)
+                and value - baseline > NOISE_FLOORS[metric]
+            ):
+                found.append(
+                    f"{name}: {metric} {value:.3f} vs {baseline:.3f} "
+                    f"(+{(value / baseline - 1) * 100:.0f}%)"
+                )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="rentals.duckdb")
+    parser.add_argument(
+        "--stages",
+        action="store_true",
+        help="also run the pipeline, the queries then use the database it built",
+    )
+    parser.add_argument("--input", default="data/input", help="xlsx of the stages")
+    parser.add_argument(
+        "--raw",
+        help="converted Parquet files of the stages, e.g. data/synthetic/output/parquet/raw",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--history", default=os.path.join(os.path.dirname(__file__), "history.jsonl")
+    )
+    parser.add_argument(
+        "--no-record", action="store_true", help="compare without recording the run"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        database = args.database
+        if args.stages:
+            print("Stages:")
+            results.update(bench_stages(args.input, work_dir, args.raw))
+            database = os.path.join(work_dir, "rentals.duckdb")
+        print("Queries:")
+        results.update(bench_queries(database, args.repeat))
+        with duckdb.connect(database, read_only=True) as con:
+            dataset = dataset_digest(con)
+
+    run = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "host": platform.node(),
+        "dataset": dataset,
+        "results": results,
+    }
+    history = load_history(args.history)
+    found = regressions(run, history)
+    if not args.no_record:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(run, sort_keys=True) + "\n")
+
+    if found:
+        print("Regressions:")
+        for line in found:
+            print(f"  {line}")
+        sys.exit(1)
+    print("No regression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Measure what DuckDB reads of ``rentals`` for a single year.
+
+Runs the ``datepart('year', ...)`` filter the pages used to run and the WHERE
+clause of ``RentalFilters`` (the half-open date range, with the postcode,
+dwelling type and bedrooms clauses of the pages), and reports for each:
+
+- the table data loaded from disk by a new connection running the query, the
+  row groups skipped with their min/max statistics are never loaded
+- the rows coming out of the table scan, from the profiler: the filters
+  pushed into the scan are applied there, the others above it
+- the warm time of the query
+
+    python benchmarks/zone_maps.py --database rentals.duckdb --year 2023
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import duckdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "visualisation"))
+from filters import RentalFilters  # noqa: E402
+
+DATEPART_QUERY = """
+SELECT COUNT(*), AVG("weekly_rent") FROM {table}
+WHERE datepart('year', "lodgement_date") >= $first_year
+    AND datepart('year', "lodgement_date") <= $last_year
+"""
+
+FILTERS_QUERY = """
+SELECT COUNT(*), AVG("weekly_rent") FROM {table}
+WHERE {where}
+"""
+
+
+def scanned_rows(profile: dict) -> int:
+    """The rows coming out of the table scans of a JSON profile"""
+    rows = profile["cardinality"] if profile["name"].strip() == "SEQ_SCAN" else 0
+    return rows + sum(scanned_rows(child) for child in profile["children"])
+
+
+def profile_query(con, query, parameters) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "profile.json")
+        con.execute("SET enable_profiling = 'json'")
+        con.execute(f"SET profiling_output = '{path}'")
+        try:
+            con.execute(query, parameters).fetchall()
+        finally:
+            con.execute("PRAGMA disable_profiling")
+        with open(path) as f:
+            return json.load(f)
+
+
+def table_bytes(con) -> int:
+    return con.execute(
+        "SELECT SUM(memory_usage_bytes) FROM duckdb_memory() WHERE tag = 'BASE_TABLE'"
+    ).fetchone()[0]
+
+
+def loaded_bytes(database, query, parameters) -> int:
+    """The table data a new connection loads from disk to run the query.
+    No other connection of the process must have the database open, they
+    would share the blocks already loaded"""
+    with duckdb.connect(database, read_only=True) as con:
+        # the catalog and the metadata of the tables
+        con.execute("SELECT 1").fetchall()
+        before = table_bytes(con)
+        con.execute(query, parameters).fetchall()
+        return table_bytes(con) - before
+
+
+def time_query(con, query, parameters, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        con.execute(query, parameters).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(database, table, year, repeat):
+    filters = RentalFilters.from_selection((year, year))
+    queries = {
+        f"datepart('year', ...) = {year}": (
+            DATEPART_QUERY.format(table=table),
+            {"first_year": year, "last_year": year},
+        ),
+        "RentalFilters.where()": (
+            FILTERS_QUERY.format(table=table, where=filters.where()),
+            filters.parameters(),
+        ),
+    }
+
+    loaded = {
+        label: loaded_bytes(database, query, parameters)
+        for label, (query, parameters) in queries.items()
+    }
+    with duckdb.connect(database, read_only=True) as con:
+        rows = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"📦 {table}: {rows} rows")
+        for label, (query, parameters) in queries.items():
+            scanned = scanned_rows(profile_query(con, query, parameters))
+            seconds = time_query(con, query, parameters, repeat)
+            print(
+                f"  {label:28} {loaded[label] / 1024 / 1024:8.1f} MiB loaded "
+                f"{scanned:>10} rows out of the scan {seconds * 1000:8.1f} ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="rentals.duckdb")
+    parser.add_argument("--year", type=int, help="defaults to the last year")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--compare-unsorted",
+        action="store_true",
+        help="also report on a temporary copy of rentals in random order",
+    )
+    args = parser.parse_args()
+
+    year = args.year
+    if year is None:
+        with duckdb.connect(args.database, read_only=True) as con:
+            year = con.sql('SELECT MAX("lodgement_date") FROM rentals').fetchone()[0]
+            year = year.year
+
+    report(args.database, "rentals", year, args.repeat)
+
+    if args.compare_unsorted:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            unsorted = os.path.join(tmp_dir, "unsorted.duckdb")
+            with duckdb.connect(unsorted) as scratch:
+                source = args.database.replace("'", "''")
+                scratch.execute(f"ATTACH '{source}' AS source (READ_ONLY)")
+                scratch.execute(
+                    "CREATE TABLE rentals_unsorted AS "
+                    "SELECT * FROM source.rentals ORDER BY random()"
+                )
+            report(unsorted, "rentals_unsorted", year, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
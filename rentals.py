@@ -9,8 +9,17 @@ app = Dash(__name__)
 # connect duckdb
 con = duckdb.connect(database="rentals.duckdb", read_only=True)
 
-# get the data
-df = pd.read_sql("SELECT * FROM rentals", con)
+# get the data, DuckDB returns the ENUM columns as pandas categoricals and
+# the narrow integers as uint8/uint32 instead of object columns
+df = con.sql("""
+SELECT
+    lodgement_date AS "Lodgement Date",
+    postcode AS "Postcode",
+    "type" AS "Dwelling Type",
+    bedrooms AS "Bedrooms",
+    weekly_rent AS "Weekly Rent"
+FROM rentals
+""").df()
 
 
 app.layout = html.Div([
@@ -18,7 +27,7 @@ app.layout = html.Div([
 
         html.Div([
             dcc.Dropdown(
-                df['Postcode'].unique(),
+                df['Postcode'].cat.categories.tolist(),
                 'Postcode',
                 id='xaxis-column'
             ),
@@ -32,7 +41,7 @@ app.layout = html.Div([
 
         html.Div([
             dcc.Dropdown(
-                df['Dwelling Type'].unique(),
+                df['Dwelling Type'].cat.categories.tolist(),
                 'Dwelling type',
                 id='yaxis-column'
             ),
@@ -80,7 +89,6 @@ def update_rentals_per_bedroom(date_range):
     dff = dff.groupby(['Bedrooms'])['Weekly Rent'].count().sort_index().reset_index()
     # rename the columns
     dff.columns = ['Bedrooms', "Bonds"]
-    print(dff.info())
 
 
     # display the ploty figure as a barchart, add the number of rentals as the color
@@ -91,7 +99,6 @@ def update_rentals_per_bedroom(date_range):
     Input('year--slider', 'value'),
 )
 def update_graph(date_range):
-    print(date_range)
     # filter the data by date_range
     dff = df[(df['Lodgement Date'].dt.year >= date_range[0]) & (df['Lodgement Date'].dt.year <= date_range[1]+1)]
     # convert the bedrooms to int
@@ -0,0 +1,207 @@
+"""Build the database of the dashboard from the cleaned outputs.
+
+Every table is built in a new file next to the database, which replaces it
+once complete, so the dashboard never opens a half built database:
+
+- rentals and refunds, from the Parquet parts of the ingestion (see
+  ingest.py) read with read_parquet, the columns renamed to snake_case
+- the postcode shapes and suburbs, from the NSW suburbs shapefile
+  (simplify_geometry.py)
+- the derived tables: monthly rollup, trim bounds and filter domains, vector
+  tiles
+- the version of the database, read by the dashboard (stamp_version.sql)
+
+DuckDB reads the Parquet files and runs the queries on all the cores. The
+time of each step is printed at the end.
+
+    python scripts/build_database.py --database rentals.duckdb
+"""
+
+import argparse
+import contextlib
+import os
+import subprocess
+import sys
+import time
+
+import duckdb
+
+from ingest import PARQUET_DIR
+
+SCRIPTS_DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "..", "visualisation"))
+from precomputed import build_rollup, build_stats  # noqa: E402
+
+# column of the cleaned files -> column of the table, type
+RENTALS_COLUMNS = {
+    "Lodgement Date": ("lodgement_date", "DATE"),
+    "Postcode": ("postcode", "postcode"),
+    "Dwelling Type": ("type", "dwelling_type"),
+    "Bedrooms": ("bedrooms", "UTINYINT"),
+    "Weekly Rent": ("weekly_rent", "UINTEGER"),
+}
+REFUNDS_COLUMNS = {
+    "Payment Date": ("payment_date", "DATE"),
+    "Postcode": ("postcode", "postcode"),
+    "Dwelling Type": ("type", "dwelling_type"),
+    "Bedrooms": ("bedrooms", "UTINYINT"),
+    "Payment To Agent": ("payment_to_agent", "UINTEGER"),
+    "Payment To Tenant": ("payment_to_tenant", "UINTEGER"),
+    "Days Bond Held": ("days_bond_held", "UINTEGER"),
+}
+
+# Compact types: dictionary encoded postcodes/dwelling types.
+POSTCODE_TYPE_QUERY = """
+CREATE TYPE postcode AS ENUM (
+    SELECT DISTINCT "Postcode" FROM read_parquet($lodgements)
+    WHERE "Postcode" IS NOT NULL
+    UNION
+    SELECT DISTINCT "Postcode" FROM read_parquet($refunds)
+    WHERE "Postcode" IS NOT NULL
+    ORDER BY 1
+)
+"""
+DWELLING_TYPE_QUERY = "CREATE TYPE dwelling_type AS ENUM ('F', 'H', 'T', 'O', 'U')"
+
+SUBURBS_QUERY = """
+CREATE TABLE suburbs AS
+SELECT
+    suburbname AS name,
+    postcode,
+    geom AS geometry
+FROM st_read($path);
+"""
+
+INDEX_QUERY = """
+CREATE UNIQUE INDEX geo_post ON suburbs(postcode);
+CREATE INDEX rentals_post ON rentals(postcode);
+"""
+
+
+def load_query(table: str, columns: dict, order_by: list[str]) -> str:
+    """Read the Parquet parts with their columns renamed and cast"""
+    select = ",\n    ".join(
+        f'"{source}"::{sql_type} AS "{name}"'
+        for source, (name, sql_type) in columns.items()
+    )
+    order = ", ".join(f'"{name}"' for name in order_by)
+    # keep the rows physically ordered, so the date/postcode filters of the
+    # dashboard can skip whole row groups using their min/max statistics
+    return f"""
+CREATE TABLE {table} AS
+SELECT
+    {select}
+FROM read_parquet($path)
+ORDER BY {order};
+"""
+
+
+@contextlib.contextmanager
+def step(name: str, timings: dict):
+    print(f"{name}...")
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+
+def run_script(name: str, database: str):
+    subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, name), "--database", database],
+        check=True,
+    )
+
+
+def stamp_version(con: duckdb.DuckDBPyConnection):
+    with open(os.path.join(SCRIPTS_DIR, "stamp_version.sql")) as f:
+        con.execute(f.read())
+
+
+def build(path: str, suburbs: str | None, threads: int | None) -> dict:
+    """Build every table in ``path``, the time of each step in seconds"""
+    timings = {}
+    # year=*/month=* partitions, the columns are read from the files
+    lodgements = os.path.join(PARQUET_DIR, "lodgements", "*", "*", "*.parquet")
+    refunds = os.path.join(PARQUET_DIR, "refunds", "*", "*", "*.parquet")
+
+    con = duckdb.connect(path)
+    if threads is not None:
+        con.execute(f"SET threads = {threads}")
+
+    with step("types", timings):
+        con.execute(POSTCODE_TYPE_QUERY, {"lodgements": lodgements, "refunds": refunds})
+        con.execute(DWELLING_TYPE_QUERY)
+    with step("rentals", timings):
+        con.execute(
+            load_query("rentals", RENTALS_COLUMNS, ["lodgement_date", "postcode"]),
+            {"path": lodgements},
+        )
+    with step("refunds", timings):
+        con.execute(
+            load_query("refunds", REFUNDS_COLUMNS, ["payment_date", "postcode"]),
+            {"path": refunds},
+        )
+    with step("monthly rollup", timings):
+        build_rollup(con)
+    with step("trim bounds and domains", timings):
+        build_stats(con)
+    if suburbs is None:
+        con.execute("CREATE INDEX rentals_post ON rentals(postcode)")
+        stamp_version(con)
+        con.close()
+        return timings
+    # the geometry scripts open the database themselves
+    con.close()
+
+    with step("postcode shapes", timings):
+        run_script("simplify_geometry.py", path)
+    with step("vector tiles", timings):
+        run_script("build_tiles.py", path)
+
+    con = duckdb.connect(path)
+    with step("suburbs", timings):
+        try:
+            con.load_extension("spatial")
+        except duckdb.IOException:
+            con.install_extension("spatial")
+            con.load_extension("spatial")
+        con.execute(SUBURBS_QUERY, {"path": suburbs})
+    with step("indexes", timings):
+        con.execute(INDEX_QUERY)
+    stamp_version(con)
+    con.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dashboard database")
+    parser.add_argument("--database", default="rentals.duckdb")
+    parser.add_argument(
+        "--suburbs",
+        default="data/shp/suburbs/suburb.geojson",
+        help="written by simplify_geometry.py from the suburbs shapefile",
+    )
+    parser.add_argument(
+        "--no-geometry",
+        action="store_true",
+        help="without the suburbs, postcode shapes and tiles",
+    )
+    parser.add_argument("--threads", type=int, help="default: all the cores")
+    args = parser.parse_args()
+
+    path = f"{args.database}.building"
+    # left over by an interrupted build
+    for leftover in (path, f"{path}.wal"):
+        if os.path.exists(leftover):
+            os.unlink(leftover)
+
+    start = time.perf_counter()
+    timings = build(path, None if args.no_geometry else args.suburbs, args.threads)
+    os.replace(path, args.database)
+
+    for name, seconds in timings.items():
+        print(f"  {seconds:7.1f}s  {name}")
+    print(f"Built {args.database} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
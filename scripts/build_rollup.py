@@ -0,0 +1,27 @@
+"""Build the monthly rollup (rentals_monthly) and the rent bins (rent_bins) of
+the rentals table, with the queries of visualisation/precomputed.py.
+
+    python scripts/build_rollup.py --database rentals.duckdb
+"""
+
+import argparse
+import os
+import sys
+
+import duckdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "visualisation"))
+from precomputed import build_rollup  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="rentals.duckdb")
+    args = parser.parse_args()
+
+    with duckdb.connect(args.database) as con:
+        build_rollup(con)
+
+
+if __name__ == "__main__":
+    main()
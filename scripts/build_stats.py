@@ -0,0 +1,28 @@
+"""Build the rent trim bounds (rent_trim_bounds) and the filter domains
+(rental_domains) of the rentals table, with the queries of
+visualisation/precomputed.py.
+
+    python scripts/build_stats.py --database rentals.duckdb
+"""
+
+import argparse
+import os
+import sys
+
+import duckdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "visualisation"))
+from precomputed import build_stats  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="rentals.duckdb")
+    args = parser.parse_args()
+
+    with duckdb.connect(args.database) as con:
+        build_stats(con)
+
+
+if __name__ == "__main__":
+    main()
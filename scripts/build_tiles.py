@@ -0,0 +1,112 @@
+"""Cut the postcode shapes into vector tiles.
+
+For every zoom level of ZOOM_LEVELS (see visualisation/precomputed.py) the
+shapes of the matching simplification level (postcode_shapes, see
+simplify_geometry.py) are projected to Web Mercator and clipped to each tile
+they touch, plus a small buffer so the borders don't show at the tile edges. The pieces are stored in
+the postcode_tiles table, the tile server of the dashboard
+(visualisation/tiles.py) encodes them to MVT with the rent metrics attached.
+
+    python scripts/build_tiles.py --database rentals.duckdb
+"""
+
+import argparse
+import math
+import os
+import sys
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "visualisation"))
+from precomputed import MERCATOR_HALF_SIZE, ZOOM_LEVELS, tile_bounds  # noqa: E402
+
+# extra space around each tile, as a fraction of the tile
+TILE_BUFFER = 64 / 4096
+
+
+def to_mercator(coordinates: np.ndarray) -> np.ndarray:
+    lon, lat = coordinates[:, 0], np.clip(coordinates[:, 1], -85.0511, 85.0511)
+    x = lon * MERCATOR_HALF_SIZE / 180
+    y = np.log(np.tan((90 + lat) * math.pi / 360)) * MERCATOR_HALF_SIZE / math.pi
+    return np.column_stack([x, y])
+
+
+def tile_range(z: int, xmin: float, ymin: float, xmax: float, ymax: float):
+    """The tiles covering Web Mercator bounds"""
+    size = 2 * MERCATOR_HALF_SIZE / 2**z
+    first_x = int((xmin + MERCATOR_HALF_SIZE) // size)
+    last_x = int((xmax + MERCATOR_HALF_SIZE) // size)
+    first_y = int((MERCATOR_HALF_SIZE - ymax) // size)
+    last_y = int((MERCATOR_HALF_SIZE - ymin) // size)
+    for x in range(max(first_x, 0), min(last_x, 2**z - 1) + 1):
+        for y in range(max(first_y, 0), min(last_y, 2**z - 1) + 1):
+            yield x, y
+
+
+def cut_tiles(z: int, postcodes: np.ndarray, shapes: np.ndarray) -> pa.Table:
+    tree = shapely.STRtree(shapes)
+    xmin, ymin, xmax, ymax = shapely.total_bounds(shapes)
+
+    columns = {"z": [], "x": [], "y": [], "postcode": [], "geometry": []}
+    for x, y in tile_range(z, xmin, ymin, xmax, ymax):
+        bounds = tile_bounds(z, x, y)
+        buffer = (bounds[2] - bounds[0]) * TILE_BUFFER
+        box = shapely.box(*bounds).buffer(buffer, join_style="mitre")
+        candidates = tree.query(box, predicate="intersects")
+        if len(candidates) == 0:
+            continue
+        pieces = shapely.clip_by_rect(shapes[candidates], *box.bounds)
+        keep = ~shapely.is_empty(pieces)
+        count = int(keep.sum())
+        columns["z"] += [z] * count
+        columns["x"] += [x] * count
+        columns["y"] += [y] * count
+        columns["postcode"] += postcodes[candidates][keep].tolist()
+        columns["geometry"] += shapely.to_wkb(pieces[keep]).tolist()
+
+    return pa.table(
+        {
+            "z": pa.array(columns["z"], pa.uint8()),
+            "x": pa.array(columns["x"], pa.uint32()),
+            "y": pa.array(columns["y"], pa.uint32()),
+            "postcode": pa.array(columns["postcode"], pa.string()),
+            "geometry": pa.array(columns["geometry"], pa.binary()),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cut the postcode vector tiles")
+    parser.add_argument("--database", default="rentals.duckdb")
+    args = parser.parse_args()
+
+    con = duckdb.connect(args.database)
+
+    tables = []
+    for z, level in ZOOM_LEVELS.items():
+        shapes = con.execute(
+            'SELECT "postcode", "geometry" FROM postcode_shapes WHERE "level" = ?',
+            [level],
+        ).arrow()
+        postcodes = shapes["postcode"].to_numpy(zero_copy_only=False)
+        geometries = shapely.from_wkb(shapes["geometry"].to_numpy(zero_copy_only=False))
+        geometries = shapely.transform(geometries, to_mercator)
+
+        tiles = cut_tiles(z, postcodes, geometries)
+        tile_count = len(set(zip(tiles["x"].to_pylist(), tiles["y"].to_pylist())))
+        print(f"Zoom {z}: {tile_count} tiles, {tiles.num_rows} pieces")
+        tables.append(tiles)
+
+    con.register("tiles", pa.concat_tables(tables))
+    con.execute(
+        "CREATE OR REPLACE TABLE postcode_tiles AS "
+        'SELECT * FROM tiles ORDER BY "z", "x", "y"'
+    )
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
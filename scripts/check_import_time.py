@@ -0,0 +1,63 @@
+"""Check the import time of the dashboard modules against a budget.
+
+The modules are imported in a new interpreter with ``python -X importtime``,
+from the visualisation directory like Streamlit does. The slowest packages
+are listed, the exit status is 1 when the total is over the budget.
+
+    python scripts/check_import_time.py --budget-ms 1500 streamlit db
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+VISUALISATION_DIR = os.path.join(os.path.dirname(__file__), "..", "visualisation")
+
+# import time:     self [us] |  cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_times(modules: list[str]) -> list[tuple[int, str, int]]:
+    """Cumulative time in microseconds, name and nesting depth of each import"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=VISUALISATION_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is not None:
+            _, cumulative, indent, name = match.groups()
+            times.append((int(cumulative), name, len(indent) // 2))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time")
+    parser.add_argument("modules", nargs="+", help="modules imported together")
+    parser.add_argument("--budget-ms", type=float, required=True)
+    parser.add_argument("--top", type=int, default=15, help="slowest packages shown")
+    args = parser.parse_args()
+
+    times = import_times(args.modules)
+    # the first level imports add up to the whole import
+    total_ms = sum(cumulative for cumulative, _, depth in times if depth == 0) / 1000
+
+    print(f"Slowest imports of {', '.join(args.modules)}:")
+    packages = [(cumulative, name) for cumulative, name, _ in times if "." not in name]
+    for cumulative, name in sorted(packages, reverse=True)[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print(f"Total: {total_ms:.0f} ms, budget {args.budget_ms:.0f} ms")
+
+    if total_ms > args.budget_ms:
+        print("Over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
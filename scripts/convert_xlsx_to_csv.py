@@ -1,12 +1,28 @@
+"""Convert the NSW xlsx files to typed Parquet files.
+
+The files are converted in parallel by a pool of processes, one per core.
+A file is only converted again when its content changed since the last
+conversion (size/mtime, then sha256, recorded in the ingest manifest). The
+Parquet file of a removed xlsx file is removed with it.
+"""
+
+import contextlib
+import multiprocessing
 import os
-from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
 
 import polars as pl
 from tqdm import tqdm
 
+from ingest import fingerprint, load_manifest, save_manifest
+from schema import apply_schema, schemas, unmapped
+
 xlsx_base_dir = "data/input/xlsx"
-csv_base_dir = "data/output/csv"
+parquet_base_dir = "data/output/parquet/raw"
+
+# bumped when the conversion changes, the files are then converted again
+CONVERSION_VERSION = 2
 
 categories = [
     "refunds",
@@ -15,37 +31,84 @@ categories = [
 ]
 
 
-def convert_xlsx_to_csv(category, filename):
+def destination_path(category: str, filename: str) -> str:
     # get the filename without the extension
     base_name = filename.split("/")[-1].split(".")[0]
+    return os.path.join(parquet_base_dir, category, f"{base_name}.parquet")
 
-    destination = os.path.join(csv_base_dir, category, f"{base_name}.csv")
-
-    # skip the files already converted
-    if os.path.exists(destination):
-        print(f"Skipping {filename} already converted")
-        return
 
+def convert_xlsx(category: str, filename: str) -> tuple[int, list[str]]:
+    """Convert the first sheet of a xlsx file, return its number of rows and
+    the postcodes which aren't one, their rows are kept without a postcode"""
     # read the file, remove the first 2 rows they are the header from NSW
-    df = pl.read_excel(
+    source = pl.read_excel(
         filename,
         engine="calamine",
         read_options={"header_row": 2},
     )
-    print(df.head())
-    # save the file
-    df.write_csv(destination)
+    df = apply_schema(source, schemas[category])
+
+    # write then rename, an interrupted run never leaves a partial file
+    destination = destination_path(category, filename)
+    df.write_parquet(f"{destination}.tmp")
+    os.replace(f"{destination}.tmp", destination)
+    return df.height, unmapped(source, df, "Postcode").cast(pl.String).to_list()
+
+
+def main():
+    manifest = load_manifest()
+    converted = manifest.get("xlsx", {})
+
+    pending = []
+    for category in categories:
+        # create destination folder
+        os.makedirs(f"{parquet_base_dir}/{category}", exist_ok=True)
+
+        for filename in sorted(glob(f"{xlsx_base_dir}/{category}/*.xlsx")):
+            previous = converted.get(filename)
+            current = fingerprint(filename, previous)
+            if (
+                previous is not None
+                and previous["sha256"] == current["sha256"]
+                and previous.get("conversion_version") == CONVERSION_VERSION
+                and os.path.exists(destination_path(category, filename))
+            ):
+                converted[filename] = {**previous, **current}
+                continue
+            converted[filename] = {**current, "conversion_version": CONVERSION_VERSION}
+            pending.append((category, filename))
 
+    print(f"🧠 Converting {len(pending)} xlsx files to Parquet")
 
-for category in categories:
-    # convert the files to CSV
-    print(f"🧠 Converting {category} files to CSV")
+    # the parallelism comes from the processes, one polars thread each
+    os.environ.setdefault("POLARS_MAX_THREADS", "1")
+    # polars is not fork safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(mp_context=context) as pool:
+        futures = {
+            pool.submit(convert_xlsx, category, filename): filename
+            for category, filename in pending
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            filename = futures[future]
+            converted[filename]["rows"], invalid = future.result()
+            if invalid:
+                examples = ", ".join(sorted(set(invalid))[:5])
+                tqdm.write(
+                    f"⚠️ {filename}: {len(invalid)} rows without a valid postcode "
+                    f"({examples})"
+                )
 
-    file_list = glob(f"{xlsx_base_dir}/{category}/*.xlsx")
+    # forget the deleted files, and remove their Parquet file: the cleanup
+    # scripts would still read it
+    for filename in [x for x in converted if not os.path.exists(x)]:
+        del converted[filename]
+        category = os.path.basename(os.path.dirname(filename))
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(destination_path(category, filename))
+    manifest["xlsx"] = converted
+    save_manifest(manifest)
 
-    # create destination folder
-    os.makedirs(f"{csv_base_dir}/{category}", exist_ok=True)
 
-    convert_category = partial(convert_xlsx_to_csv, category)
-    for file in tqdm(file_list):
-        convert_xlsx_to_csv(category, file)
+if __name__ == "__main__":
+    main()
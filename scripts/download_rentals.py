@@ -1,30 +1,40 @@
+"""Download the NSW rental bond xlsx files.
+
+The files are downloaded concurrently on one shared HTTP client (so the
+connections are reused), streamed to a ``.part`` file which is renamed once
+complete. The ETag / Last-Modified of a ``.part`` file are saved next to it
+(``.part.json``) as soon as the response starts, so an interrupted download is
+resumed with a Range request, even on the first run. The files already
+downloaded are only transferred again when the server says they changed.
+
+    python scripts/download_rentals.py
+    # against the local stand-in, see scripts/serve_fixtures.py
+    python scripts/download_rentals.py --base-url http://localhost:8000/ --output-dir /tmp/xlsx
+"""
+
 # The base imports
+import argparse
+import asyncio
+import json
 import os
-from functools import partial
-from glob import glob
-from tqdm import tqdm
+from urllib.parse import urljoin
 
 # http client
 import httpx
 
 # for HTML parsing
 import bs4
-from urllib.parse import urljoin
-
-# for dataframes
-import pandas as pd
-import multiprocessing
+from tqdm import tqdm
 
 base_url = "https://www.nsw.gov.au/housing-and-construction/rental-forms-surveys-and-data/rental-bond-data"
 
 xlsx_base_dir = "data/input/xlsx"
-csv_base_dir = "data/output/csv"
 
-hrefs = {
-    "refunds": [],
-    "lodgements": [],
-    "held": [],
-}
+# the validators of the downloaded files, per URL
+state_filename = "downloads.json"
+
+chunk_size = 64 * 1024
+
 
 def is_refund_xlsx(href) -> bool:
     # url looks like /sites/default/files/noindex/2023-11/RentalBond_Refunds_2nd_Quarter_2023.xlsx
@@ -40,6 +50,7 @@ def is_refund_xlsx(href) -> bool:
         return False
     return True
 
+
 def is_lodgement_xlsx(href) -> bool:
     # url looks like /sites/default/files/noindex/2024-06/rental-bond_lodgements_may_2024.xlsx
     lower_href = href.lower()
@@ -54,6 +65,7 @@ def is_lodgement_xlsx(href) -> bool:
         return False
     return True
 
+
 def is_rental_bond_holding_xlsx(href) -> bool:
     # url is like: /sites/default/files/noindex/2024-05/RentalBond_Bondsheld_As_At_Jan_2024.xlsx
     lower_href = href.lower()
@@ -68,156 +80,196 @@ def is_rental_bond_holding_xlsx(href) -> bool:
         return False
     return True
 
+
 checker = {
     "refunds": is_refund_xlsx,
     "lodgements": is_lodgement_xlsx,
     "held": is_rental_bond_holding_xlsx,
 }
 
-# create the directories' path
-for category in hrefs:
-    os.makedirs(os.path.join(xlsx_base_dir, category), exist_ok=True)
-    os.makedirs(os.path.join(csv_base_dir, category), exist_ok=True)
-
-print("🕵️ Downloading the webpage")
-# Grab the webpage
-response = httpx.get(base_url)
-# Pass the response to BeautifulSoup
-soup = bs4.BeautifulSoup(response.text, "html.parser")
-
-# get all the a link
-links = [link.get("href") for link in soup.find_all("a")]
-# make then absolute
-links = [urljoin(base_url, link) for link in links if link]
-
-print(f"Found {len(links)} links")
-
-# categorize the links
-for category, check_func in checker.items():
-    hrefs[category] = [link for link in links if check_func(link)]
-
-    print(f"Found {len(hrefs[category])} files to download for {category}")
-
-
-def download_file(category, href):
-    # get the filename from the href
-    filename = href.split("/")[-1]
-
-    destination = os.path.join(xlsx_base_dir, category, filename)
-
-    # skip the files already downloaded
-    if os.path.exists(destination):
-        return
-
-    # download the file
-    response = httpx.get(href)
-    # save the file
-    with open(destination, "wb") as f:
-        f.write(response.content)
-
-
-for category, urls in hrefs.items():
-    print(f"Downloading {category} files")
-
-    category_downloader = partial(download_file, category)
-    with multiprocessing.Pool(4) as http_pool:
-        list(tqdm(http_pool.imap(category_downloader, urls), total=len(urls)))
-
-
-def convert_xlsx_to_csv(category, filename):
-    # get the filename without the extension
-    base_name = filename.split("/")[-1].split(".")[0]
-
-    destination = os.path.join(csv_base_dir, category, f"{base_name}.csv")
-
-    # skip the files already converted
-    if os.path.exists(destination):
-        return
-
-    # read the file, remove the first 2 rows they are the header from NSW
-    df = pd.read_excel(filename, skiprows=2)
-    # save the file
-    df.to_csv(destination, index=False)
-
-
-for category in hrefs:
-    # convert the files to CSV
-    print(f"🧠 Converting {category} files to CSV")
-
-    file_list = glob(f"data/xlsx/{category}/*.xlsx")
-
-    convert_category = partial(convert_xlsx_to_csv, category)
-    # use all the processors for the conversion
-    with multiprocessing.Pool() as pool:
-        list(tqdm(pool.imap(convert_category, file_list), total=len(file_list)))
-
-for category in hrefs:
-    print(f"Checking {category} CSV headers")
-
-    header_ok = True
-
-    # check CSV header are all matching
-    ref_columns = None
-    for filename in tqdm(glob(f"data/csv/{category}/*.csv")):
-        df = pd.read_csv(filename, nrows=1)
-        if ref_columns is None:
-            ref_columns = df.columns
-            continue
-        # Check if the columns match
-        if not ref_columns.equals(df.columns):
-            print(f"Columns are not matching for {filename}")
-            print(ref_columns, df.columns)
-            header_ok = False
-
-    if not header_ok:
-        print("❌ CSV headers are not matching")
-    else:
-        print("✅ All CSV headers are matching")
 
+def categorize_links(page_url: str, html: str) -> dict[str, list[str]]:
+    # Pass the response to BeautifulSoup
+    soup = bs4.BeautifulSoup(html, "html.parser")
+
+    # get all the a link
+    links = [link.get("href") for link in soup.find_all("a")]
+    # make then absolute
+    links = [urljoin(page_url, link) for link in links if link]
+
+    print(f"Found {len(links)} links")
+
+    # categorize the links
+    hrefs = {}
+    for category, check_func in checker.items():
+        hrefs[category] = [link for link in links if check_func(link)]
+        print(f"Found {len(hrefs[category])} files to download for {category}")
+    return hrefs
+
+
+def load_state(output_dir: str) -> dict:
+    path = os.path.join(output_dir, state_filename)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(output_dir: str, state: dict):
+    path = os.path.join(output_dir, state_filename)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def response_validators(response: httpx.Response) -> dict:
+    validators = {}
+    if "etag" in response.headers:
+        validators["etag"] = response.headers["etag"]
+    if "last-modified" in response.headers:
+        validators["last_modified"] = response.headers["last-modified"]
+    return validators
+
+
+def load_partial_validators(partial: str) -> dict:
+    """The validators of the response a ``.part`` file was downloaded from"""
+    if not os.path.exists(partial) or not os.path.exists(f"{partial}.json"):
+        return {}
+    with open(f"{partial}.json") as f:
+        return json.load(f)
+
+
+def save_partial_validators(partial: str, validators: dict):
+    with open(f"{partial}.json", "w") as f:
+        json.dump(validators, f)
+
+
+def remove_partial(partial: str):
+    for path in (partial, f"{partial}.json"):
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+async def download_file(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    destination: str,
+    href: str,
+    validators: dict,
+) -> str:
+    """Download ``href`` to ``destination``
+
+    :param validators: the ETag/Last-Modified of the copy on disk, updated
+        with the ones of the downloaded file once it is complete
+    :return: "downloaded", "resumed", "unchanged" or "skipped"
+    """
+    partial = f"{destination}.part"
+    partial_validators = load_partial_validators(partial)
+    headers = {}
+
+    if partial_validators:
+        # resume, the server ignores the range if the file changed meanwhile
+        headers["Range"] = f"bytes={os.path.getsize(partial)}-"
+        headers["If-Range"] = partial_validators.get(
+            "etag", partial_validators.get("last_modified")
+        )
+    elif os.path.exists(destination):
+        if not validators:
+            # downloaded before the validators were recorded
+            return "skipped"
+        # only transfer the file if it changed on the server
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    async with semaphore:
+        async with client.stream("GET", href, headers=headers) as response:
+            if response.status_code == 304:
+                return "unchanged"
+            if response.status_code == 416:
+                # the partial file is unusable, start from scratch next time
+                remove_partial(partial)
+            response.raise_for_status()
+
+            resumed = response.status_code == 206
+            if not resumed:
+                partial_validators = response_validators(response)
+                # before the body, an interrupted download can be resumed
+                if partial_validators:
+                    save_partial_validators(partial, partial_validators)
+                elif os.path.exists(f"{partial}.json"):
+                    os.unlink(f"{partial}.json")
+
+            with open(partial, "ab" if resumed else "wb") as f:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    f.write(chunk)
+
+    os.replace(partial, destination)
+    if partial_validators:
+        os.unlink(f"{partial}.json")
+    validators.clear()
+    validators.update(partial_validators)
+    return "resumed" if resumed else "downloaded"
+
+
+async def download_all(page_url: str, output_dir: str, concurrency: int):
+    state = load_state(output_dir)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    timeout = httpx.Timeout(30.0, read=120.0)
+    async with httpx.AsyncClient(
+        limits=limits, timeout=timeout, follow_redirects=True
+    ) as client:
+        print("🕵️ Downloading the webpage")
+        # Grab the webpage
+        response = await client.get(page_url)
+        response.raise_for_status()
+        hrefs = categorize_links(page_url, response.text)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = []
+        for category, urls in hrefs.items():
+            # create the directories' path
+            os.makedirs(os.path.join(output_dir, category), exist_ok=True)
+            for href in urls:
+                # get the filename from the href
+                filename = href.split("/")[-1]
+                destination = os.path.join(output_dir, category, filename)
+                validators = state.setdefault(href, {})
+                tasks.append(
+                    download_file(client, semaphore, destination, href, validators)
+                )
+
+        print(f"Downloading {len(tasks)} files")
+        results = {}
+        errors = 0
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            try:
+                result = await task
+            except httpx.HTTPError as e:
+                print(f"❌ {e}")
+                errors += 1
+                continue
+            results[result] = results.get(result, 0) + 1
+
+    save_state(output_dir, {href: v for href, v in state.items() if v})
+    print(", ".join(f"{count} {result}" for result, count in results.items()))
+    if errors:
+        raise SystemExit(f"{errors} files failed to download")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the rental bond files")
+    parser.add_argument("--base-url", default=base_url, help="page listing the files")
+    parser.add_argument("--output-dir", default=xlsx_base_dir)
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="simultaneous downloads"
+    )
+    args = parser.parse_args()
 
-print("Merge all the CSV files into one")
+    asyncio.run(download_all(args.base_url, args.output_dir, args.concurrency))
 
-dfs = []
-# process the CSV files
-for filename in tqdm(glob("data/csv/lodgements/*.csv")):
-    # get the filename without the extension
-    filename = filename.split("/")[-1].split(".")[0]
-    # If the filename is not month by month, skip it
-    # these files contain the work "-year-"
-    # if "-year-" in filename.lower():
-    #     continue
 
-    # read the file, treat postcodes as string and parse the dates
-    df = pd.read_csv(
-        f"data/csv/lodgements/{filename}.csv",
-        parse_dates=["Lodgement Date"],
-        dtype={
-            "Postcode": str,
-        },
-    )
-    dfs.append(df)
-
-print("Processed all the CSV files, concatenating them")
-
-# concatenate the dataframes
-df = pd.concat(dfs)
-# unique the rows
-df = df.drop_duplicates()
-# convert rent to numeric, dropping the rows that are not numeric
-df["Weekly Rent"] = pd.to_numeric(df["Weekly Rent"], errors="coerce")
-df["Bedrooms"] = pd.to_numeric(df["Bedrooms"], errors="coerce")
-df = df.dropna(subset=["Weekly Rent", "Bedrooms"])
-# convert the columns to int
-df["Weekly Rent"] = df["Weekly Rent"].astype(int)
-df["Bedrooms"] = df["Bedrooms"].astype(int)
-
-# Save the raw data
-print(df.info())
-
-print("Saving the data")
-print("Converting to CSV")
-# save to csv
-df.to_csv("data/rentals.csv", index=False)
-print("Done. Converting to parquet")
-df.to_parquet("data/rentals.parquet", index=False)
-print("Done 🥳 🎉")
+if __name__ == "__main__":
+    main()
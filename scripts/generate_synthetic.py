@@ -0,0 +1,379 @@
+"""Generate synthetic NSW rental bond files, to test the pipeline at scale.
+
+The rows are resampled from the xlsx files shipped in data/input/xlsx, so
+the postcodes, dwelling types, bedrooms, rents and their correlations follow
+the real ones, and then spread over the months between --start and --end:
+
+- the dates follow the weekdays of the real lodgements/payments
+- the amounts are scaled back in time by RENT_GROWTH a year from the date of
+  the real files, with some noise
+- the number of rows grows by VOLUME_GROWTH a year
+
+Every file gets its own random generator seeded from --seed and its period,
+the output is the same for the same arguments whatever the number of
+processes. The files follow the NSW layout, by default in data/synthetic, away
+from the inputs of the pipeline, with the same layout as data/:
+
+- xlsx: the NSW title rows and columns, in data/synthetic/input/xlsx for
+  convert_xlsx_to_csv.py (at most about a million rows per file)
+- csv: the same columns with a header row, "U" for the unknown values
+- parquet: the typed files convert_xlsx_to_csv.py writes, in
+  data/synthetic/output/parquet/raw for the cleanup scripts
+
+    python scripts/generate_synthetic.py --rows 50000000 --start 1995-01 --format parquet
+    # the pipeline on them, see benchmarks/suite.py
+    python benchmarks/suite.py --stages --raw data/synthetic/output/parquet/raw
+"""
+
+import argparse
+import calendar
+import datetime
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+from tqdm import tqdm
+
+from schema import apply_schema, schemas
+
+# yearly change of the amounts and of the number of bonds, applied backwards
+# from the date of the real files
+RENT_GROWTH = 0.04
+VOLUME_GROWTH = 0.015
+# standard deviation of the log of the amounts noise
+AMOUNT_NOISE = 0.05
+
+SYNTHETIC_PREFIX = "synthetic-"
+# data rows of a sheet, below the 3 NSW header rows
+XLSX_MAX_ROWS = 1_048_576 - 3
+
+SYNTHETIC_DIR = "data/synthetic"
+DEFAULT_OUTPUT_DIRS = {
+    "xlsx": f"{SYNTHETIC_DIR}/input/xlsx",
+    "csv": f"{SYNTHETIC_DIR}/csv",
+    "parquet": f"{SYNTHETIC_DIR}/output/parquet/raw",
+}
+
+# NSW columns stored as text in the xlsx files, "U" when unknown
+TEXT_COLUMNS = {"Bedrooms", "Weekly Rent"}
+
+QUARTERS = ["1st", "2nd", "3rd", "4th"]
+
+
+@dataclass
+class Profile:
+    """The real rows the synthetic ones are drawn from"""
+
+    lodgements: pl.DataFrame
+    refunds: pl.DataFrame
+    held: pl.DataFrame
+    # weight of each weekday (Monday is 0) of the lodgement/payment dates
+    lodgement_weekdays: np.ndarray
+    refund_weekdays: np.ndarray
+    lodgements_per_month: float
+    # refunds per lodgement, per month
+    refund_ratio: float
+    # middle of the real files, the amounts and volumes are relative to it
+    reference: datetime.date
+
+
+@dataclass(frozen=True)
+class Task:
+    category: str
+    # first month of the period of the file
+    year: int
+    month: int
+    rows: int
+    # monthly lodgements relative to the real files, for the bonds held
+    scale: float
+
+
+def read_fixtures(directory: str, category: str) -> pl.DataFrame:
+    files = [
+        x
+        for x in sorted(glob.glob(os.path.join(directory, category, "*.xlsx")))
+        if not os.path.basename(x).startswith(SYNTHETIC_PREFIX)
+    ]
+    if not files:
+        raise SystemExit(f"No {category} xlsx file in {directory} to learn from")
+    return pl.concat(
+        apply_schema(
+            pl.read_excel(x, engine="calamine", read_options={"header_row": 2}),
+            schemas[category],
+        )
+        for x in files
+    )
+
+
+def weekday_weights(dates: pl.Series) -> np.ndarray:
+    counts = dates.dt.weekday().value_counts()
+    weights = np.zeros(7)
+    for weekday, count in counts.iter_rows():
+        weights[weekday - 1] = count
+    return weights / weights.sum()
+
+
+def months_count(dates: pl.Series) -> int:
+    return dates.dt.truncate("1mo").n_unique()
+
+
+def load_profile(directory: str) -> Profile:
+    lodgements = read_fixtures(directory, "lodgements").drop_nulls("Lodgement Date")
+    refunds = read_fixtures(directory, "refunds").drop_nulls("Payment Date")
+    # one snapshot per file, averaged per postcode
+    held = (
+        read_fixtures(directory, "held")
+        .drop_nulls()
+        .group_by("Postcode")
+        .agg(pl.col("Bonds Held").mean())
+        .sort("Postcode")
+    )
+    dates = lodgements["Lodgement Date"]
+    lodgements_per_month = lodgements.height / months_count(dates)
+    return Profile(
+        lodgements=lodgements,
+        refunds=refunds,
+        held=held,
+        lodgement_weekdays=weekday_weights(dates),
+        refund_weekdays=weekday_weights(refunds["Payment Date"]),
+        lodgements_per_month=lodgements_per_month,
+        refund_ratio=refunds.height
+        / months_count(refunds["Payment Date"])
+        / lodgements_per_month,
+        reference=dates.min() + (dates.max() - dates.min()) / 2,
+    )
+
+
+def month_range(start: str, end: str) -> list[tuple[int, int]]:
+    first = datetime.date.fromisoformat(f"{start}-01")
+    last = datetime.date.fromisoformat(f"{end}-01")
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def years_from(reference: datetime.date, year: int, month: int) -> float:
+    return (datetime.date(year, month, 15) - reference).days / 365.25
+
+
+def split_rows(total: int, weights: np.ndarray) -> np.ndarray:
+    """Integer rows per period, adding up to ``total``"""
+    bounds = np.round(np.cumsum(weights) / weights.sum() * total).astype(np.int64)
+    return np.diff(bounds, prepend=0)
+
+
+def plan(profile: Profile, args: argparse.Namespace) -> list[Task]:
+    months = month_range(args.start, args.end)
+    volume = np.array(
+        [
+            (1 + VOLUME_GROWTH) ** years_from(profile.reference, year, month)
+            for year, month in months
+        ]
+    )
+    lodgements = split_rows(args.rows, volume)
+    # monthly lodgements at the date of the real files, relative to them
+    scale = args.rows / volume.sum() / profile.lodgements_per_month
+
+    tasks = []
+    for (year, month), rows in zip(months, lodgements):
+        if "lodgements" in args.categories:
+            tasks.append(Task("lodgements", year, month, int(rows), scale))
+    # the refunds are published per quarter, the bonds held every December
+    quarters = {}
+    for (year, month), rows in zip(months, lodgements):
+        key = (year, (month - 1) // 3 * 3 + 1)
+        quarters[key] = quarters.get(key, 0) + rows
+    if "refunds" in args.categories:
+        for (year, month), rows in quarters.items():
+            tasks.append(
+                Task("refunds", year, month, round(rows * profile.refund_ratio), scale)
+            )
+    if "held" in args.categories:
+        for year, month in months:
+            if month == 12:
+                tasks.append(Task("held", year, month, 0, scale))
+    return tasks
+
+
+def period_days(year: int, month: int, months: int) -> np.ndarray:
+    first = datetime.date(year, month, 1)
+    last_month = month + months - 1
+    last = datetime.date(year, last_month, calendar.monthrange(year, last_month)[1])
+    return np.arange(
+        np.datetime64(first), np.datetime64(last) + 1, dtype="datetime64[D]"
+    )
+
+
+def draw_dates(
+    rng: np.random.Generator, weekdays: np.ndarray, days: np.ndarray, rows: int
+) -> pl.Series:
+    # numpy weekdays: 1970-01-01 was a Thursday
+    weights = weekdays[(days.astype(np.int64) + 3) % 7]
+    return pl.Series(rng.choice(days, rows, p=weights / weights.sum()))
+
+
+def scale_amounts(
+    df: pl.DataFrame, columns: list[str], factor: np.ndarray
+) -> pl.DataFrame:
+    """Multiply the amounts by ``factor``, rounded to $5 like most rents"""
+    return df.with_columns(
+        ((pl.col(column) * pl.Series(factor) / 5).round() * 5).cast(pl.UInt32)
+        for column in columns
+    )
+
+
+def generate(profile: Profile, task: Task, seed: int) -> pl.DataFrame:
+    rng = np.random.default_rng(
+        [seed, list(schemas).index(task.category), task.year, task.month]
+    )
+    growth = (1 + RENT_GROWTH) ** years_from(profile.reference, task.year, task.month)
+
+    if task.category == "held":
+        stock = (1 + VOLUME_GROWTH) ** years_from(profile.reference, task.year, 12)
+        counts = profile.held["Bonds Held"].to_numpy() * task.scale * stock
+        return profile.held.with_columns(
+            pl.Series("Bonds Held", rng.poisson(counts), dtype=pl.UInt32)
+        )
+
+    if task.category == "lodgements":
+        base, date_column, amounts = (
+            profile.lodgements,
+            "Lodgement Date",
+            ["Weekly Rent"],
+        )
+        days, weekdays = (
+            period_days(task.year, task.month, 1),
+            profile.lodgement_weekdays,
+        )
+    else:
+        base, date_column = profile.refunds, "Payment Date"
+        amounts = ["Payment To Agent", "Payment To Tenant"]
+        days, weekdays = period_days(task.year, task.month, 3), profile.refund_weekdays
+
+    # whole rows, so the postcode/dwelling/bedrooms/amounts stay consistent
+    df = base[rng.integers(0, base.height, task.rows)]
+    df = df.with_columns(
+        draw_dates(rng, weekdays, days, task.rows).alias(date_column)
+    ).sort(date_column)
+    factor = growth * np.exp(rng.normal(0, AMOUNT_NOISE, task.rows))
+    return scale_amounts(df, amounts, factor)
+
+
+def file_name(task: Task) -> str:
+    if task.category == "lodgements":
+        month = calendar.month_name[task.month].lower()
+        return f"{SYNTHETIC_PREFIX}rental-bond-lodgements-{month}-{task.year}"
+    if task.category == "refunds":
+        quarter = QUARTERS[(task.month - 1) // 3]
+        return f"{SYNTHETIC_PREFIX}rental-bond-refunds-{quarter}-quarter-{task.year}"
+    return f"{SYNTHETIC_PREFIX}RentalBond_Bonds_Held_As_At_December_{task.year}"
+
+
+def title(task: Task) -> str:
+    """First cell of the NSW files"""
+    if task.category == "lodgements":
+        period = f"{calendar.month_name[task.month]}  {task.year}"
+        return f"NSW Fair Trading\n\nResidential Rental Bond Lodgements\n\n{period}"
+    if task.category == "refunds":
+        first = calendar.month_name[task.month]
+        last = calendar.month_name[task.month + 2]
+        period = f"{first} -- {last}  {task.year}"
+        return f"NSW Fair Trading\n\nResidential Rental Bond Refunds\n\n{period}"
+    return (
+        f"\nNSW Fair Trading\n\nResidential Bonds Held as at December {task.year}\n\n"
+    )
+
+
+def write_xlsx(df: pl.DataFrame, task: Task, path: str):
+    # openpyxl is only needed for this format
+    import openpyxl
+
+    if df.height > XLSX_MAX_ROWS:
+        raise ValueError(
+            f"{df.height} rows don't fit in a sheet, use --format csv or parquet"
+        )
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(os.path.basename(path)[:31])
+    sheet.append([title(task)])
+    sheet.append([])
+    sheet.append(df.columns)
+    converters = []
+    for column in df.columns:
+        if column in TEXT_COLUMNS:
+            converters.append(lambda x: "U" if x is None else str(x))
+        elif column == "Postcode":
+            converters.append(lambda x: None if x is None else int(x))
+        else:
+            converters.append(lambda x: x)
+    for row in df.iter_rows():
+        sheet.append([convert(x) for convert, x in zip(converters, row)])
+    workbook.save(path)
+
+
+def write(df: pl.DataFrame, task: Task, file_format: str, output_dir: str) -> str:
+    directory = os.path.join(output_dir, task.category)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{file_name(task)}.{file_format}")
+    # write then rename, an interrupted run never leaves a partial file
+    tmp_path = f"{path}.tmp"
+    if file_format == "parquet":
+        df.write_parquet(tmp_path)
+    elif file_format == "csv":
+        df.write_csv(tmp_path, null_value="U")
+    else:
+        write_xlsx(df, task, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_task(profile: Profile, task: Task, args: argparse.Namespace) -> int:
+    df = generate(profile, task, args.seed)
+    write(df, task, args.format, args.output_dir)
+    return df.height
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic bond files")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="lodgements")
+    parser.add_argument("--start", default="2000-01", help="first month, YYYY-MM")
+    parser.add_argument("--end", default="2023-12", help="last month, YYYY-MM")
+    parser.add_argument(
+        "--format", choices=list(DEFAULT_OUTPUT_DIRS), default="parquet"
+    )
+    parser.add_argument(
+        "--output-dir", help=f"default: where the next stage reads, in {SYNTHETIC_DIR}"
+    )
+    parser.add_argument("--fixtures", default="data/input/xlsx")
+    parser.add_argument(
+        "--categories", nargs="+", choices=list(schemas), default=list(schemas)
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.output_dir = args.output_dir or DEFAULT_OUTPUT_DIRS[args.format]
+
+    profile = load_profile(args.fixtures)
+    tasks = plan(profile, args)
+    print(f"🎲 Generating {len(tasks)} {args.format} files in {args.output_dir}")
+
+    # the parallelism comes from the processes, one polars thread each
+    os.environ.setdefault("POLARS_MAX_THREADS", "1")
+    # polars is not fork safe
+    context = multiprocessing.get_context("spawn")
+    rows = {category: 0 for category in args.categories}
+    with ProcessPoolExecutor(mp_context=context) as pool:
+        futures = {pool.submit(run_task, profile, task, args): task for task in tasks}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            rows[futures[future].category] += future.result()
+    for category, count in rows.items():
+        print(f"{category}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""Incremental ingestion of the monthly source files.
+
+A manifest records every source file already ingested (path, size, mtime,
+sha256, row counts). On each run only the new or changed files are parsed,
+their rows are deduplicated against a hash index of the rows already
+ingested and appended to the outputs.
+Each file is read through a lazy Polars plan, deduplicated and collected by
+the streaming engine (its chunks sized by --memory-budget), then checked
+against the months of the index its rows fall in: a file holds about a month
+of rows, the memory used doesn't grow with the history. The outputs:
+
+- data/output/parquet/<category>/year=<year>/month=<month>/<source>.parquet:
+  the rows added by each source, partitioned by their date (Hive layout),
+  sorted by postcode and zstd compressed
+- data/output/parquet/<category>_row_hashes/<year>-<month>.parquet: the hash
+  index of the rows of each month, the source they were read from (by its id
+  in the manifest) and whether they were added or skipped as duplicates
+- data/output/csv/<category>_combined.csv: all the rows
+- data/output/csv/<category>_new.csv: the rows added by the last run
+
+The rows of a changed or deleted source are replaced by its new content. The
+other sources which had rows skipped as duplicates of the rows it added are
+ingested again, so these rows come back.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+
+import polars as pl
+import polars.selectors as cs
+from tqdm import tqdm
+
+from schema import apply_schema
+
+MANIFEST_PATH = "data/output/manifest.json"
+CSV_DIR = "data/output/csv"
+PARQUET_DIR = "data/output/parquet"
+
+# fixed seed, the row hashes are persisted between runs
+HASH_SEED = 0
+# bumped when the way the rows are hashed or the layout of the index changes,
+# the index is then rebuilt
+ROW_HASH_VERSION = 5
+
+# rough size of a row while it goes through the streaming engine
+ROW_BYTES_ESTIMATE = 256
+
+# bumped when the layout of the Parquet parts changes, they are then rebuilt
+PARTS_LAYOUT_VERSION = 3
+# rows per row group of the parts, the row group size of DuckDB. A part holds
+# a month of rows (about 20k), so one row group: build_database.py reads every
+# row of the parts, it loads them faster than in 8192 row groups
+ROW_GROUP_SIZE = 122880
+# partition of the rows without a date
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def parse_args(category: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Clean up the {category} files")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the manifest and rebuild the outputs from scratch",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="size the streaming chunks to stay around this amount of memory",
+    )
+    return parser.parse_args()
+
+
+def set_memory_budget(megabytes: int):
+    """Size the streaming chunks so every thread fits in the budget"""
+    threads = pl.thread_pool_size()
+    chunk_size = megabytes * 1024 * 1024 // (threads * ROW_BYTES_ESTIMATE)
+    pl.Config.set_streaming_chunk_size(max(chunk_size, 1000))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(path: str, previous: dict | None = None) -> dict:
+    """Return the size, mtime and sha256 of a file.
+
+    The file is only hashed again when its size or mtime changed since the
+    ``previous`` fingerprint.
+    """
+    stat = os.stat(path)
+    if (
+        previous is not None
+        and previous["size"] == stat.st_size
+        and previous["mtime"] == stat.st_mtime
+    ):
+        return previous
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_sha256(path)}
+
+
+def schema_digest(schema: dict) -> str:
+    """Identify the column types, the outputs are rebuilt when they change"""
+    columns = json.dumps({column: str(dtype) for column, dtype in schema.items()})
+    return hashlib.sha256(columns.encode()).hexdigest()
+
+
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    # write then rename, a crash never leaves a half written manifest
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def part_paths(category: str, source: str) -> list[str]:
+    """The Parquet parts of a source, one per month of its rows"""
+    base_name = pathlib.Path(source).stem
+    parts = pathlib.Path(PARQUET_DIR, category).glob(f"*/*/{base_name}.parquet")
+    return sorted(map(str, parts))
+
+
+def write_partitions(category: str, source: str, rows: pl.DataFrame, date_column: str):
+    """Split the rows added by a source into one part per month"""
+    staged = rows.lazy()
+    date = pl.col(date_column)
+    months = staged.select(year=date.dt.year(), month=date.dt.month()).unique()
+    for year, month in months.collect().iter_rows():
+        if year is None:
+            directory = f"year={HIVE_NULL_PARTITION}/month={HIVE_NULL_PARTITION}"
+            rows = staged.filter(date.is_null())
+        else:
+            directory = f"year={year}/month={month:02d}"
+            rows = staged.filter(date.dt.year() == year, date.dt.month() == month)
+        path = pathlib.Path(PARQUET_DIR, category, directory)
+        path.mkdir(parents=True, exist_ok=True)
+        # at most a month of rows, in memory. The enums are written as strings, the statistics of
+        # their dictionary cover every category instead of the values present
+        rows.sort("Postcode").with_columns(
+            cs.by_dtype(pl.Categorical, pl.Enum).cast(pl.String)
+        ).collect().write_parquet(
+            path / f"{pathlib.Path(source).stem}.parquet",
+            compression="zstd",
+            statistics=True,
+            row_group_size=ROW_GROUP_SIZE,
+        )
+
+
+def row_hash() -> pl.Expr:
+    return pl.struct(pl.all()).hash(HASH_SEED).alias("row_hash")
+
+
+def row_index_dir(category: str) -> str:
+    return os.path.join(PARQUET_DIR, f"{category}_row_hashes")
+
+
+def row_index_path(category: str, year: int | None, month: int | None) -> str:
+    """The part of the hash index holding the rows of a month"""
+    name = HIVE_NULL_PARTITION if year is None else f"{year}-{month:02d}"
+    return os.path.join(row_index_dir(category), f"{name}.parquet")
+
+
+def row_index_paths(category: str) -> list[str]:
+    parts = pathlib.Path(row_index_dir(category)).glob("*.parquet*")
+    return sorted({str(part).removesuffix(".new") for part in parts})
+
+
+def row_index_is_current(category: str, entry: dict) -> bool:
+    """Whether the hash index can be used with this version of polars.
+
+    The hashes depend on the polars version. The index can't be rebuilt from
+    the parts, they don't have the rows skipped as duplicates.
+    """
+    return (
+        entry.get("polars_version") == pl.__version__
+        and entry.get("row_hash_version") == ROW_HASH_VERSION
+        and os.path.isdir(row_index_dir(category))
+    )
+
+
+def empty_row_index() -> pl.DataFrame:
+    return pl.DataFrame(
+        schema={"row_hash": pl.UInt64, "source_id": pl.UInt32, "added": pl.Boolean}
+    )
+
+
+def load_row_index(path: str) -> pl.DataFrame:
+    # the version written by this run, if any
+    for candidate in (f"{path}.new", path):
+        if os.path.exists(candidate):
+            return pl.read_parquet(candidate)
+    return empty_row_index()
+
+
+def save_row_index(path: str, index: pl.DataFrame):
+    """Written next to the current part, see commit_row_index"""
+    index.write_parquet(f"{path}.new")
+
+
+def commit_row_index(category: str):
+    """Replace the parts of the index by the ones written by this run, once the
+    outputs are written. A failed run leaves the index of the last run"""
+    for staged in pathlib.Path(row_index_dir(category)).glob("*.parquet.new"):
+        os.replace(staged, staged.with_suffix(""))
+
+
+def readmitted_sources(category: str, removed_ids: list[int]) -> list[int]:
+    """The sources with rows skipped as duplicates of rows of the removed sources
+
+    These rows are lost with the parts of the removed sources, the sources are
+    ingested again to add them back. The duplicates of a row have its date,
+    they are in the same month of the index.
+    """
+    readmitted = set()
+    removed = pl.col("source_id").is_in(removed_ids)
+    for path in row_index_paths(category):
+        index = load_row_index(path)
+        lost = index.filter(removed & pl.col("added")).select("row_hash")
+        others = index.filter(~removed).join(lost, on="row_hash", how="semi")
+        readmitted.update(others["source_id"].unique().to_list())
+    return sorted(readmitted)
+
+
+def drop_sources(category: str, dropped_ids: list[int]):
+    """Remove the rows of the dropped sources from the index"""
+    for path in row_index_paths(category):
+        index = load_row_index(path)
+        kept = index.filter(~pl.col("source_id").is_in(dropped_ids))
+        if kept.height < index.height:
+            save_row_index(path, kept)
+
+
+def deduplicate(
+    category: str, rows: pl.DataFrame, date_column: str, source_id: int
+) -> pl.DataFrame:
+    """Flag the ``rows`` of a source not ingested before as ``added``.
+
+    Every row is recorded in the index, the duplicates too: they are added
+    back when the source of their first copy changes. Only the months of the
+    index the rows fall in are loaded.
+    """
+    date = pl.col(date_column)
+    months = rows.select(year=date.dt.year(), month=date.dt.month()).unique()
+    flagged = [rows.clear().with_columns(added=pl.lit(True))]
+    for year, month in months.iter_rows():
+        if year is None:
+            in_month = date.is_null()
+        else:
+            in_month = (date.dt.year() == year) & (date.dt.month() == month)
+        path = row_index_path(category, year, month)
+        index = load_row_index(path)
+        known_hashes = index.filter(pl.col("added"))["row_hash"]
+        month_rows = rows.filter(in_month).with_columns(
+            added=~pl.col("row_hash").is_in(known_hashes)
+        )
+        hashes = month_rows.select(
+            "row_hash", pl.lit(source_id, pl.UInt32).alias("source_id"), "added"
+        )
+        save_row_index(path, pl.concat([index, hashes]))
+        flagged.append(month_rows)
+    return pl.concat(flagged)
+
+
+def assign_source_ids(files: dict):
+    """Number the sources without an id, the index refers to them by id"""
+    next_id = max((x["id"] for x in files.values() if "id" in x), default=-1) + 1
+    for x in files.values():
+        if "id" not in x:
+            x["id"] = next_id
+            next_id += 1
+
+
+def scan_source(source: str, schema: dict) -> pl.LazyFrame:
+    """Lazily read a source Parquet/CSV file and cast its columns to ``schema``
+
+    The CSV files are read as text first, the values which can't be cast (like
+    the "U" of unknown bedrooms/rents) become nulls.
+    """
+    if source.endswith(".parquet"):
+        return apply_schema(pl.scan_parquet(source), schema)
+    return apply_schema(pl.scan_csv(source, infer_schema=False), schema)
+
+
+def append_csv(source: str, destination: str):
+    """Append a CSV file to another one, without its header"""
+    with open(source, "rb") as src, open(destination, "ab") as dst:
+        src.readline()
+        shutil.copyfileobj(src, dst)
+
+
+def ingest(
+    category: str,
+    pattern: str,
+    schema: dict,
+    numeric_columns: list[str],
+    date_column: str,
+    full: bool = False,
+    memory_budget: int | None = None,
+):
+    """Append the new or changed files matching ``pattern`` to the outputs
+
+    :param category: name of the dataset, e.g. lodgements
+    :param pattern: glob of the source files
+    :param schema: the columns to keep and their type
+    :param numeric_columns: rows with a null in any of these are dropped
+    :param date_column: the outputs are partitioned by the year and month of it
+    :param full: forget what was already ingested and start from scratch
+    :param memory_budget: approximate memory budget in MB of the streaming engine
+    """
+    if memory_budget is not None:
+        set_memory_budget(memory_budget)
+
+    pathlib.Path(CSV_DIR).mkdir(parents=True, exist_ok=True)
+    pathlib.Path(PARQUET_DIR, category).mkdir(parents=True, exist_ok=True)
+
+    manifest = load_manifest()
+    # without a manifest entry the existing outputs can't be trusted, neither
+    # can they when they were written with other column types or hashes
+    full = (
+        full
+        or category not in manifest
+        or manifest[category].get("schema") != schema_digest(schema)
+        or manifest[category].get("parts_layout_version") != PARTS_LAYOUT_VERSION
+        or not row_index_is_current(category, manifest[category])
+    )
+    entry = {} if full else manifest[category]
+    if full:
+        for part in pathlib.Path(PARQUET_DIR, category).rglob("*.parquet*"):
+            part.unlink()
+        shutil.rmtree(row_index_dir(category), ignore_errors=True)
+        # the single file index of the previous versions
+        pathlib.Path(PARQUET_DIR, f"{category}_row_hashes.parquet").unlink(
+            missing_ok=True
+        )
+    # the index of a failed run
+    for staged in pathlib.Path(row_index_dir(category)).glob("*.parquet.new"):
+        staged.unlink()
+    pathlib.Path(row_index_dir(category)).mkdir(parents=True, exist_ok=True)
+
+    known_files = entry.get("files", {})
+
+    sources = sorted(pathlib.Path().glob(pattern))
+    files = {}
+    pending = []
+    for source in map(str, sources):
+        previous = known_files.get(source)
+        files[source] = fingerprint(source, previous)
+        if previous is None or previous["sha256"] != files[source]["sha256"]:
+            pending.append(source)
+            if previous is not None:
+                files[source] = {**files[source], "id": previous["id"]}
+        else:
+            files[source] = {**previous, **files[source]}
+    assign_source_ids(files)
+
+    # forget the rows of the changed and deleted sources, and ingest again the
+    # sources which have some of them too
+    removed = [x for x in known_files if x not in files or x in pending]
+    removed_ids = [known_files[x]["id"] for x in removed]
+    sources_by_id = {x["id"]: source for source, x in files.items()}
+    readmitted = sorted(
+        sources_by_id[x] for x in readmitted_sources(category, removed_ids)
+    )
+    pending = sorted({*pending, *readmitted})
+    dropped = [x for x in known_files if x not in files or x in pending]
+    for source in dropped:
+        for part in part_paths(category, source):
+            os.unlink(part)
+    if dropped:
+        drop_sources(category, [known_files[x]["id"] for x in dropped])
+
+    print(
+        f"🧾 {category}: {len(pending) - len(readmitted)} new or changed files, "
+        f"{len(readmitted)} ingested again, "
+        f"{len(files) - len(pending)} unchanged, {len(removed)} dropped"
+    )
+
+    added = []
+    for source in tqdm(pending):
+        rows = scan_source(source, schema).select(pl.len()).collect().item()
+
+        # dedup the file, then against the rows already ingested. The file is
+        # collected first: filtering the stream against the index hashes the
+        # index again for every chunk
+        file_rows = (
+            scan_source(source, schema)
+            .drop_nulls(subset=numeric_columns)
+            .unique()
+            .with_columns(row_hash())
+            .collect(streaming=True)
+        )
+        file_rows = deduplicate(category, file_rows, date_column, files[source]["id"])
+        new_rows = file_rows.filter(pl.col("added")).drop("row_hash", "added")
+        write_partitions(category, source, new_rows, date_column)
+        files[source].update({"rows": rows, "rows_added": new_rows.height})
+        added += part_paths(category, source)
+
+    if added:
+        new_rows = pl.scan_parquet(added)
+        print(new_rows.describe())
+        print(new_rows.collect_schema())
+
+    print("Saving the data")
+    combined_csv = os.path.join(CSV_DIR, f"{category}_combined.csv")
+    new_csv = os.path.join(CSV_DIR, f"{category}_new.csv")
+
+    if added:
+        pl.scan_parquet(added).sink_csv(new_csv)
+    elif os.path.exists(new_csv):
+        os.unlink(new_csv)
+
+    if full or dropped or not os.path.exists(combined_csv):
+        # rows can't be removed from the CSV, write it again from the parts
+        print("Rewriting the combined CSV")
+        parts = [part for source in files for part in part_paths(category, source)]
+        if parts:
+            pl.scan_parquet(parts).sink_csv(combined_csv)
+    elif added:
+        append_csv(new_csv, combined_csv)
+
+    commit_row_index(category)
+
+    manifest[category] = {
+        "polars_version": pl.__version__,
+        "row_hash_version": ROW_HASH_VERSION,
+        "schema": schema_digest(schema),
+        "parts_layout_version": PARTS_LAYOUT_VERSION,
+        "files": files,
+    }
+    save_manifest(manifest)
+    print("Done 🥳 🎉")
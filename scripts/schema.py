@@ -0,0 +1,63 @@
+import polars as pl
+
+# compact types: dictionary encoded postcodes/dwelling types, narrow integers.
+# The enums have fixed categories so the physical values are the same in every
+# file (the row hashes of the ingest index depend on them)
+Postcode = pl.Enum([f"{x:04d}" for x in range(10000)])
+DwellingType = pl.Enum(["F", "H", "T", "O", "U"])
+
+# columns of the NSW rental bond files and their type.
+# The "U" (unknown) numeric values become nulls
+lodgements = {
+    "Lodgement Date": pl.Date,
+    "Postcode": Postcode,
+    "Dwelling Type": DwellingType,
+    "Bedrooms": pl.UInt8,
+    "Weekly Rent": pl.UInt32,
+}
+
+refunds = {
+    "Payment Date": pl.Date,
+    "Postcode": Postcode,
+    "Dwelling Type": DwellingType,
+    "Bedrooms": pl.UInt8,
+    "Payment To Agent": pl.UInt32,
+    "Payment To Tenant": pl.UInt32,
+    "Days Bond Held": pl.UInt32,
+}
+
+held = {
+    "Postcode": Postcode,
+    "Bonds Held": pl.UInt32,
+}
+
+schemas = {
+    "lodgements": lodgements,
+    "refunds": refunds,
+    "held": held,
+}
+
+
+def cast_column(column: str, dtype: pl.DataType) -> pl.Expr:
+    expr = pl.col(column)
+    if dtype == Postcode:
+        # the xlsx files store the postcodes as numbers, read as floats when
+        # the column has blank cells: 2000.0 is the postcode 2000
+        expr = (
+            expr.cast(pl.String)
+            .str.strip_chars()
+            .str.replace(r"\.0*$", "")
+            .str.zfill(4)
+        )
+    return expr.cast(dtype, strict=False)
+
+
+def apply_schema(df, schema: dict):
+    """Cast the columns of a (lazy) frame, the values which can't be cast become nulls"""
+    return df.select(cast_column(column, dtype) for column, dtype in schema.items())
+
+
+def unmapped(source: pl.DataFrame, typed: pl.DataFrame, column: str) -> pl.Series:
+    """The values of ``column`` which couldn't be cast, nulls in ``typed``"""
+    lost = source[column].is_not_null() & typed[column].is_null()
+    return source[column].filter(lost)
@@ -0,0 +1,110 @@
+"""Local stand-in for the NSW rental bond data page.
+
+Serves an index page linking to every xlsx file of a directory (by default
+the fixtures in data/input/xlsx) and the files themselves, with ETag,
+Last-Modified, conditional GET and Range support, so the downloader can be
+exercised offline:
+
+    python scripts/serve_fixtures.py --port 8000
+    python scripts/download_rentals.py --base-url http://localhost:8000/ --output-dir /tmp/xlsx
+"""
+
+import argparse
+import email.utils
+import hashlib
+import html
+import os
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FixturesHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/":
+            return self.send_index()
+
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return self.send_error(HTTPStatus.NOT_FOUND)
+
+        stat = os.stat(path)
+        etag = '"{}"'.format(
+            hashlib.md5(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest()
+        )
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+
+        if self.not_modified(etag, stat.st_mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start, end = 0, stat.st_size - 1
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        partial_content = range_header is not None and if_range in (
+            None,
+            etag,
+            last_modified,
+        )
+        if partial_content:
+            start = int(range_header.removeprefix("bytes=").split("-")[0])
+            if start >= stat.st_size:
+                return self.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        self.send_response(
+            HTTPStatus.PARTIAL_CONTENT if partial_content else HTTPStatus.OK
+        )
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        if partial_content:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+        self.end_headers()
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            self.copyfile(f, self.wfile)
+
+    def not_modified(self, etag: str, mtime: float) -> bool:
+        if "If-None-Match" in self.headers:
+            return self.headers["If-None-Match"] == etag
+        if "If-Modified-Since" in self.headers:
+            since = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+            return int(mtime) <= since.timestamp()
+        return False
+
+    def send_index(self):
+        links = []
+        for root, _, files in sorted(os.walk(self.directory)):
+            for filename in sorted(files):
+                if filename.endswith(".xlsx"):
+                    href = os.path.relpath(os.path.join(root, filename), self.directory)
+                    href = html.escape(href.replace(os.sep, "/"))
+                    links.append(f'<li><a href="/{href}">{href}</a></li>')
+
+        body = f"<html><body><ul>{''.join(links)}</ul></body></html>".encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve xlsx fixtures over HTTP")
+    parser.add_argument("--directory", default="data/input/xlsx")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    handler = partial(FixturesHandler, directory=args.directory)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"Serving {args.directory} on http://127.0.0.1:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
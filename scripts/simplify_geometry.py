@@ -1,20 +1,128 @@
-import topojson as tp
+"""Build the postcode shapes used by the maps.
+
+The suburbs are merged per postcode and simplified at several levels, the
+shared borders are simplified once (topology) so the neighbouring postcodes
+still fit together. The result is stored in the database:
+
+- postcode_shapes: the WKB shape of every postcode at every level, 0 is the
+  most detailed
+- postcode_extents: the centroid and bounding box of every postcode
+- postcode_grid: grid index of the bounding boxes, the cells of
+  GRID_CELL_SIZE degrees each postcode overlaps
+
+The most detailed level is also exported to data/shp/suburbs/suburb.geojson,
+which scripts/build_database.py reads.
+
+    python scripts/simplify_geometry.py --database rentals.duckdb
+"""
+
+import argparse
+import os
+import sys
+
+import duckdb
 import geopandas as gpd
+import pyarrow as pa
+import topojson as tp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "visualisation"))
+from precomputed import GRID_CELL_SIZE, GRID_QUERY  # noqa: E402
+
+# Visvalingam-Whyatt area threshold of each level, in square degrees.
+# Keep the number of levels in sync with GEOMETRY_LEVELS in visualisation/db.py
+TOLERANCES = [0.00001, 0.0001, 0.001]
+
+
+def load_postcodes(path: str) -> gpd.GeoDataFrame:
+    # geopands import with auto detection
+    postcodes = gpd.read_file(path, engine="pyogrio")
+    postcodes = postcodes.dropna(subset=["postcode"])
+    # cleanup of the postcode
+    postcodes["postcode"] = postcodes["postcode"].astype(str)
+    postcodes["postcode"] = postcodes["postcode"].str.replace(".0", "")
+    postcodes["postcode"] = postcodes["postcode"].str.zfill(4)
+    # Fuse the zip codes
+    return postcodes.dissolve(by="postcode").reset_index()
+
+
+def simplify(postcodes: gpd.GeoDataFrame) -> list[gpd.GeoDataFrame]:
+    """Return the postcodes simplified at each level of TOLERANCES"""
+    topo = tp.Topology(postcodes)
+    return [
+        topo.toposimplify(
+            tolerance, simplify_with="simplification", simplify_algorithm="vw"
+        ).to_gdf()
+        for tolerance in TOLERANCES
+    ]
+
+
+def shapes_table(levels: list[gpd.GeoDataFrame]) -> pa.Table:
+    tables = [
+        pa.table(
+            {
+                "level": pa.array([level] * len(df), pa.uint8()),
+                "postcode": df["postcode"],
+                "geometry": pa.array(df.geometry.to_wkb(), pa.binary()),
+            }
+        )
+        for level, df in enumerate(levels)
+    ]
+    return pa.concat_tables(tables)
+
+
+def extents_table(postcodes: gpd.GeoDataFrame) -> pa.Table:
+    # NSW Lambert projection, the centroids of lon/lat polygons are skewed
+    centroids = postcodes.geometry.to_crs(3308).centroid.to_crs(4326)
+    bounds = postcodes.geometry.bounds
+    return pa.table(
+        {
+            "postcode": postcodes["postcode"],
+            "centroid_lon": centroids.x,
+            "centroid_lat": centroids.y,
+            "xmin": bounds["minx"],
+            "ymin": bounds["miny"],
+            "xmax": bounds["maxx"],
+            "ymax": bounds["maxy"],
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the postcode shapes")
+    parser.add_argument("--database", default="rentals.duckdb")
+    parser.add_argument("--source", default="data/shp/suburbs/Suburb.shp")
+    parser.add_argument("--geojson", default="data/shp/suburbs/suburb.geojson")
+    args = parser.parse_args()
+
+    print("Merging the suburbs per postcode")
+    postcodes = load_postcodes(args.source)
+
+    print(f"Simplifying {len(postcodes)} postcodes at {len(TOLERANCES)} levels")
+    levels = simplify(postcodes)
+    # export to geojson, read by build_database.py
+    levels[0].to_file(args.geojson, driver="GeoJSON", engine="pyogrio")
+
+    con = duckdb.connect(args.database)
+    con.register("shapes", shapes_table(levels))
+    con.register("extents", extents_table(postcodes))
+    # the tables are replaced together
+    con.begin()
+    con.execute(
+        "CREATE OR REPLACE TABLE postcode_shapes AS "
+        "SELECT * FROM shapes ORDER BY level, postcode"
+    )
+    con.execute(
+        "CREATE OR REPLACE TABLE postcode_extents AS "
+        "SELECT * FROM extents ORDER BY postcode"
+    )
+    con.execute(GRID_QUERY, {"cell_size": GRID_CELL_SIZE})
+    con.commit()
+    con.close()
+
+    for level, df in enumerate(levels):
+        vertices = len(df.geometry.get_coordinates())
+        print(f"Level {level}: {vertices} vertices")
+
 
-# geopands import with auto detection
-postcodes = gpd.read_file("data/shp/suburbs/Suburb.shp", engine="pyogrio")
-postcodes.dropna()
-# cleanup of the postcode
-postcodes['postcode'] = postcodes['postcode'].astype(str)
-postcodes['postcode'] = postcodes['postcode'].str.replace(".0", "")
-postcodes['postcode'] = postcodes['postcode'].str.zfill(4)
-# Fuse the zip codes
-postcodes = postcodes.dissolve(by="postcode").reset_index()
-
-# Simplify the geometry
-topo = tp.Topology(postcodes).toposimplify(0.00001
-                                           , simplify_with='simplification',
-                                           simplify_algorithm='vw')
-
-# export to topojson
-topo.to_json("data/shp/suburbs/suburb.geojson")
+if __name__ == "__main__":
+    main()
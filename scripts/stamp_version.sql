@@ -0,0 +1,6 @@
+-- Version of the content of the database, a new one each time the tables
+-- change. The dashboard keys its disk cache with it (see database_version in
+-- visualisation/cache.py) instead of hashing the whole file on every start.
+-- Run last by build_database.py and after each of the make build_* targets
+CREATE OR REPLACE TABLE build_version AS
+SELECT gen_random_uuid()::VARCHAR AS "version", now() AS "built_at";
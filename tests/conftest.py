@@ -0,0 +1,87 @@
+import os
+import sys
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+# the dashboard modules and the scripts are run from their directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, "scripts")
+sys.path.insert(0, os.path.join(ROOT, "visualisation"))
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from precomputed import build_rollup, build_stats  # noqa: E402
+
+POSTCODES = ["2000", "2010", "2150", "2300", "2500"]
+DWELLING_TYPES = ["F", "H", "T"]
+
+
+def build_rentals(path: str, rentals: pd.DataFrame, tables: bool):
+    """The rentals table of scripts/build_database.py, with ``tables`` the
+    rollup and the statistics of the dashboard"""
+    con = duckdb.connect(path)
+    postcodes = ", ".join(f"'{postcode}'" for postcode in POSTCODES)
+    con.execute(f"CREATE TYPE postcode AS ENUM ({postcodes})")
+    con.execute("CREATE TYPE dwelling_type AS ENUM ('F', 'H', 'T', 'O', 'U')")
+    con.register("frame", rentals)
+    con.execute(
+        """
+CREATE TABLE rentals AS
+SELECT
+    "lodgement_date"::DATE AS "lodgement_date",
+    "postcode"::postcode AS "postcode",
+    "type"::dwelling_type AS "type",
+    "bedrooms"::UTINYINT AS "bedrooms",
+    "weekly_rent"::UINTEGER AS "weekly_rent"
+FROM frame
+ORDER BY "lodgement_date", "postcode"
+"""
+    )
+    if tables:
+        build_rollup(con)
+        build_stats(con)
+    con.close()
+
+
+def connect(path: str, **kwargs):
+    """The connection of the dashboard, on the database at ``path``"""
+    # imported once the modules are on the path
+    from db import DuckDBConnection
+
+    # the queries tested don't need the spatial extension
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(
+            duckdb.DuckDBPyConnection, "load_extension", lambda self, name: None
+        )
+        return DuckDBConnection("rentals", database=path, read_only=True, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def rentals() -> pd.DataFrame:
+    """A few thousand lodgements over three years, some without a rent"""
+    rng = np.random.default_rng(42)
+    size = 5000
+    weekly_rent = rng.integers(100, 1500, size).astype(float)
+    weekly_rent[rng.random(size) < 0.03] = np.nan
+    return pd.DataFrame(
+        {
+            "lodgement_date": pd.Timestamp("2021-01-01")
+            + pd.to_timedelta(rng.integers(0, 3 * 365, size), unit="D"),
+            "postcode": rng.choice(POSTCODES, size),
+            "type": rng.choice(DWELLING_TYPES, size),
+            "bedrooms": rng.integers(0, 8, size),
+            "weekly_rent": pd.array(weekly_rent, dtype="Int64"),
+        }
+    )
+
+
+@pytest.fixture(scope="session", params=["rollup", "rentals"])
+def db(request, rentals, tmp_path_factory):
+    """The dashboard connection, on a database with the tables of
+    build_rollup/build_stats and on one with only rentals"""
+    path = str(tmp_path_factory.mktemp("database") / "rentals.duckdb")
+    build_rentals(path, rentals, tables=request.param == "rollup")
+    return connect(path)
@@ -0,0 +1,147 @@
+import datetime
+import os
+import sys
+
+import duckdb
+import polars as pl
+import pytest
+
+import build_database
+from ingest import PARQUET_DIR
+
+LODGEMENTS_SCHEMA = {
+    "Lodgement Date": pl.Date,
+    "Postcode": pl.String,
+    "Dwelling Type": pl.String,
+    "Bedrooms": pl.UInt8,
+    "Weekly Rent": pl.UInt32,
+}
+REFUNDS_SCHEMA = {
+    "Payment Date": pl.Date,
+    "Postcode": pl.String,
+    "Dwelling Type": pl.String,
+    "Bedrooms": pl.UInt8,
+    "Payment To Agent": pl.UInt32,
+    "Payment To Tenant": pl.UInt32,
+    "Days Bond Held": pl.UInt32,
+}
+
+
+def write_part(category: str, year: int, month: int, rows: list, schema: dict):
+    directory = os.path.join(PARQUET_DIR, category, f"year={year}", f"month={month:02}")
+    os.makedirs(directory, exist_ok=True)
+    pl.DataFrame(rows, schema=schema, orient="row").write_parquet(
+        os.path.join(directory, "part.parquet")
+    )
+
+
+@pytest.fixture(autouse=True)
+def parts(tmp_path, monkeypatch):
+    """Two months of lodgements and refunds, each part in reverse order"""
+    # the parts are read relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    for month in [1, 2]:
+        lodgements = [
+            (datetime.date(2023, month, day), postcode, "F", 2, 400 + day)
+            for day in range(28, 0, -1)
+            for postcode in ["2150", "2000"]
+        ]
+        # a rent the cleanup left empty
+        lodgements.append((datetime.date(2023, month, 1), "2010", "H", 7, None))
+        write_part("lodgements", 2023, month, lodgements, LODGEMENTS_SCHEMA)
+        refunds = [(datetime.date(2023, month, 3), "2300", "T", 1, 0, 1600, 400)]
+        write_part("refunds", 2023, month, refunds, REFUNDS_SCHEMA)
+
+
+def build(monkeypatch):
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["build_database.py", "--database", "rentals.duckdb", "--no-geometry"],
+    )
+    build_database.main()
+
+
+def test_build(monkeypatch):
+    build(monkeypatch)
+    assert not os.path.exists("rentals.duckdb.building")
+
+    with duckdb.connect("rentals.duckdb", read_only=True) as con:
+        types = dict(
+            con.execute(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_name = 'rentals'"
+            ).fetchall()
+        )
+        assert types == {
+            "lodgement_date": "DATE",
+            "postcode": "ENUM('2000', '2010', '2150', '2300')",
+            "type": "ENUM('F', 'H', 'T', 'O', 'U')",
+            "bedrooms": "UTINYINT",
+            "weekly_rent": "UINTEGER",
+        }
+
+        # stored in the order of the date/postcode filters
+        rows = con.execute(
+            'SELECT "lodgement_date", "postcode"::VARCHAR FROM rentals ORDER BY rowid'
+        ).fetchall()
+        assert len(rows) == 2 * 57
+        assert rows == sorted(rows)
+        refunds = con.execute(
+            'SELECT "payment_date", "postcode"::VARCHAR, "days_bond_held" FROM refunds'
+        ).fetchall()
+        assert refunds == [
+            (datetime.date(2023, 1, 3), "2300", 400),
+            (datetime.date(2023, 2, 3), "2300", 400),
+        ]
+
+        monthly = con.execute(
+            'SELECT "month", SUM("bonds")::INTEGER, SUM("rent_count")::INTEGER '
+            'FROM rentals_monthly GROUP BY ALL ORDER BY "month"'
+        ).fetchall()
+        assert monthly == [
+            (datetime.date(2023, 1, 1), 57, 56),
+            (datetime.date(2023, 2, 1), 57, 56),
+        ]
+        bins = con.execute('SELECT SUM("bonds")::INTEGER FROM rent_bins').fetchone()
+        assert bins == (2 * 56,)
+        # per bedrooms (5+ merged) and for all of them
+        bounds = con.execute(
+            'SELECT "all_bedrooms", "bedrooms_corrected" FROM rent_trim_bounds'
+        ).fetchall()
+        assert bounds == [(False, 2), (False, 5), (True, None)]
+        domains = con.execute(
+            'SELECT "postcodes", "dwelling_types" FROM rental_domains'
+        ).fetchall()
+        assert domains == [(["2000", "2010", "2150"], ["F", "H"])]
+        (versions,) = con.execute("SELECT COUNT(*) FROM build_version").fetchone()
+        assert versions == 1
+
+
+def test_failed_build_keeps_the_database(monkeypatch):
+    build(monkeypatch)
+    with duckdb.connect("rentals.duckdb", read_only=True) as con:
+        version = con.execute('SELECT "version" FROM build_version').fetchone()
+
+    # a part the build can't read
+    path = os.path.join(PARQUET_DIR, "refunds", "year=2023", "month=02", "part.parquet")
+    with open(path, "wb") as f:
+        f.write(b"not parquet")
+    with pytest.raises(duckdb.Error):
+        build(monkeypatch)
+
+    with duckdb.connect("rentals.duckdb", read_only=True) as con:
+        assert con.execute('SELECT "version" FROM build_version').fetchone() == version
+        assert con.execute("SELECT COUNT(*) FROM rentals").fetchone() == (2 * 57,)
+
+    # the next build starts over from the leftover
+    write_part(
+        "refunds",
+        2023,
+        2,
+        [(datetime.date(2023, 2, 3), "2300", "T", 1, 0, 1600, 400)],
+        REFUNDS_SCHEMA,
+    )
+    build(monkeypatch)
+    with duckdb.connect("rentals.duckdb", read_only=True) as con:
+        assert con.execute('SELECT "version" FROM build_version').fetchone() != version
@@ -0,0 +1,149 @@
+import os
+
+import duckdb
+import pyarrow as pa
+import pytest
+
+import cache
+from cache import DiskCache, ResultCache, cache_key, database_version
+from conftest import SCRIPTS_DIR
+
+
+def table(rows: int) -> pa.Table:
+    return pa.table({"value": pa.array(range(rows), pa.int64())})
+
+
+def test_cache_key_ignores_layout():
+    query = """
+SELECT *
+    FROM rentals WHERE "postcode" = $postcode
+"""
+    assert cache_key(query, {"a": 1, "b": [2]}) == cache_key(
+        'SELECT * FROM rentals WHERE "postcode" = $postcode', {"b": [2], "a": 1}
+    )
+    assert cache_key(query, [1, 2]) == cache_key(query, (1, 2))
+    assert cache_key(query, {"a": 1}) != cache_key(query, {"a": 2})
+    assert cache_key(query) != cache_key(query, [])
+
+
+def test_least_recently_used_evicted():
+    # 80 bytes each, room for two
+    results = ResultCache(max_bytes=200)
+    results.put("a", table(10), ttl=60)
+    results.put("b", table(10), ttl=60)
+    assert results.get("a") is not None
+    results.put("c", table(10), ttl=60)
+
+    assert results.get("b") is None
+    assert results.get("a") is not None
+    assert results.get("c") is not None
+    stats = results.stats()
+    assert (stats.entries, stats.bytes, stats.evictions) == (2, 160, 1)
+    assert (stats.hits, stats.misses) == (3, 1)
+
+
+def test_bigger_than_the_budget_not_cached():
+    results = ResultCache(max_bytes=100)
+    results.put("a", table(10), ttl=60)
+    results.put("b", table(100), ttl=60)
+    assert results.get("b") is None
+    assert results.get("a") is not None
+
+
+def test_replaced_entry_counted_once():
+    results = ResultCache(max_bytes=200)
+    results.put("a", table(10), ttl=60)
+    results.put("a", table(20), ttl=60)
+    assert results.get("a").num_rows == 20
+    assert results.stats().bytes == 160
+
+
+def test_expired(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now)
+    results = ResultCache(max_bytes=200)
+    results.put("a", table(10), ttl=60)
+    now += 59
+    assert results.get("a") is not None
+    now += 2
+    assert results.get("a") is None
+    assert results.stats().bytes == 0
+
+
+def test_clear():
+    results = ResultCache(max_bytes=200)
+    results.put("a", table(10), ttl=60)
+    results.clear()
+    assert results.get("a") is None
+    assert results.stats().bytes == 0
+
+
+@pytest.mark.parametrize("max_bytes", [0, 79])
+def test_no_room(max_bytes):
+    results = ResultCache(max_bytes=max_bytes)
+    results.put("a", table(10), ttl=60)
+    assert results.stats().entries == 0
+
+
+def test_disk_cache_shared(tmp_path):
+    writer = DiskCache(tmp_path, "v1", max_bytes=10_000)
+    writer.put("a", table(10))
+    # another replica of the same database
+    assert DiskCache(tmp_path, "v1", max_bytes=10_000).get("a").equals(table(10))
+    # a rebuilt database
+    assert DiskCache(tmp_path, "v2", max_bytes=10_000).get("a") is None
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_disk_cache_evicts_the_least_recently_read(tmp_path):
+    disk = DiskCache(tmp_path, "v1", max_bytes=10_000)
+    disk.put("a", table(10))
+    disk.put("b", table(10))
+    # room for two files
+    disk.max_bytes = 2 * disk.path("a").stat().st_size
+    os.utime(disk.path("a"), (1000, 1000))
+    os.utime(disk.path("b"), (2000, 2000))
+    # touched when read
+    assert disk.get("a") is not None
+    disk.put("c", table(10))
+
+    assert disk.get("b") is None
+    assert disk.get("a") is not None
+    assert disk.get("c") is not None
+
+
+def test_disk_cache_removes_stale_temporary_files(tmp_path):
+    stale = tmp_path / "stale.tmp"
+    stale.write_bytes(b"crashed")
+    os.utime(stale, (0, 0))
+    # still being written
+    recent = tmp_path / "recent.tmp"
+    recent.write_bytes(b"writing")
+    DiskCache(tmp_path, "v1", max_bytes=10_000).put("a", table(10))
+    assert not stale.exists()
+    assert recent.exists()
+
+
+def test_disk_cache_unreadable_file(tmp_path):
+    disk = DiskCache(tmp_path, "v1", max_bytes=10_000)
+    disk.path("a").write_bytes(b"not arrow")
+    assert disk.get("a") is None
+
+
+def test_database_version(tmp_path):
+    path = str(tmp_path / "rentals.duckdb")
+    con = duckdb.connect(path)
+    con.execute("CREATE TABLE rentals AS SELECT 1 AS id")
+    con.execute("CHECKPOINT")
+    # built before the stamp, the digest of the file
+    digest = database_version(con, path)
+    assert digest == database_version(con, path)
+
+    with open(os.path.join(SCRIPTS_DIR, "stamp_version.sql")) as f:
+        stamp = f.read()
+    con.execute(stamp)
+    version = database_version(con, path)
+    assert version != digest
+    assert version == database_version(con, path)
+    con.execute(stamp)
+    assert database_version(con, path) != version
@@ -0,0 +1,88 @@
+import datetime
+import os
+
+import openpyxl
+import polars as pl
+import pytest
+
+from convert_xlsx_to_csv import main, parquet_base_dir, xlsx_base_dir
+from ingest import load_manifest
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # the files are read and written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(f"{xlsx_base_dir}/lodgements")
+
+
+def write_xlsx(name: str, rents: list[int], postcode: int | str = 2000) -> str:
+    """A lodgements file laid out as the NSW ones, title rows first"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["NSW Fair Trading"])
+    sheet.append([])
+    sheet.append(
+        ["Lodgement Date", "Postcode", "Dwelling Type", "Bedrooms", "Weekly Rent"]
+    )
+    for rent in rents:
+        sheet.append([datetime.datetime(2024, 1, 2), postcode, "F", 2, rent])
+    path = f"{xlsx_base_dir}/lodgements/{name}.xlsx"
+    workbook.save(path)
+    return path
+
+
+def convert(capsys) -> str:
+    """Run the conversion, its summary line"""
+    main()
+    return capsys.readouterr().out.splitlines()[0]
+
+
+def test_unchanged_files_skipped(capsys):
+    write_xlsx("january", [400, 500])
+    path = write_xlsx("february", [600])
+    assert convert(capsys) == "🧠 Converting 2 xlsx files to Parquet"
+    rents = pl.read_parquet(f"{parquet_base_dir}/lodgements/january.parquet")
+    assert rents["Weekly Rent"].to_list() == [400, 500]
+
+    assert convert(capsys) == "🧠 Converting 0 xlsx files to Parquet"
+    # written again with the same bytes, only the mtime changed
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (0, 0))
+    assert convert(capsys) == "🧠 Converting 0 xlsx files to Parquet"
+
+    write_xlsx("february", [650])
+    assert convert(capsys) == "🧠 Converting 1 xlsx files to Parquet"
+    rents = pl.read_parquet(f"{parquet_base_dir}/lodgements/february.parquet")
+    assert rents["Weekly Rent"].to_list() == [650]
+
+
+def test_removed_file_output_removed(capsys):
+    kept = write_xlsx("january", [400])
+    removed = write_xlsx("february", [600])
+    convert(capsys)
+    os.unlink(removed)
+
+    assert convert(capsys) == "🧠 Converting 0 xlsx files to Parquet"
+    assert list(load_manifest()["xlsx"]) == [kept]
+    assert os.listdir(f"{parquet_base_dir}/lodgements") == ["january.parquet"]
+
+    # converted again when it comes back
+    write_xlsx("february", [600])
+    assert convert(capsys) == "🧠 Converting 1 xlsx files to Parquet"
+    assert os.path.exists(f"{parquet_base_dir}/lodgements/february.parquet")
+
+
+def test_invalid_postcodes_reported(capsys):
+    write_xlsx("january", [400, 500], postcode="NSW")
+    main()
+    output = capsys.readouterr().out
+    assert "january.xlsx: 2 rows without a valid postcode (NSW)" in output
+
+    # kept, without a postcode
+    df = pl.read_parquet(f"{parquet_base_dir}/lodgements/january.parquet")
+    assert df["Postcode"].to_list() == [None, None]
+    assert df["Weekly Rent"].to_list() == [400, 500]
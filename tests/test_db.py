@@ -0,0 +1,306 @@
+import contextlib
+import threading
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import connect
+from db import (
+    CursorPool,
+    postcodes_in_bbox,
+    rent_bounds,
+    rent_histogram,
+    rent_summary,
+    rent_trends,
+)
+from filters import RentalFilters
+from precomputed import GRID_CELL_SIZE, GRID_QUERY, RENT_BIN_WIDTH
+
+SELECTIONS = [
+    RentalFilters.from_selection((2021, 2023)),
+    RentalFilters.from_selection((2022, 2022), ["2000", "2150"]),
+    RentalFilters.from_selection((2021, 2022), (), ["F", "T"], 2),
+    # more than the 5+ bedrooms of the rollup
+    RentalFilters.from_selection((2023, 2023), ["2300"], max_bedrooms=6),
+]
+
+
+def selected(rentals: pd.DataFrame, filters: RentalFilters) -> pd.DataFrame:
+    """The rows of ``filters``, computed by pandas"""
+    years = rentals["lodgement_date"].dt.year
+    mask = (years >= filters.years[0]) & (years <= filters.years[1])
+    if filters.postcodes:
+        mask &= rentals["postcode"].isin(filters.postcodes)
+    if filters.dwelling_types:
+        mask &= rentals["type"].isin(filters.dwelling_types)
+    if filters.max_bedrooms is not None:
+        mask &= rentals["bedrooms"] <= filters.max_bedrooms
+    rows = rentals[mask].copy()
+    rows["month"] = rows["lodgement_date"].dt.to_period("M").dt.to_timestamp()
+    rows["month_of_year"] = rows["lodgement_date"].dt.month
+    rows["year"] = rows["lodgement_date"].dt.year
+    rows["bedrooms_corrected"] = rows["bedrooms"].clip(upper=5)
+    rows["weekly_rent"] = rows["weekly_rent"].astype(float)
+    return rows
+
+
+def comparable(df: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    df = df.copy()
+    for column in by:
+        if column in ("postcode", "type"):
+            df[column] = df[column].astype(str)
+        elif column == "month":
+            df[column] = pd.to_datetime(df[column])
+        else:
+            df[column] = df[column].astype(int)
+    return df.sort_values(by).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("filters", SELECTIONS)
+@pytest.mark.parametrize(
+    "by",
+    [
+        ["month"],
+        ["month_of_year"],
+        ["year", "type"],
+        ["postcode", "bedrooms_corrected"],
+    ],
+)
+@pytest.mark.parametrize("median", [False, True])
+def test_rent_summary(db, rentals, filters, by, median):
+    got = comparable(rent_summary(db, by, filters, median=median), by)
+
+    groups = selected(rentals, filters).groupby(by)["weekly_rent"]
+    expected = comparable(
+        pd.DataFrame(
+            {
+                "bonds": groups.size().astype(float),
+                "mean_weekly_rent": groups.mean(),
+                "min_weekly_rent": groups.min(),
+                "max_weekly_rent": groups.max(),
+                "median_weekly_rent": groups.median(),
+            }
+        ).reset_index(),
+        by,
+    )
+    if not median:
+        expected = expected.drop(columns="median_weekly_rent")
+
+    pd.testing.assert_frame_equal(got[by], expected[by], check_dtype=False)
+    values = expected.columns.drop(by)
+    pd.testing.assert_frame_equal(got[values].astype(float), expected[values])
+
+
+def test_rent_summary_dimensions(db):
+    filters = RentalFilters.from_selection((2021, 2023))
+    with pytest.raises(ValueError):
+        rent_summary(db, ["suburb"], filters)
+    with pytest.raises(ValueError):
+        rent_summary(db, [], filters)
+
+
+@pytest.mark.parametrize("filters", SELECTIONS)
+def test_rent_bounds(db, rentals, filters):
+    rents = selected(rentals, filters)["weekly_rent"].dropna()
+    assert rent_bounds(db, filters, 0.1, 0.8) == pytest.approx(
+        np.quantile(rents, [0.1, 0.8])
+    )
+
+
+@pytest.mark.parametrize("filters", SELECTIONS)
+@pytest.mark.parametrize("nbins", [1, 7, 20])
+def test_rent_histogram(db, rentals, filters, nbins):
+    rows = selected(rentals, filters).dropna(subset=["weekly_rent"])
+    lower, upper = np.quantile(rows["weekly_rent"], [0.05, 0.95])
+    histogram = rent_histogram(db, filters, (lower, upper), nbins)
+
+    assert sorted(histogram["bedrooms_corrected"].unique()) == sorted(
+        rows["bedrooms_corrected"].unique()
+    )
+    for bedrooms, bins in histogram.groupby("bedrooms_corrected"):
+        # whole $10 bins, covering the bounds
+        edges = np.append(bins["bin_start"], bins["bin_end"].iloc[-1])
+        assert len(bins) <= nbins
+        assert (bins["bin_start"].iloc[1:].values == bins["bin_end"].iloc[:-1]).all()
+        assert (edges % RENT_BIN_WIDTH == 0).all()
+        assert len(set(np.diff(edges))) == 1
+        assert edges[0] <= lower < edges[0] + RENT_BIN_WIDTH
+        assert edges[-1] > upper
+
+        rents = rows.loc[rows["bedrooms_corrected"] == bedrooms, "weekly_rent"]
+        # right open, like the bins of the query
+        counts, _ = np.histogram(rents[rents < edges[-1]], bins=edges)
+        assert bins["bonds"].tolist() == counts.tolist()
+
+
+def test_rent_histogram_without_rents(db):
+    filters = RentalFilters.from_selection((2030, 2030))
+    bounds = rent_bounds(db, filters)
+    assert len(rent_histogram(db, filters, bounds)) == 0
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        RentalFilters.from_selection((2021, 2023), max_bedrooms=5),
+        RentalFilters.from_selection((2022, 2023), ["2000", "2010"], ["H"]),
+    ],
+)
+@pytest.mark.parametrize("months", [1, 3])
+def test_rent_trends(db, rentals, filters, months):
+    # the pandas computation the page used to run on the rows
+    lower, upper = np.quantile(
+        rentals["weekly_rent"].dropna().astype(float), [0.05, 0.95]
+    )
+    rows = selected(rentals, filters)
+    rows = rows[
+        (rows["bedrooms"] > 0)
+        & (rows["weekly_rent"] > lower)
+        & (rows["weekly_rent"] < upper)
+    ]
+    d = rows.groupby(["month", "bedrooms"]).agg({"weekly_rent": "mean"}).reset_index()
+    by_bedrooms = d.groupby("bedrooms")
+    d["weekly_rent_trend"] = (
+        by_bedrooms["weekly_rent"].rolling(months).mean().reset_index(0, drop=True)
+    )
+    d["weekly_rent_pct_change"] = (
+        by_bedrooms["weekly_rent"].pct_change(fill_method=None) * 100
+    )
+    d["weekly_rent_pct_change_cumsum"] = d.groupby("bedrooms")[
+        "weekly_rent_pct_change"
+    ].cumsum()
+    d["weekly_rent_trend"] = (
+        d.groupby("bedrooms")["weekly_rent_trend"].pct_change(fill_method=None) * 100
+    )
+    d["weekly_rent_trend_cumsum"] = d.groupby("bedrooms")["weekly_rent_trend"].cumsum()
+    expected = d.sort_values(["month", "bedrooms"]).reset_index(drop=True)
+
+    got = rent_trends(db, filters, months)
+    got["month"] = pd.to_datetime(got["month"])
+    got["bedrooms"] = got["bedrooms"].astype(int)
+    got = got[expected.columns]
+    pd.testing.assert_frame_equal(
+        got[["month", "bedrooms"]], expected[["month", "bedrooms"]], check_dtype=False
+    )
+    values = expected.columns.drop(["month", "bedrooms"])
+    pd.testing.assert_frame_equal(got[values].astype(float), expected[values])
+
+
+@pytest.fixture(scope="module")
+def extents() -> pd.DataFrame:
+    """Bounding boxes around Sydney, from a few meters to half a degree wide"""
+    rng = np.random.default_rng(7)
+    size = 300
+    xmin = rng.uniform(150.0, 152.0, size)
+    ymin = rng.uniform(-35.0, -33.0, size)
+    width = rng.uniform(0.001, 0.5, (2, size))
+    return pd.DataFrame(
+        {
+            "postcode": [f"{2000 + i}" for i in range(size)],
+            "xmin": xmin,
+            "ymin": ymin,
+            "xmax": xmin + width[0],
+            "ymax": ymin + width[1],
+            "centroid_lon": xmin + width[0] / 2,
+            "centroid_lat": ymin + width[1] / 2,
+        }
+    )
+
+
+@pytest.fixture(scope="module", params=["grid", "extents"])
+def geometry_db(request, extents, tmp_path_factory):
+    """A database with the postcode_extents of scripts/simplify_geometry.py,
+    with and without its grid index"""
+    path = str(tmp_path_factory.mktemp("geometry") / "rentals.duckdb")
+    con = duckdb.connect(path)
+    con.register("frame", extents)
+    con.execute("CREATE TABLE postcode_extents AS SELECT * FROM frame")
+    if request.param == "grid":
+        con.execute(GRID_QUERY, {"cell_size": GRID_CELL_SIZE})
+    con.close()
+    return connect(path)
+
+
+@pytest.mark.parametrize(
+    "bbox",
+    [
+        (151.0, -34.0, 151.3, -33.8),
+        # within a cell of the grid
+        (151.01, -33.99, 151.02, -33.98),
+        # on the edges of the cells
+        (151.1, -34.2, 151.2, -34.1),
+        (149.0, -36.0, 153.0, -32.0),
+        (140.0, -30.0, 141.0, -29.0),
+    ],
+)
+def test_postcodes_in_bbox(geometry_db, extents, bbox):
+    xmin, ymin, xmax, ymax = bbox
+    overlaps = (
+        (extents["xmin"] <= xmax)
+        & (extents["xmax"] >= xmin)
+        & (extents["ymin"] <= ymax)
+        & (extents["ymax"] >= ymin)
+    )
+    expected = sorted(extents.loc[overlaps, "postcode"])
+    assert postcodes_in_bbox(geometry_db, bbox) == expected
+
+
+def test_postcodes_in_random_bboxes(geometry_db, extents):
+    rng = np.random.default_rng(11)
+    for _ in range(50):
+        x, y = rng.uniform(150.0, 152.0), rng.uniform(-35.0, -33.0)
+        width, height = rng.uniform(0.0, 0.3, 2)
+        bbox = (x, y, x + width, y + height)
+        overlaps = (
+            (extents["xmin"] <= x + width)
+            & (extents["xmax"] >= x)
+            & (extents["ymin"] <= y + height)
+            & (extents["ymax"] >= y)
+        )
+        assert postcodes_in_bbox(geometry_db, bbox) == sorted(
+            extents.loc[overlaps, "postcode"]
+        )
+
+
+@pytest.fixture
+def pool():
+    return CursorPool(duckdb.connect(), 2)
+
+
+def test_lease_waits_for_a_free_cursor(pool):
+    leased = threading.Event()
+
+    def lease():
+        with pool.lease():
+            leased.set()
+
+    with contextlib.ExitStack() as stack:
+        first = stack.enter_context(pool.lease())
+        second = stack.enter_context(pool.lease())
+        assert first is not second
+        thread = threading.Thread(target=lease)
+        thread.start()
+        # every cursor is used
+        assert not leased.wait(0.1)
+    assert leased.wait(10)
+    thread.join()
+
+
+def test_try_lease(pool):
+    with pool.try_lease() as first, pool.try_lease() as second:
+        assert first is not None and second is not None
+        with pool.try_lease() as third:
+            assert third is None
+    with pool.try_lease() as cursor:
+        assert cursor.execute("SELECT 42").fetchone() == (42,)
+
+
+def test_cursor_returned_after_an_error(pool):
+    for _ in range(3):
+        with pytest.raises(duckdb.Error):
+            with pool.lease() as cursor:
+                cursor.execute("SELECT * FROM missing_table")
+    with pool.try_lease() as first, pool.try_lease() as second:
+        assert first is not None and second is not None
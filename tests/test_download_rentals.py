@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import os
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer
+
+import httpx
+import pytest
+
+import download_rentals
+from serve_fixtures import FixturesHandler
+
+FILENAME = "rental-bond_lodgements_may_2024.xlsx"
+
+
+@pytest.fixture
+def site(tmp_path_factory):
+    """The fixtures server and the URL of its index page"""
+    directory = tmp_path_factory.mktemp("site")
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(FixturesHandler, directory=str(directory))
+    )
+    # polls often, stopped at the end of every test
+    threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    ).start()
+    yield directory, f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+def publish(directory, data: bytes, mtime: int):
+    path = directory / FILENAME
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+
+
+def download(url: str, destination: str, validators: dict) -> str:
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return await download_rentals.download_file(
+                client, asyncio.Semaphore(1), destination, url + FILENAME, validators
+            )
+
+    return asyncio.run(run())
+
+
+@contextlib.contextmanager
+def interrupted():
+    """Cut the downloads after a few chunks"""
+    aiter_bytes = httpx.Response.aiter_bytes
+
+    async def cut(self, chunk_size=None):
+        chunks = 0
+        async for chunk in aiter_bytes(self, chunk_size):
+            yield chunk
+            chunks += 1
+            if chunks == 3:
+                raise httpx.ReadError("connection reset")
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(httpx.Response, "aiter_bytes", cut)
+        yield
+
+
+def test_unchanged_not_downloaded_again(site, tmp_path):
+    directory, url = site
+    publish(directory, b"first", 1_000_000)
+    destination = str(tmp_path / FILENAME)
+    validators = {}
+
+    assert download(url, destination, validators) == "downloaded"
+    assert set(validators) == {"etag", "last_modified"}
+    os.utime(destination, (0, 0))
+    assert download(url, destination, validators) == "unchanged"
+    # not written again
+    assert os.path.getmtime(destination) == 0
+
+    publish(directory, b"second", 2_000_000)
+    assert download(url, destination, validators) == "downloaded"
+    with open(destination, "rb") as f:
+        assert f.read() == b"second"
+
+
+@pytest.mark.parametrize("validator", ["etag", "last_modified"])
+def test_conditional_get_with_either_validator(site, tmp_path, validator):
+    directory, url = site
+    publish(directory, b"first", 1_000_000)
+    destination = str(tmp_path / FILENAME)
+    validators = {}
+    download(url, destination, validators)
+    validators = {validator: validators[validator]}
+    assert download(url, destination, validators) == "unchanged"
+
+
+def test_without_validators_skipped(site, tmp_path):
+    directory, url = site
+    publish(directory, b"first", 1_000_000)
+    destination = tmp_path / FILENAME
+    destination.write_bytes(b"downloaded before")
+    assert download(url, str(destination), {}) == "skipped"
+
+
+def test_interrupted_download_resumed(site, tmp_path):
+    directory, url = site
+    data = os.urandom(10 * download_rentals.chunk_size)
+    publish(directory, data, 1_000_000)
+    destination = str(tmp_path / FILENAME)
+    validators = {}
+
+    with interrupted(), pytest.raises(httpx.ReadError):
+        download(url, destination, validators)
+    # only recorded once the file is complete
+    assert validators == {}
+    assert not os.path.exists(destination)
+    assert 0 < os.path.getsize(f"{destination}.part") < len(data)
+
+    assert download(url, destination, validators) == "resumed"
+    with open(destination, "rb") as f:
+        assert f.read() == data
+    assert os.listdir(tmp_path) == [FILENAME]
+    assert download(url, destination, validators) == "unchanged"
+
+
+def test_changed_while_interrupted_downloaded_again(site, tmp_path):
+    directory, url = site
+    publish(directory, os.urandom(10 * download_rentals.chunk_size), 1_000_000)
+    destination = str(tmp_path / FILENAME)
+
+    with interrupted(), pytest.raises(httpx.ReadError):
+        download(url, destination, {})
+    # the server ignores the range, the partial file is of the old version
+    data = os.urandom(8 * download_rentals.chunk_size)
+    publish(directory, data, 2_000_000)
+    assert download(url, destination, {}) == "downloaded"
+    with open(destination, "rb") as f:
+        assert f.read() == data
+
+
+def test_download_all(site, tmp_path):
+    directory, url = site
+    data = os.urandom(10 * download_rentals.chunk_size)
+    publish(directory, data, 1_000_000)
+    (directory / "RentalBond_Refunds_2nd_Quarter_2023.xlsx").write_bytes(b"refunds")
+    output_dir = str(tmp_path)
+
+    with interrupted(), pytest.raises(SystemExit):
+        asyncio.run(download_rentals.download_all(url, output_dir, 2))
+    # the refunds file, downloaded in full
+    state = download_rentals.load_state(output_dir)
+    assert list(state) == [url + "RentalBond_Refunds_2nd_Quarter_2023.xlsx"]
+
+    asyncio.run(download_rentals.download_all(url, output_dir, 2))
+    state = download_rentals.load_state(output_dir)
+    assert sorted(state) == [
+        url + "RentalBond_Refunds_2nd_Quarter_2023.xlsx",
+        url + FILENAME,
+    ]
+    with open(os.path.join(output_dir, "lodgements", FILENAME), "rb") as f:
+        assert f.read() == data
@@ -0,0 +1,112 @@
+from datetime import date
+
+import duckdb
+import pytest
+
+from filters import RentalFilters
+
+
+def test_from_selection_normalises():
+    filters = RentalFilters.from_selection(
+        (2024, 2021), [2000, "2010", "2000"], ["H", "F", "H"], 3
+    )
+    assert filters == RentalFilters(
+        years=(2021, 2024),
+        postcodes=("2000", "2010"),
+        dwelling_types=("F", "H"),
+        max_bedrooms=3,
+    )
+    # the same selection in another order shares the cached results
+    same = RentalFilters.from_selection((2021, 2024), ["2010", 2000], ["F", "H"], 3)
+    assert same.parameters() == filters.parameters()
+    assert same.to_token() == filters.to_token()
+
+
+def test_within_postcodes():
+    filters = RentalFilters.from_selection((2024, 2024), ["2000", "2010"])
+    assert filters.within_postcodes(["2010", "2020"]).postcodes == ("2010",)
+    # no postcode selected, all of them match
+    everything = RentalFilters.from_selection((2024, 2024))
+    assert everything.within_postcodes([2020, "2010"]).postcodes == ("2010", "2020")
+    # nothing in common, no postcode filter would match every postcode
+    assert filters.within_postcodes(["2020"]) is None
+    assert everything.within_postcodes([]) is None
+
+
+@pytest.mark.parametrize(
+    "max_bedrooms, compatible", [(None, True), (4, True), (5, False), (6, False)]
+)
+def test_rollup_compatible(max_bedrooms, compatible):
+    filters = RentalFilters.from_selection((2024, 2024), max_bedrooms=max_bedrooms)
+    assert filters.rollup_compatible is compatible
+
+
+def test_parameters():
+    filters = RentalFilters.from_selection((2022, 2023), ["2000"], ["F"], 2)
+    assert filters.parameters() == {
+        "start_date": date(2022, 1, 1),
+        "end_date": date(2024, 1, 1),
+        "postcodes": ["2000"],
+        "dwelling_types": ["F"],
+        "max_bedrooms": 2,
+    }
+
+
+def test_where_is_the_same_for_every_selection():
+    first = RentalFilters.from_selection((2022, 2023), ["2000"], ["F"], 2)
+    second = RentalFilters.from_selection((2024, 2024))
+    assert first.where() == second.where()
+    assert '"month" >= $start_date' in first.where("month", "bedrooms_corrected")
+
+
+ROWS = [
+    (date(2021, 12, 31), "2000", "F", 1),
+    (date(2022, 1, 1), "2000", "F", 2),
+    (date(2022, 6, 1), "2000", "H", 3),
+    (date(2022, 6, 1), "2010", "F", 1),
+    (date(2023, 12, 31), "2010", "H", 6),
+    (date(2024, 1, 1), "2000", "F", 1),
+]
+
+
+@pytest.mark.parametrize(
+    "filters, expected",
+    [
+        (RentalFilters.from_selection((2022, 2023)), [1, 2, 3, 4]),
+        (RentalFilters.from_selection((2022, 2023), ["2010"]), [3, 4]),
+        (RentalFilters.from_selection((2022, 2023), (), ["H"]), [2, 4]),
+        (RentalFilters.from_selection((2022, 2023), max_bedrooms=2), [1, 3]),
+        (RentalFilters.from_selection((2021, 2024), ["2000"], ["F"], 1), [0, 5]),
+    ],
+)
+def test_where_matches(filters, expected):
+    con = duckdb.connect()
+    con.execute(
+        'CREATE TABLE rentals ("id" INTEGER, "lodgement_date" DATE, '
+        '"postcode" VARCHAR, "type" VARCHAR, "bedrooms" INTEGER)'
+    )
+    con.executemany(
+        "INSERT INTO rentals VALUES (?, ?, ?, ?, ?)",
+        [(i, *row) for i, row in enumerate(ROWS)],
+    )
+    ids = con.execute(
+        f'SELECT "id" FROM rentals WHERE {filters.where()} ORDER BY "id"',
+        filters.parameters(),
+    ).fetchall()
+    assert [i for (i,) in ids] == expected
+
+
+@pytest.mark.parametrize("max_bedrooms", [None, 3])
+def test_token_round_trip(max_bedrooms):
+    filters = RentalFilters.from_selection(
+        (2021, 2024), ["2000", "2010"], ["F"], max_bedrooms
+    )
+    token = filters.to_token()
+    assert "=" not in token
+    assert RentalFilters.from_token(token) == filters
+
+
+@pytest.mark.parametrize("token", ["", "not a token", "eJyLjgUAARUAuQ"])
+def test_invalid_token(token):
+    with pytest.raises(ValueError):
+        RentalFilters.from_token(token)
@@ -0,0 +1,174 @@
+import datetime
+import json
+import os
+
+import polars as pl
+import pytest
+
+import ingest as ingest_module
+from ingest import CSV_DIR, MANIFEST_PATH, PARQUET_DIR, ingest
+from schema import schemas
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # the outputs are written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("src")
+
+
+# the columns of the converted xlsx files
+SOURCE_SCHEMA = {
+    "Lodgement Date": pl.Date,
+    "Postcode": pl.Int64,
+    "Dwelling Type": pl.String,
+    "Bedrooms": pl.Int64,
+    "Weekly Rent": pl.Int64,
+}
+
+
+def lodgement(rent: int | None) -> dict:
+    return {
+        "Lodgement Date": datetime.date(2024, (rent or 0) % 3 + 1, 1),
+        "Postcode": 2000,
+        "Dwelling Type": "F",
+        "Bedrooms": 1,
+        "Weekly Rent": rent,
+    }
+
+
+def write_source(name: str, rents: list[int | None], mtime: int | None = None):
+    path = f"src/{name}.parquet"
+    rows = [lodgement(rent) for rent in rents]
+    pl.DataFrame(rows, schema=SOURCE_SCHEMA).write_parquet(path)
+    if mtime is not None:
+        # a new file within the same second, only its content tells
+        os.utime(path, (mtime, mtime))
+
+
+def run(full: bool = False) -> list[int]:
+    """Ingest the sources, the rents of the combined CSV"""
+    ingest(
+        "lodgements",
+        "src/*.parquet",
+        schemas["lodgements"],
+        ["Bedrooms", "Weekly Rent"],
+        "Lodgement Date",
+        full=full,
+    )
+    # the parts hold the same rows as the CSV
+    parts = pl.read_parquet(f"{PARQUET_DIR}/lodgements/*/*/*.parquet")
+    rents = sorted(combined()["Weekly Rent"])
+    assert sorted(parts["Weekly Rent"]) == rents
+    return rents
+
+
+def combined() -> pl.DataFrame:
+    return pl.read_csv(os.path.join(CSV_DIR, "lodgements_combined.csv"))
+
+
+def new_rents() -> list[int] | None:
+    path = os.path.join(CSV_DIR, "lodgements_new.csv")
+    if not os.path.exists(path):
+        return None
+    return sorted(pl.read_csv(path)["Weekly Rent"])
+
+
+def test_duplicates_dropped():
+    write_source("a", [1, 2, 2, None])
+    write_source("b", [2, 3])
+    assert run() == [1, 2, 3]
+    assert new_rents() == [1, 2, 3]
+
+
+def test_partitioned_by_month():
+    write_source("a", [1, 2, 3, 4])
+    run()
+    parts = sorted(
+        os.path.relpath(os.path.join(directory, name), PARQUET_DIR)
+        for directory, _, names in os.walk(PARQUET_DIR)
+        for name in names
+        if name == "a.parquet"
+    )
+    assert parts == [
+        "lodgements/year=2024/month=01/a.parquet",
+        "lodgements/year=2024/month=02/a.parquet",
+        "lodgements/year=2024/month=03/a.parquet",
+    ]
+
+
+def test_rerun_only_ingests_new_files():
+    write_source("a", [1, 2])
+    run()
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+
+    assert run() == [1, 2]
+    assert new_rents() is None
+    with open(MANIFEST_PATH) as f:
+        assert json.load(f) == manifest
+
+    # touched, same content
+    os.utime("src/a.parquet", (0, 0))
+    write_source("b", [2, 3])
+    assert run() == [1, 2, 3]
+    assert new_rents() == [3]
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        # the duplicate of b comes back from b
+        lambda: write_source("a", [1], mtime=0),
+        lambda: os.unlink("src/a.parquet"),
+        lambda: write_source("a", [1, 3, 5], mtime=0),
+        # nothing to add back
+        lambda: os.unlink("src/c.parquet"),
+        lambda: write_source("b", [], mtime=0),
+    ],
+)
+def test_changed_source_like_a_full_run(change):
+    write_source("a", [1, 2])
+    write_source("b", [2, 3])
+    write_source("c", [3, 4])
+    assert run() == [1, 2, 3, 4]
+
+    change()
+    incremental = run()
+    assert incremental == run(full=True)
+    assert len(incremental) == len(set(incremental))
+    # and the next runs keep on from there
+    write_source("d", [2, 6])
+    assert run() == sorted({*incremental, 2, 6})
+
+
+def test_index_partitioned_by_month():
+    write_source("a", [1, 2, 3, 4])
+    run()
+    parts = sorted(os.listdir(ingest_module.row_index_dir("lodgements")))
+    assert parts == ["2024-01.parquet", "2024-02.parquet", "2024-03.parquet"]
+    index = pl.read_parquet(ingest_module.row_index_path("lodgements", 2024, 2))
+    # the rents 1 and 4
+    assert index.height == 2
+
+
+def test_failed_run_leaves_the_index():
+    write_source("a", [1, 2])
+    run()
+    write_source("b", [2, 3])
+    write_source("c", [4])
+
+    write_partitions = ingest_module.write_partitions
+
+    def fail_on_c(category, source, rows, date_column):
+        if source.endswith("c.parquet"):
+            raise OSError("disk full")
+        write_partitions(category, source, rows, date_column)
+
+    with pytest.MonkeyPatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(ingest_module, "write_partitions", fail_on_c)
+        run()
+
+    # b is ingested again, not skipped as already in the index
+    assert run() == [1, 2, 3, 4]
+    assert run(full=True) == [1, 2, 3, 4]
@@ -0,0 +1,141 @@
+import re
+
+import pytest
+
+from cache import CacheStats
+from conftest import build_rentals, connect
+from metrics import QueryMetrics, QueryRecord, query_id
+
+QUERY = 'SELECT COUNT(*) FROM rentals WHERE "postcode" = $postcode'
+
+
+def record(seconds: float, cache: str = "miss", query: str = QUERY) -> QueryRecord:
+    return QueryRecord(
+        query=query, started=0.0, seconds=seconds, rows=1, bytes=8, cache=cache
+    )
+
+
+@pytest.fixture
+def small_db(rentals, tmp_path):
+    """The dashboard connection with a single cursor, every statement slow"""
+    path = str(tmp_path / "rentals.duckdb")
+    build_rentals(path, rentals, tables=False)
+    return connect(path, pool_size=1, slow_query_ms=0)
+
+
+def test_record_profiles_slow_misses_only():
+    metrics = QueryMetrics(slow_query_ms=100)
+    assert not metrics.record(record(0.05))
+    # the cached results are only read
+    assert not metrics.record(record(0.5, cache="memory"))
+    assert not metrics.record(record(0.5, cache="disk"))
+    assert metrics.record(record(0.1))
+
+    totals = metrics.totals()[QUERY]
+    assert totals.count == 4
+    assert totals.max_seconds == 0.5
+    assert totals.outcomes == {"miss": 2, "memory": 1, "disk": 1}
+
+
+def test_record_profiles_each_query_once():
+    metrics = QueryMetrics(slow_query_ms=100)
+    assert metrics.record(record(0.2))
+    # being profiled
+    assert not metrics.record(record(0.2))
+    # another query
+    assert metrics.record(record(0.2, query="SELECT 1"))
+
+    metrics.add_profile(record(0.2), "profile")
+    assert not metrics.record(record(0.2))
+    assert [slow.profile for slow in metrics.slow_queries()] == ["profile"]
+
+
+def test_skipped_profile_is_tried_again():
+    metrics = QueryMetrics(slow_query_ms=100)
+    assert metrics.record(record(0.2))
+    metrics.skip_profile(record(0.2))
+    assert metrics.record(record(0.2))
+
+
+def test_profile_skipped_without_free_cursor(small_db):
+    slow = record(1.0)
+    assert small_db.metrics.record(slow)
+    small_db._profiles.acquire()
+    # the pages hold every cursor
+    with small_db.lease():
+        small_db._profile(slow, QUERY, {"parameters": {"postcode": "2000"}})
+
+    assert small_db.metrics.slow_queries() == []
+    # left for the next slow run, and the next profile can start
+    assert small_db.metrics.record(slow)
+    assert small_db._profiles.acquire(blocking=False)
+
+
+@pytest.mark.parametrize(
+    "query, captured",
+    [(QUERY, "Total Time"), ("SELECT * FROM missing_table", "Profiling failed")],
+)
+def test_profiling_reset_before_the_cursor_is_returned(small_db, query, captured):
+    slow = record(1.0, query=query)
+    assert small_db.metrics.record(slow)
+    small_db._profiles.acquire()
+    small_db._profile(slow, query, {"parameters": {"postcode": "2000"}})
+
+    (profile,) = small_db.metrics.slow_queries()
+    assert captured in profile.profile
+    # the single cursor of the pool, as the next page gets it
+    with small_db.lease() as cursor:
+        settings = cursor.execute(
+            "SELECT current_setting('enable_profiling'), "
+            "current_setting('profiling_output')"
+        ).fetchone()
+    assert settings == (None, "")
+
+
+def test_slow_query_profiled_in_the_background(small_db):
+    small_db.query(QUERY, parameters={"postcode": "2000"})
+    # the profile thread releases the semaphore once done
+    small_db._profiles.acquire(timeout=10)
+    (profile,) = small_db.metrics.slow_queries()
+    assert profile.record.cache == "miss"
+    assert "Total Time" in profile.profile
+
+
+def test_prometheus_format():
+    metrics = QueryMetrics(slow_query_ms=100)
+    metrics.record(record(0.25))
+    metrics.record(record(0.5, cache="memory"))
+    metrics.add_profile(record(0.25), "profile")
+    cache = CacheStats(
+        hits=3, misses=2, evictions=1, entries=4, bytes=1024, max_bytes=4096
+    )
+    text = metrics.prometheus(cache)
+
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    names = set()
+    for line in lines:
+        if line.startswith("# HELP "):
+            names.add(line.split()[2])
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name in names
+            assert kind in ("counter", "gauge")
+            # the counters are suffixed by _total
+            assert name.endswith("_total") == (kind == "counter")
+        else:
+            assert re.fullmatch(
+                r'[a-z_]+(\{[a-z]+="[^"]*"(,[a-z]+="[^"]*")*\})? \S+', line
+            )
+            assert re.match(r"[a-z_]+", line).group() in names
+
+    samples = dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+    label = f'query="{query_id(QUERY)}"'
+    assert samples[f'dashboard_queries_total{{{label},cache="miss"}}'] == "1"
+    assert samples[f'dashboard_queries_total{{{label},cache="memory"}}'] == "1"
+    assert samples[f'dashboard_queries_total{{{label},cache="disk"}}'] == "0"
+    assert samples[f"dashboard_query_seconds_total{{{label}}}"] == "0.75"
+    assert samples[f"dashboard_query_seconds_max{{{label}}}"] == "0.5"
+    assert samples["dashboard_slow_queries"] == "1"
+    assert samples["dashboard_cache_hits_total"] == "3"
+    assert samples["dashboard_cache_max_bytes"] == "4096"
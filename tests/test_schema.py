@@ -0,0 +1,21 @@
+import polars as pl
+import pytest
+
+from schema import Postcode, apply_schema, unmapped
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [2000.0, 800.0, None, 2000.5],
+        [2000, 800, None, 12345],
+        ["2000", " 0800 ", None, "ABC"],
+        ["2000.0", "800.00", None, "2000.5"],
+    ],
+)
+def test_postcodes(values):
+    source = pl.DataFrame({"Postcode": values})
+    typed = apply_schema(source, {"Postcode": Postcode})
+    assert typed["Postcode"].cast(pl.String).to_list() == ["2000", "0800", None, None]
+    # the missing postcode isn't one which couldn't be cast
+    assert unmapped(source, typed, "Postcode").to_list() == values[3:]
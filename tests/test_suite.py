@@ -0,0 +1,70 @@
+import os
+
+import duckdb
+
+from conftest import SCRIPTS_DIR, build_rentals
+from suite import BASELINE_RUNS, dataset_digest, regressions
+
+
+def run(dataset: str, seconds: float, host: str = "bench") -> dict:
+    return {
+        "host": host,
+        "dataset": dataset,
+        "results": {
+            "stage:build_database": {"seconds": seconds, "peak_mb": 100},
+            "query:rent_summary/all": {"seconds": seconds / 100, "peak_mb": 10},
+        },
+    }
+
+
+def test_slower_than_the_baseline():
+    history = [run("real", 10), run("real", 11), run("real", 9)]
+    assert regressions(run("real", 11.5), history) == []
+    found = regressions(run("real", 13), history)
+    assert [line.split(": ")[0] for line in found] == [
+        "stage:build_database",
+        "query:rent_summary/all",
+    ]
+
+
+def test_baseline_of_the_last_runs():
+    history = [run("real", 100)] + [run("real", 10)] * BASELINE_RUNS
+    assert len(regressions(run("real", 13), history)) == 2
+
+
+def test_noise_ignored():
+    # +50% but 0.5ms
+    history = [run("real", 0.1)]
+    found = regressions(run("real", 0.15), history)
+    assert found == ["stage:build_database: seconds 0.150 vs 0.100 (+50%)"]
+
+
+def test_only_the_same_data_and_machine():
+    history = [
+        run("real", 1),
+        run("real", 1, host="laptop"),
+        # recorded before the dataset digest
+        {"host": "bench", "database": "v1", "results": run("real", 1)["results"]},
+    ]
+    # a synthetic run after real runs
+    assert regressions(run("synthetic", 100), history) == []
+    assert regressions(run("real", 100, host="other"), history) == []
+    assert len(regressions(run("real", 100), history)) == 2
+
+
+def test_dataset_digest(tmp_path, rentals):
+    digests = []
+    for name in ["first", "second"]:
+        path = str(tmp_path / f"{name}.duckdb")
+        build_rentals(path, rentals, tables=True)
+        with duckdb.connect(path) as con:
+            with open(os.path.join(SCRIPTS_DIR, "stamp_version.sql")) as f:
+                con.execute(f.read())
+            digests.append(dataset_digest(con))
+    # rebuilt from the same data
+    assert digests[0] == digests[1]
+
+    path = str(tmp_path / "other.duckdb")
+    build_rentals(path, rentals.iloc[1:], tables=True)
+    with duckdb.connect(path) as con:
+        assert dataset_digest(con) != digests[0]
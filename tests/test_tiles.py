@@ -0,0 +1,122 @@
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import duckdb
+import mapbox_vector_tile
+import pytest
+import shapely
+
+from conftest import POSTCODES, SCRIPTS_DIR, build_rentals, connect
+from filters import RentalFilters
+from precomputed import tile_bounds
+from tiles import TILE_LAYER, TileServer, tile_url
+
+TILE = (4, 14, 9)
+
+
+@pytest.fixture(scope="module")
+def tiles_db(rentals, tmp_path_factory):
+    """A stamped database with a piece of every postcode in TILE"""
+    path = str(tmp_path_factory.mktemp("tiles") / "rentals.duckdb")
+    build_rentals(path, rentals, tables=True)
+    xmin, ymin, xmax, ymax = tile_bounds(*TILE)
+    width = (xmax - xmin) / len(POSTCODES)
+    with duckdb.connect(path) as con:
+        con.execute(
+            'CREATE TABLE postcode_tiles ("z" UTINYINT, "x" UINTEGER, '
+            '"y" UINTEGER, "postcode" VARCHAR, "geometry" BLOB)'
+        )
+        con.executemany(
+            "INSERT INTO postcode_tiles VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    *TILE,
+                    postcode,
+                    shapely.box(
+                        xmin + i * width, ymin, xmin + (i + 1) * width, ymax
+                    ).wkb,
+                )
+                for i, postcode in enumerate(POSTCODES)
+            ],
+        )
+        with open(os.path.join(SCRIPTS_DIR, "stamp_version.sql")) as f:
+            con.execute(f.read())
+    return connect(path)
+
+
+@pytest.fixture(scope="module")
+def server(tiles_db):
+    """The tile server on a free port"""
+    server = TileServer(tiles_db, 0)
+    server.start()
+    yield server
+    server._server.shutdown()
+    server._server.server_close()
+
+
+def get(server: TileServer, path: str):
+    port = server._server.server_address[1]
+    return urllib.request.urlopen(f"http://localhost:{port}{path}", timeout=10)
+
+
+def test_tile_url_has_the_database_version(tiles_db):
+    server = TileServer(tiles_db, 0)
+    try:
+        filters = RentalFilters.from_selection((2021, 2023), ["2000"])
+        url = urllib.parse.urlparse(tile_url(server, filters))
+    finally:
+        server._server.server_close()
+
+    assert url.path == "/tiles/{z}/{x}/{y}.pbf"
+    query = urllib.parse.parse_qs(url.query)
+    assert query["filters"] == [filters.to_token()]
+    version = tiles_db.query('SELECT "version" FROM build_version')["version"][0]
+    assert query["version"] == [version]
+
+
+def test_tile(server):
+    filters = RentalFilters.from_selection((2021, 2023), ["2000", "2150"])
+    z, x, y = TILE
+    response = get(
+        server, f"/tiles/{z}/{x}/{y}.pbf?filters={filters.to_token()}&version=v1"
+    )
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "application/vnd.mapbox-vector-tile"
+    assert response.headers["Cache-Control"] == "private, max-age=3600"
+
+    tile = mapbox_vector_tile.decode(response.read())
+    features = tile[TILE_LAYER]["features"]
+    # only the postcodes of the filters, with their metrics
+    assert sorted(f["properties"]["postcode"] for f in features) == ["2000", "2150"]
+    assert all(f["properties"]["bonds"] > 0 for f in features)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/tiles/4/14/9.pbf?filters=not-a-token",
+        "/tiles/4/14/9.pbf",
+        "/tiles/4/14.pbf",
+        "/favicon.ico",
+    ],
+)
+def test_not_found(server, path):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(server, path)
+    assert error.value.code == 404
+
+
+def test_metrics(server):
+    filters = RentalFilters.from_selection((2021, 2023))
+    z, x, y = TILE
+    get(server, f"/tiles/{z}/{x}/{y}.pbf?filters={filters.to_token()}").read()
+
+    response = get(server, "/metrics")
+    assert response.status == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    text = response.read().decode()
+    assert "# TYPE dashboard_queries_total counter" in text
+    assert 'cache="miss"' in text
+    assert "dashboard_cache_entries " in text
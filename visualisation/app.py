@@ -1,10 +1,25 @@
 import streamlit as st
 
+from db import get_db
+from tiles import get_tile_server
+
 st.set_page_config(
     page_title="Hello",
     page_icon="👋",
 )
 
+# open the database and warm the cursors before the first stats page needs them
+db = get_db()
+# serves the tiles of the map and the metrics of the queries
+get_tile_server()
+
+if "diagnostics" in st.query_params:
+    # not a page, so not listed in the sidebar
+    from diagnostics import render
+
+    render(db)
+    st.stop()
+
 st.write("# Welcome to NSW rentals stats! 👋")
 
 st.sidebar.success("Select a stats above.")
@@ -0,0 +1,224 @@
+"""Results cache of the database queries.
+
+``st.cache_data`` keeps every result until its TTL expires, whatever its
+size, so a few sessions clicking through postcodes can fill the memory of
+the container. This cache keeps the results as Arrow tables, counts the
+bytes of their buffers and evicts the least recently used ones once a byte
+budget is exceeded.
+
+Behind it an optional disk cache stores the results as Arrow IPC files in a
+directory shared by the replicas of the dashboard, so a restarted container
+reads the aggregates computed by the others instead of computing them again.
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+
+if TYPE_CHECKING:
+    import duckdb
+
+logger = logging.getLogger(__name__)
+
+# byte budget of the cache, when DUCKDB_CACHE_BYTES is not set
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+# size cap of the disk cache, when DUCKDB_DISK_CACHE_BYTES is not set
+DEFAULT_DISK_CACHE_BYTES = 1024 * 1024 * 1024
+# age of the temporary files of the disk cache left by a crashed writer
+STALE_TMP_SECONDS = 3600
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    bytes: int
+    max_bytes: int
+
+
+def cache_key(query: str, parameters=None) -> tuple[str, str]:
+    """The same query and parameters give the same key, whatever the
+    indentation of the query or the order of named parameters"""
+    # the queries of the dashboard have no whitespace inside their literals
+    normalised = " ".join(query.split())
+    if isinstance(parameters, dict):
+        parameters = sorted(parameters.items())
+    elif parameters is not None:
+        parameters = list(parameters)
+    return normalised, repr(parameters)
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        # key -> (table, size in bytes, expiry time)
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key) -> pa.Table | None:
+        """The cached table, None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, table: pa.Table, ttl: float):
+        size = table.nbytes
+        # it would evict everything else and still not fit
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (table, size, time.monotonic() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+            )
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+def database_version(con: "duckdb.DuckDBPyConnection", path: str) -> str:
+    """Version stamped in the database when its tables were built.
+
+    The replicas run from the same image, so they get the same version for
+    the same data, whatever the modification time of their copy. A rebuilt
+    database gets a new version, the results cached for the old one are
+    never read again and end up evicted. The databases built before the
+    stamp (scripts/stamp_version.sql) get the digest of their file.
+    """
+    # not a query of the table: without it, DuckDB would look for a Python
+    # variable of the same name
+    stamp = con.execute(
+        "SELECT 1 FROM duckdb_tables() WHERE table_name = 'build_version'"
+    ).fetchall()
+    if stamp:
+        return con.execute('SELECT "version" FROM build_version').fetchone()[0]
+    logger.warning("No version stamp in %s, hashing the file", path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class DiskCache:
+    """Arrow IPC files of the results, named after the digest of their key
+    and of the database version.
+
+    Several processes can share the directory: the files are written to a
+    temporary name and renamed, so a reader never sees a partial file. They
+    are never modified afterwards. Reading a file touches it, when the
+    directory is over ``max_bytes`` the files read the longest time ago are
+    deleted, with the temporary files of the writers which crashed.
+    """
+
+    def __init__(self, directory: str, version: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.version = version
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, key) -> Path:
+        digest = hashlib.sha256(repr((self.version, key)).encode()).hexdigest()
+        return self.directory / f"{digest}.arrow"
+
+    def get(self, key) -> pa.Table | None:
+        path = self.path(key)
+        try:
+            with pa.OSFile(str(path)) as f:
+                table = pa.ipc.open_file(f).read_all()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, pa.ArrowInvalid) as e:
+            # evicted by another replica while reading, or unreadable,
+            # the query runs again
+            logger.warning("Cannot read the cached result %s: %s", path, e)
+            return None
+        return table
+
+    def put(self, key, table: pa.Table):
+        if table.nbytes > self.max_bytes:
+            return
+        path = self.path(key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    with pa.ipc.new_file(f, table.schema) as writer:
+                        writer.write_table(table)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._evict()
+        except OSError as e:
+            logger.warning("Cannot cache the result %s: %s", path, e)
+
+    def _evict(self):
+        with self._lock:
+            files = []
+            stale = time.time() - STALE_TMP_SECONDS
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".tmp") and stat.st_mtime < stale:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    # renamed or deleted by another replica
+                    continue
+                if entry.name.endswith(".arrow"):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    # deleted by another replica
+                    pass
+                total -= size
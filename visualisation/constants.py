@@ -1,6 +1,7 @@
 import streamlit as st
 
-from db import get_db
+from db import get_db, rental_domains
+from filters import RentalFilters
 
 housing_types = {
     "F": "Flat/unit",
@@ -11,6 +12,14 @@ housing_types = {
 }
 reversed_housing_types = {v: k for k, v in housing_types.items()}
 
+# areas the map can be restricted to: xmin, ymin, xmax, ymax in degrees
+map_areas = {
+    "New South Wales": None,
+    "Greater Sydney": (150.0, -34.4, 151.6, -33.0),
+    "Newcastle/Hunter": (150.9, -33.2, 152.4, -32.0),
+    "Wollongong/Illawarra": (150.6, -34.8, 151.1, -34.1),
+}
+
 disclaimer = """Some Notes:
 - The rentals with 5+ bedrooms are aggregated into the 5 category, This has a tendency to skew the data, so keep that in mind when looking at the data
 - For the Bedrooms a 0 may indicate a bedsitter or studio apartment, or rented premises such as a garage or car space.
@@ -19,25 +28,57 @@ disclaimer = """Some Notes:
 
 @st.cache_data
 def get_postcodes():
-    db = get_db()
-    postcodes = db.query('SELECT DISTINCT "postcode" FROM rentals')["postcode"].tolist()
-    return postcodes
+    return rental_domains(get_db())["postcodes"]
 
 
 @st.cache_data
 def get_dwelling_types():
-    db = get_db()
-    dwelling_types = db.query('SELECT DISTINCT "type" FROM rentals')["type"].tolist()
-    return dwelling_types
+    return rental_domains(get_db())["dwelling_types"]
 
 
 @st.cache_data
 def get_min_max_year():
-    db = get_db()
-    min_year, max_year = db.sql(
-        'SELECT MIN("lodgement_date"), MAX("lodgement_date") FROM rentals'
-    ).fetchone()
-    return min_year.year, max_year.year
+    domains = rental_domains(get_db())
+    return domains["min_date"].year, domains["max_date"].year
+
+
+def select_filters(key: str, max_bedrooms: int | None = None) -> RentalFilters:
+    """Display the postcode/dwelling type/year widgets and return the selection
+
+    :param key: prefix of the widgets keys, must be unique per page
+    :param max_bedrooms: only keep the rentals with at most this number of bedrooms
+    """
+    header_col1, header_col2 = st.columns(2)
+
+    with header_col1:
+        selected_postcodes = st.multiselect(
+            "Postcode", options=get_postcodes(), key=f"{key}-postcode"
+        )
+
+    with header_col2:
+        selected_dwelling_types = st.multiselect(
+            "Dwelling type",
+            options=reversed_housing_types.keys(),
+            key=f"{key}-dwelling-type",
+        )
+    selected_dwelling_types = [
+        reversed_housing_types[x] for x in selected_dwelling_types
+    ]
+
+    # get min max year from rentals
+    min_year, max_year = get_min_max_year()
+    year_choice = st.slider(
+        "Year",
+        min_value=min_year,
+        max_value=max_year,
+        value=(min_year, max_year),
+        step=1,
+        key=f"{key}-year",
+    )
+
+    return RentalFilters.from_selection(
+        year_choice, selected_postcodes, selected_dwelling_types, max_bedrooms
+    )
 
 
 def header(title):
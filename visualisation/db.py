@@ -1,9 +1,82 @@
-import pandas as pd
-from streamlit import cache_data
+import contextlib
+import math
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator
+
+import pyarrow as pa
 import streamlit as st
 from streamlit.connections import BaseConnection
 import duckdb
 
+from cache import (
+    DEFAULT_CACHE_BYTES,
+    DEFAULT_DISK_CACHE_BYTES,
+    DiskCache,
+    ResultCache,
+    cache_key,
+    database_version,
+)
+from filters import RentalFilters
+from metrics import DEFAULT_SLOW_QUERY_MS, QueryMetrics, QueryRecord
+from precomputed import (
+    DOMAINS_QUERY,
+    GRID_CELL_SIZE,
+    MONTHLY_ROLLUP_QUERY,
+    RENT_BIN_WIDTH,
+    RENT_BINS_QUERY,
+    TRIM_BOUNDS_QUERY,
+)
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pandas as pd
+
+# cursors of the pool, the number of queries running at the same time
+DEFAULT_POOL_SIZE = 4
+# slow statements profiled at the same time, each on a free cursor of the pool
+MAX_PROFILES = 1
+
+
+class CursorPool:
+    """A fixed set of cursors on one database, each leased to one caller at a
+    time, so concurrent sessions run their queries in parallel instead of
+    queueing on a single connection"""
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, size: int):
+        self.size = size
+        self._cursors = queue.Queue()
+        for _ in range(size):
+            cursor = con.cursor()
+            # warm the cursor, its first query pays for the connection setup
+            cursor.execute("SELECT 1").fetchall()
+            self._cursors.put(cursor)
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Borrow a cursor, waits for one to be returned if they are all used"""
+        cursor = self._cursors.get()
+        try:
+            yield cursor
+        finally:
+            self._cursors.put(cursor)
+
+    @contextlib.contextmanager
+    def try_lease(self) -> Iterator[duckdb.DuckDBPyConnection | None]:
+        """Borrow a cursor if one is free, None when they are all used"""
+        try:
+            cursor = self._cursors.get_nowait()
+        except queue.Empty:
+            yield None
+            return
+        try:
+            yield cursor
+        finally:
+            self._cursors.put(cursor)
+
 
 class DuckDBConnection(BaseConnection[duckdb.DuckDBPyConnection]):
     def _connect(self, **kwargs) -> duckdb.DuckDBPyConnection:
@@ -11,34 +84,579 @@ class DuckDBConnection(BaseConnection[duckdb.DuckDBPyConnection]):
             db = kwargs.pop("database")
         else:
             db = self._secrets["database"]
+        pool_size = kwargs.pop(
+            "pool_size", int(os.environ.get("DUCKDB_POOL_SIZE", DEFAULT_POOL_SIZE))
+        )
+        cache_bytes = kwargs.pop(
+            "cache_bytes",
+            int(os.environ.get("DUCKDB_CACHE_BYTES", DEFAULT_CACHE_BYTES)),
+        )
+        # optional, shared by the replicas of the dashboard
+        cache_dir = kwargs.pop("cache_dir", os.environ.get("DUCKDB_CACHE_DIR"))
+        disk_cache_bytes = kwargs.pop(
+            "disk_cache_bytes",
+            int(os.environ.get("DUCKDB_DISK_CACHE_BYTES", DEFAULT_DISK_CACHE_BYTES)),
+        )
+        slow_query_ms = kwargs.pop(
+            "slow_query_ms",
+            float(os.environ.get("DUCKDB_SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS)),
+        )
         con = duckdb.connect(database=db, **kwargs)
-        con.install_extension("spatial")
-        con.load_extension("spatial")
+        # the extension is loaded in the database, every cursor can use it
+        try:
+            con.load_extension("spatial")
+        except duckdb.IOException:
+            # first run on this machine
+            con.install_extension("spatial")
+            con.load_extension("spatial")
+        self._pool = CursorPool(con, pool_size)
+        self.cache = ResultCache(cache_bytes)
+        self.metrics = QueryMetrics(slow_query_ms)
+        self._profiles = threading.BoundedSemaphore(MAX_PROFILES)
+        self.disk_cache = None
+        self._database = db
+        self._version = None
+        if cache_dir:
+            self._version = database_version(con, db)
+            self.disk_cache = DiskCache(cache_dir, self._version, disk_cache_bytes)
         return con
 
+    @property
+    def version(self) -> str:
+        """Version of the content of the database, see cache.database_version"""
+        if self._version is None:
+            with self.lease() as cursor:
+                self._version = database_version(cursor, self._database)
+        return self._version
+
     def cursor(self) -> duckdb.DuckDBPyConnection:
+        """A new cursor, for results consumed after the call returns"""
         return self._instance.cursor()
 
+    def lease(self) -> contextlib.AbstractContextManager[duckdb.DuckDBPyConnection]:
+        """Borrow a cursor of the pool for the duration of a ``with`` block"""
+        return self._pool.lease()
+
     def sql(self, query: str, ttl: int = 3600, **kwargs) -> duckdb.DuckDBPyRelation:
-        # @cache_data(ttl=ttl)
-        # def _query(query: str, **kwargs) -> duckdb.DuckDBPyRelation:
-        #     cursor = self.cursor()
-        #     cursor.sql(query, **kwargs)
-        #     return cursor
+        # the relation is evaluated lazily, after this returns, so it gets its
+        # own cursor instead of one of the pool, and isn't in the metrics
+        return self.cursor().sql(query, **kwargs)
+
+    def query(self, query: str, ttl: int = 3600, **kwargs) -> "pd.DataFrame":
+        table = self.arrow(query, ttl=ttl, **kwargs)
+        # converted by DuckDB, the columns get the same types as with df()
+        df = self.cursor().from_arrow(table).df()
+        # but the ENUMs, read back from their Arrow dictionaries as strings
+        for field in table.schema:
+            if pa.types.is_dictionary(field.type):
+                # pandas only takes signed dictionary indices
+                signed = pa.dictionary(pa.int32(), field.type.value_type)
+                df[field.name] = table[field.name].cast(signed).to_pandas()
+        return df
+
+    def arrow(self, query: str, ttl: int = 3600, **kwargs) -> pa.Table:
+        """Run the query and return the result as an Arrow table
 
-        return self._instance.sql(query, **kwargs)
+        The columns are handed over as Arrow buffers, without going through
+        Python objects like ``fetchall`` does. The result is kept in the
+        results cache of the connection for ``ttl`` seconds, or until the
+        cache is full and it is the least recently used. With a disk cache
+        the result is also kept there, for the other replicas and the next
+        restarts.
 
-    def query(self, query: str, ttl: int = 3600, **kwargs) -> pd.DataFrame:
-        @cache_data(ttl=ttl)
-        def _query(query: str, **kwargs) -> pd.DataFrame:
-            cursor = self.cursor()
-            cursor.execute(query, **kwargs)
-            return cursor.df()
+        The statement is recorded in the metrics of the connection.
+        """
+        started, start = time.time(), time.perf_counter()
+        key = cache_key(query, kwargs.get("parameters"))
+        outcome = "memory"
+        table = self.cache.get(key)
+        if table is None:
+            outcome = "disk"
+            if self.disk_cache is not None:
+                table = self.disk_cache.get(key)
+            if table is None:
+                outcome = "miss"
+                with self.lease() as cursor:
+                    cursor.execute(query, **kwargs)
+                    table = cursor.arrow()
+                if self.disk_cache is not None:
+                    self.disk_cache.put(key, table)
+            self.cache.put(key, table, ttl)
 
-        return _query(query, **kwargs)
+        record = QueryRecord(
+            query=key[0],
+            started=started,
+            seconds=time.perf_counter() - start,
+            rows=table.num_rows,
+            bytes=table.nbytes,
+            cache=outcome,
+        )
+        if self.metrics.record(record):
+            # run again in the background, the page doesn't wait for it. When
+            # another profile is running it's left for a later run
+            if self._profiles.acquire(blocking=False):
+                threading.Thread(
+                    target=self._profile, args=(record, query, kwargs), daemon=True
+                ).start()
+            else:
+                self.metrics.skip_profile(record)
+        return table
+
+    def _profile(self, record: QueryRecord, query: str, kwargs: dict):
+        """Keep the profile of a slow statement, the tree of EXPLAIN ANALYZE"""
+        try:
+            # under load every cursor is used by the pages, they go first
+            with self._pool.try_lease() as cursor:
+                if cursor is None:
+                    self.metrics.skip_profile(record)
+                    return
+                self.metrics.add_profile(
+                    record, self._run_profiled(cursor, query, kwargs)
+                )
+        finally:
+            self._profiles.release()
+
+    def _run_profiled(
+        self, cursor: duckdb.DuckDBPyConnection, query: str, kwargs: dict
+    ) -> str:
+        # EXPLAIN ANALYZE doesn't take parameters, the profiler of a cursor
+        # writes the same tree for the statements it runs
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.txt")
+            try:
+                cursor.execute("SET enable_profiling = 'query_tree'")
+                cursor.execute(f"SET profiling_output = '{path}'")
+                cursor.execute(query, **kwargs).fetch_arrow_table()
+                with open(path) as f:
+                    return f.read()
+            except (duckdb.Error, OSError) as e:
+                return f"Profiling failed: {e}"
+            finally:
+                # the cursor goes back to the pool
+                cursor.execute("PRAGMA disable_profiling")
+                cursor.execute("RESET profiling_output")
+
+    def record_batches(
+        self, query: str, batch_size: int = 1_000_000, **kwargs
+    ) -> pa.RecordBatchReader:
+        """Stream the result of the query as Arrow record batches, not cached"""
+        cursor = self.cursor()
+        cursor.execute(query, **kwargs)
+        return cursor.fetch_record_batch(batch_size)
 
 
 def get_db() -> DuckDBConnection:
     return st.connection(
         "rentals", type=DuckDBConnection, database="rentals.duckdb", read_only=True
     )
+
+
+# simplification level of the postcode shapes (see scripts/simplify_geometry.py)
+# by number of postcodes shown, the more postcodes the coarser the shapes
+GEOMETRY_LEVELS = [(50, 0), (300, 1)]
+COARSEST_GEOMETRY_LEVEL = 2
+
+# columns the rent summary can be grouped by, computed from the rentals
+ROLLUP_DIMENSIONS = {
+    "month": "date_trunc('month', \"lodgement_date\")::DATE",
+    "month_of_year": "datepart('month', \"lodgement_date\")",
+    "year": "datepart('year', \"lodgement_date\")",
+    "postcode": '"postcode"',
+    "type": '"type"',
+    "bedrooms_corrected": 'CASE WHEN "bedrooms" > 5 THEN 5 ELSE "bedrooms" END',
+}
+
+
+def has_table(db: DuckDBConnection, name: str) -> bool:
+    tables = db.query(
+        "SELECT table_name FROM duckdb_tables() WHERE table_name = ?",
+        parameters=[name],
+    )
+    return len(tables) > 0
+
+
+def monthly_source(db: DuckDBConnection, filters: RentalFilters) -> str:
+    """Return the query reading the monthly rollup rows matching the filters.
+
+    The pre-aggregated ``rentals_monthly`` table is used when the database has
+    it and the filters allow it, otherwise the rollup is computed on the fly
+    from ``rentals``.
+    """
+    if filters.rollup_compatible and has_table(db, "rentals_monthly"):
+        where = filters.where("month", "bedrooms_corrected")
+        return f"SELECT * FROM rentals_monthly WHERE {where}"
+    return MONTHLY_ROLLUP_QUERY.format(where=filters.where())
+
+
+def rent_bins_source(db: DuckDBConnection, filters: RentalFilters) -> str:
+    """Return the query reading the bonds per rent bin matching the filters,
+    from ``rent_bins`` when the database has it and the filters allow it"""
+    if filters.rollup_compatible and has_table(db, "rent_bins"):
+        where = filters.where("month", "bedrooms_corrected")
+        return f"SELECT * FROM rent_bins WHERE {where}"
+    return RENT_BINS_QUERY.format(keys="", where=filters.where())
+
+
+def trim_bounds_source(db: DuckDBConnection) -> str:
+    """Return the query reading the 5%/95% weekly rent quantiles of the whole
+    table, globally and per bedrooms"""
+    if has_table(db, "rent_trim_bounds"):
+        return "SELECT * FROM rent_trim_bounds"
+    return TRIM_BOUNDS_QUERY
+
+
+def rental_domains(db: DuckDBConnection) -> dict:
+    """Values offered by the filter widgets: the sorted postcodes and dwelling
+    types, the first and last lodgement dates"""
+    if has_table(db, "rental_domains"):
+        query = "SELECT * FROM rental_domains"
+    else:
+        query = DOMAINS_QUERY
+    return db.arrow(query).to_pylist()[0]
+
+
+def rent_trends(
+    db: DuckDBConnection, filters: RentalFilters, months: int
+) -> "pd.DataFrame":
+    """Mean weekly rent per month and bedrooms, with its month to month change.
+
+    The rents outside of the global trim bounds are ignored. Per bedrooms:
+
+    - weekly_rent_pct_change: change from the previous month, in %
+    - weekly_rent_trend: change of the mean over the last ``months`` months
+      (null until there are ``months`` months), in %
+    - *_cumsum: the running sum of these changes
+
+    :param months: number of months of the rolling mean
+    """
+    query = f"""
+WITH bounds AS (
+    SELECT "lower_bound", "upper_bound"
+    FROM ({trim_bounds_source(db)})
+    WHERE "all_bedrooms"
+),
+monthly AS (
+    SELECT
+        date_trunc('month', "lodgement_date") AS "month",
+        "bedrooms",
+        AVG("weekly_rent") AS "weekly_rent"
+    FROM rentals, bounds
+    WHERE {filters.where()}
+        AND "bedrooms" > 0
+        -- remove outliers
+        AND "weekly_rent" > "lower_bound"
+        AND "weekly_rent" < "upper_bound"
+    GROUP BY 1, 2
+),
+rolling AS (
+    SELECT
+        *,
+        CASE WHEN COUNT(*) OVER trend = $months THEN AVG("weekly_rent") OVER trend END
+            AS "weekly_rent_rolling",
+        ("weekly_rent" / lag("weekly_rent") OVER months - 1) * 100
+            AS "weekly_rent_pct_change"
+    FROM monthly
+    WINDOW
+        months AS (PARTITION BY "bedrooms" ORDER BY "month"),
+        trend AS (
+            PARTITION BY "bedrooms" ORDER BY "month"
+            ROWS BETWEEN $months - 1 PRECEDING AND CURRENT ROW
+        )
+),
+changes AS (
+    SELECT
+        * EXCLUDE ("weekly_rent_rolling"),
+        ("weekly_rent_rolling" / lag("weekly_rent_rolling") OVER months - 1) * 100
+            AS "weekly_rent_trend"
+    FROM rolling
+    WINDOW months AS (PARTITION BY "bedrooms" ORDER BY "month")
+)
+SELECT
+    *,
+    -- the running sums skip the months without a change
+    CASE WHEN "weekly_rent_pct_change" IS NOT NULL
+        THEN SUM("weekly_rent_pct_change") OVER months
+    END AS "weekly_rent_pct_change_cumsum",
+    CASE WHEN "weekly_rent_trend" IS NOT NULL
+        THEN SUM("weekly_rent_trend") OVER months
+    END AS "weekly_rent_trend_cumsum"
+FROM changes
+WINDOW months AS (PARTITION BY "bedrooms" ORDER BY "month")
+ORDER BY "month", "bedrooms"
+"""
+    return db.query(query, parameters={**filters.parameters(), "months": months})
+
+
+def rent_summary(
+    db: DuckDBConnection, by: list[str], filters: RentalFilters, median: bool = False
+) -> "pd.DataFrame":
+    """Number of bonds and mean/min/max weekly rent grouped by ``by``.
+
+    Computed from the monthly rollup: the counts and sums are added up. The
+    median doesn't add up, with ``median`` everything is computed from the
+    rentals in one scan instead, still faster than merging per cell
+    distributions (see precomputed.py).
+
+    :param by: the dimensions to group by, see ROLLUP_DIMENSIONS
+    :param filters: the rows to take into account
+    :param median: also return the median weekly rent
+    """
+    if len(by) == 0 or any(dimension not in ROLLUP_DIMENSIONS for dimension in by):
+        raise ValueError(f"Can only group by {tuple(ROLLUP_DIMENSIONS)}, got {by}")
+
+    group = ", ".join(f'"{dimension}"' for dimension in by)
+
+    if median:
+        dimensions = ",\n    ".join(
+            f'{ROLLUP_DIMENSIONS[dimension]} AS "{dimension}"' for dimension in by
+        )
+        query = f"""
+SELECT
+    {dimensions},
+    COUNT(*)::BIGINT AS "bonds",
+    AVG("weekly_rent") AS "mean_weekly_rent",
+    MIN("weekly_rent") AS "min_weekly_rent",
+    MAX("weekly_rent") AS "max_weekly_rent",
+    median("weekly_rent") AS "median_weekly_rent"
+FROM rentals
+WHERE {filters.where()}
+GROUP BY ALL
+ORDER BY {group}
+"""
+    else:
+        query = f"""
+SELECT
+    {group},
+    SUM("bonds")::BIGINT AS "bonds",
+    SUM("rent_sum") / SUM("rent_count") AS "mean_weekly_rent",
+    MIN("rent_min") AS "min_weekly_rent",
+    MAX("rent_max") AS "max_weekly_rent"
+FROM (
+    SELECT
+        *,
+        datepart('month', "month") AS "month_of_year",
+        datepart('year', "month") AS "year"
+    FROM ({monthly_source(db, filters)})
+)
+GROUP BY ALL
+ORDER BY {group}
+"""
+    return db.query(query, parameters=filters.parameters())
+
+
+def rent_bounds(
+    db: DuckDBConnection,
+    filters: RentalFilters,
+    lower: float = 0.05,
+    upper: float = 0.95,
+) -> tuple[float, float]:
+    """The ``lower`` and ``upper`` quantiles of the weekly rent, the rents
+    outside of them are considered outliers"""
+    query = f"""
+SELECT
+    QUANTILE_CONT("weekly_rent", $lower) AS "lower_bound",
+    QUANTILE_CONT("weekly_rent", $upper) AS "upper_bound"
+FROM rentals
+WHERE {filters.where()}
+"""
+    bounds = db.query(
+        query, parameters={**filters.parameters(), "lower": lower, "upper": upper}
+    )
+    return float(bounds["lower_bound"][0]), float(bounds["upper_bound"][0])
+
+
+def trimmed_monthly_stats(
+    db: DuckDBConnection, filters: RentalFilters, bounds: tuple[float, float]
+) -> "pd.DataFrame":
+    """Mean/min/max/median weekly rent per month and bedrooms (5+ merged),
+    of the rents within ``bounds``"""
+    query = f"""
+SELECT
+    date_trunc('month', "lodgement_date") AS "month",
+    CASE WHEN "bedrooms" > 5 THEN 5 ELSE "bedrooms" END AS "bedrooms",
+    AVG("weekly_rent") AS "weekly_rent",
+    MIN("weekly_rent") AS "min_weekly_rent",
+    MAX("weekly_rent") AS "max_weekly_rent",
+    median("weekly_rent") AS "median_weekly_rent"
+FROM rentals
+WHERE {filters.where()}
+    AND "weekly_rent" BETWEEN $lower_bound AND $upper_bound
+GROUP BY 1, 2
+ORDER BY 1, 2
+"""
+    lower_bound, upper_bound = bounds
+    return db.query(
+        query,
+        parameters={
+            **filters.parameters(),
+            "lower_bound": lower_bound,
+            "upper_bound": upper_bound,
+        },
+    )
+
+
+def rent_histogram(
+    db: DuckDBConnection,
+    filters: RentalFilters,
+    bounds: tuple[float, float],
+    nbins: int = 20,
+) -> "pd.DataFrame":
+    """Number of bonds per weekly rent bin and bedrooms (5+ merged).
+
+    The rents within ``bounds`` (see ``rent_bounds``) are split in up to
+    ``nbins`` bins of the same width. The bins are made of the $10 bins of
+    rent_bins, whose counts are added up: the first bin starts up to $10
+    before the lower bound, the last one ends up to a bin after the upper
+    bound. Every bin of every bedrooms is returned (empty ones with 0 bonds)
+    so the size of the result doesn't depend on the number of lodgements.
+    """
+    lower_bound, upper_bound = bounds
+    if not (math.isfinite(lower_bound) and math.isfinite(upper_bound)):
+        # no rent in the selection
+        lower_bound = upper_bound = 0
+    start = math.floor(lower_bound / RENT_BIN_WIDTH) * RENT_BIN_WIDTH
+    # end of the bin holding the upper bound
+    end = (math.floor(upper_bound / RENT_BIN_WIDTH) + 1) * RENT_BIN_WIDTH
+    width = math.ceil((end - start) / nbins / RENT_BIN_WIDTH) * RENT_BIN_WIDTH
+    # as many whole bins as needed to cover the bounds
+    nbins = math.ceil((end - start) / width)
+    end = start + nbins * width
+    query = f"""
+WITH bins AS (
+    SELECT "bedrooms_corrected", "rent_bin" * {RENT_BIN_WIDTH} AS "rent", "bonds"
+    FROM ({rent_bins_source(db, filters)})
+),
+counts AS (
+    SELECT
+        "bedrooms_corrected",
+        (("rent" - $start) // $width)::INTEGER AS "bin",
+        SUM("bonds") AS "bonds"
+    FROM bins
+    WHERE "rent" >= $start AND "rent" < $end
+    GROUP BY ALL
+)
+SELECT
+    "bedrooms_corrected",
+    $start + "bin" * $width AS "bin_start",
+    $start + ("bin" + 1) * $width AS "bin_end",
+    coalesce("bonds", 0)::BIGINT AS "bonds"
+FROM (SELECT DISTINCT "bedrooms_corrected" FROM bins)
+CROSS JOIN range($nbins) AS edges("bin")
+LEFT JOIN counts USING ("bedrooms_corrected", "bin")
+ORDER BY "bedrooms_corrected", "bin_start"
+"""
+    return db.query(
+        query,
+        parameters={
+            **filters.parameters(),
+            "nbins": nbins,
+            "start": start,
+            "end": end,
+            "width": width,
+        },
+    )
+
+
+def geometry_level(postcodes: int) -> int:
+    """Simplification level of the shapes to display ``postcodes`` postcodes"""
+    for max_postcodes, level in GEOMETRY_LEVELS:
+        if postcodes <= max_postcodes:
+            return level
+    return COARSEST_GEOMETRY_LEVEL
+
+
+def postcode_shapes(db: DuckDBConnection, postcodes: list[str]) -> "gpd.GeoDataFrame":
+    """Shape and centroid of the postcodes.
+
+    The shapes are read from the simplification level matching the number of
+    postcodes, or at full resolution from ``suburbs`` when the database was
+    built without the postcode shapes.
+    """
+    if has_table(db, "postcode_shapes"):
+        query = """
+SELECT
+    shapes."geometry",
+    "postcode",
+    extents."centroid_lon",
+    extents."centroid_lat"
+FROM postcode_shapes AS shapes
+JOIN postcode_extents AS extents USING ("postcode")
+WHERE shapes."level" = $level AND list_contains($postcodes, "postcode")
+"""
+        parameters = {"postcodes": postcodes, "level": geometry_level(len(postcodes))}
+    else:
+        query = """
+SELECT
+    ST_AsWKB("geometry") AS "geometry",
+    "postcode",
+    ST_X(ST_Centroid("geometry")) AS "centroid_lon",
+    ST_Y(ST_Centroid("geometry")) AS "centroid_lat"
+FROM suburbs
+WHERE list_contains($postcodes, "postcode")
+"""
+        parameters = {"postcodes": postcodes}
+    return to_geodataframe(db.arrow(query, parameters=parameters))
+
+
+def postcodes_in_bbox(
+    db: DuckDBConnection, bbox: tuple[float, float, float, float]
+) -> list[str]:
+    """The postcodes whose bounding box intersects ``bbox``.
+
+    The candidates are looked up in the postcode_grid index, then their
+    bounding boxes checked. Without the index every bounding box of
+    postcode_extents is checked, without the extents every suburb geometry.
+
+    :param bbox: xmin, ymin, xmax, ymax in degrees
+    """
+    xmin, ymin, xmax, ymax = bbox
+    parameters = {"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax}
+    overlaps = """
+    extents."xmin" <= $xmax AND extents."xmax" >= $xmin
+    AND extents."ymin" <= $ymax AND extents."ymax" >= $ymin
+"""
+    if has_table(db, "postcode_grid"):
+        query = f"""
+SELECT DISTINCT "postcode"
+FROM postcode_grid AS grid
+JOIN postcode_extents AS extents USING ("postcode")
+WHERE grid."cell_x" BETWEEN floor($xmin / $cell_size) AND floor($xmax / $cell_size)
+    AND grid."cell_y" BETWEEN floor($ymin / $cell_size) AND floor($ymax / $cell_size)
+    AND {overlaps}
+ORDER BY "postcode"
+"""
+        parameters["cell_size"] = GRID_CELL_SIZE
+    elif has_table(db, "postcode_extents"):
+        query = f"""
+SELECT "postcode" FROM postcode_extents AS extents
+WHERE {overlaps}
+ORDER BY "postcode"
+"""
+    else:
+        query = """
+SELECT "postcode" FROM suburbs
+WHERE ST_Intersects("geometry", ST_MakeEnvelope($xmin, $ymin, $xmax, $ymax))
+ORDER BY "postcode"
+"""
+    return db.query(query, parameters=parameters)["postcode"].tolist()
+
+
+def to_geodataframe(
+    table: pa.Table, geometry: str = "geometry", crs: str = "4326"
+) -> "gpd.GeoDataFrame":
+    """Build a GeoDataFrame from an Arrow table with a WKB geometry column
+
+    All the geometries are parsed in a single vectorized call, the other
+    columns are converted column by column
+    """
+    # only the map page needs it, it takes longer to import than the rest
+    # of the dashboard
+    import geopandas as gpd
+
+    wkb = table[geometry].combine_chunks().to_numpy(zero_copy_only=False)
+    return gpd.GeoDataFrame(
+        table.drop_columns([geometry]).to_pandas(),
+        # builds the geometry array straight from the WKB, going through an
+        # array of shapely objects makes geopandas check every element
+        geometry=gpd.GeoSeries.from_wkb(wkb, crs=crs),
+    )
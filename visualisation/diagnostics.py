@@ -0,0 +1,89 @@
+"""Diagnostics of the database queries, shown by app.py when opened with
+``?diagnostics=1``, so the view isn't listed in the sidebar.
+
+The statements recorded by the connection (see metrics.py), by query, the
+latest ones and the profiles of the slow ones.
+"""
+
+import datetime
+
+import pandas as pd
+import streamlit as st
+
+from db import DuckDBConnection
+from metrics import query_id
+
+MIB = 1024 * 1024
+
+
+def render(db: DuckDBConnection):
+    st.write("# Query diagnostics")
+
+    cache = db.cache.stats()
+    hits, misses, entries, size = st.columns(4)
+    hits.metric("Cache hits", cache.hits)
+    misses.metric("Cache misses", cache.misses)
+    entries.metric("Cached results", cache.entries)
+    size.metric(
+        "Cache size", f"{cache.bytes / MIB:.0f} / {cache.max_bytes / MIB:.0f} MiB"
+    )
+
+    st.write("## Queries")
+    totals = pd.DataFrame(
+        [
+            {
+                "id": query_id(query),
+                "count": x.count,
+                "total_ms": x.seconds * 1000,
+                "mean_ms": x.seconds / x.count * 1000,
+                "max_ms": x.max_seconds * 1000,
+                "rows": x.rows,
+                "MiB": x.bytes / MIB,
+                "memory": x.outcomes["memory"],
+                "disk": x.outcomes["disk"],
+                "miss": x.outcomes["miss"],
+                "query": query,
+            }
+            for query, x in db.metrics.totals().items()
+        ]
+    )
+    if totals.empty:
+        st.info("No query run yet")
+        return
+    st.dataframe(
+        totals.sort_values("total_ms", ascending=False).round(1),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    st.write(f"## Slow queries (over {db.metrics.slow_seconds * 1000:.0f} ms)")
+    slow = db.metrics.slow_queries()
+    if not slow:
+        st.info("No slow query")
+    for x in slow:
+        started = datetime.datetime.fromtimestamp(x.record.started)
+        with st.expander(
+            f"{query_id(x.record.query)}: {x.record.seconds * 1000:.0f} ms, "
+            f"{x.record.rows} rows, at {started:%H:%M:%S}"
+        ):
+            st.code(x.record.query, language="sql")
+            st.code(x.profile, language=None)
+
+    st.write("## Latest statements")
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {
+                    "started": datetime.datetime.fromtimestamp(x.started),
+                    "id": query_id(x.query),
+                    "ms": round(x.seconds * 1000, 1),
+                    "rows": x.rows,
+                    "bytes": x.bytes,
+                    "cache": x.cache,
+                }
+                for x in db.metrics.recent()
+            ]
+        ),
+        hide_index=True,
+        use_container_width=True,
+    )
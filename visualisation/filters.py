@@ -0,0 +1,112 @@
+import base64
+import json
+import zlib
+from dataclasses import dataclass, replace
+from datetime import date
+from typing import Iterable
+
+
+@dataclass(frozen=True)
+class RentalFilters:
+    """The selection made with the widgets at the top of the pages.
+
+    The filters always compile to the same SQL text, only the bound parameters
+    change, so every page can share the same cached results for the same
+    selection.
+    Build it with ``from_selection`` to get a normalised instance: sorted
+    and deduplicated postcodes/dwelling types, ordered year range.
+
+    The years are compared as a half-open date range on the raw column, so
+    DuckDB can skip the row groups outside of it using their min/max stats.
+    """
+
+    years: tuple[int, int]
+    postcodes: tuple[str, ...] = ()
+    dwelling_types: tuple[str, ...] = ()
+    max_bedrooms: int | None = None
+
+    @classmethod
+    def from_selection(
+        cls,
+        year_choice: Iterable[int],
+        selected_postcodes: Iterable[str] = (),
+        selected_dwelling_types: Iterable[str] = (),
+        max_bedrooms: int | None = None,
+    ) -> "RentalFilters":
+        first_year, last_year = sorted(int(year) for year in year_choice)
+        return cls(
+            years=(first_year, last_year),
+            postcodes=tuple(sorted({str(x) for x in selected_postcodes})),
+            dwelling_types=tuple(sorted(set(selected_dwelling_types))),
+            max_bedrooms=max_bedrooms,
+        )
+
+    def within_postcodes(self, postcodes: Iterable[str]) -> "RentalFilters | None":
+        """The same filters, further restricted to ``postcodes``.
+
+        None when none of the selected postcodes is in ``postcodes``: filters
+        without postcodes would match all of them instead of none.
+        """
+        postcodes = {str(x) for x in postcodes}
+        if self.postcodes:
+            postcodes &= set(self.postcodes)
+        if not postcodes:
+            return None
+        return replace(self, postcodes=tuple(sorted(postcodes)))
+
+    def to_token(self) -> str:
+        """The filters as a URL safe string, see ``from_token``"""
+        fields = [
+            list(self.years),
+            list(self.postcodes),
+            list(self.dwelling_types),
+            self.max_bedrooms,
+        ]
+        data = zlib.compress(json.dumps(fields, separators=(",", ":")).encode())
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    @classmethod
+    def from_token(cls, token: str) -> "RentalFilters":
+        """The filters of ``to_token``, ValueError when the token is invalid"""
+        try:
+            data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            years, postcodes, dwelling_types, max_bedrooms = json.loads(
+                zlib.decompress(data)
+            )
+            return cls.from_selection(
+                years,
+                postcodes,
+                dwelling_types,
+                None if max_bedrooms is None else int(max_bedrooms),
+            )
+        except (TypeError, ValueError, zlib.error) as e:
+            raise ValueError(f"Invalid filters token {token!r}") from e
+
+    @property
+    def rollup_compatible(self) -> bool:
+        """Whether the monthly rollup can answer a query with these filters.
+
+        The rollup only knows about ``bedrooms_corrected`` (5+ bedrooms are
+        merged into 5), so a cap of 5 or more needs the raw rows.
+        """
+        return self.max_bedrooms is None or self.max_bedrooms < 5
+
+    def where(
+        self, date_column: str = "lodgement_date", bedrooms_column: str = "bedrooms"
+    ) -> str:
+        """The WHERE clause, with named parameters from ``parameters()``"""
+        return f"""
+    "{date_column}" >= $start_date AND "{date_column}" < $end_date
+    AND (len($postcodes::VARCHAR[]) = 0 OR list_contains($postcodes, "postcode"))
+    AND (len($dwelling_types::VARCHAR[]) = 0 OR list_contains($dwelling_types, "type"))
+    AND ($max_bedrooms::INTEGER IS NULL OR "{bedrooms_column}" <= $max_bedrooms)
+"""
+
+    def parameters(self) -> dict:
+        return {
+            "start_date": date(self.years[0], 1, 1),
+            "end_date": date(self.years[1] + 1, 1, 1),
+            "postcodes": list(self.postcodes),
+            "dwelling_types": list(self.dwelling_types),
+            "max_bedrooms": self.max_bedrooms,
+        }
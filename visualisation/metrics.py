@@ -0,0 +1,194 @@
+"""Timings of the database queries.
+
+Every statement run by ``DuckDBConnection.arrow``, and so by ``query``, is
+recorded with its wall time, the rows and bytes of its result and where the
+result came from: the memory cache, the disk cache or the database. The
+statements run on the database slower than the threshold are logged, and
+run once more with the profiler of DuckDB to keep their profile, the tree of
+``EXPLAIN ANALYZE``: one at a time, on a cursor of the pool when one is
+free, so the profiles never slow down the pages under load.
+
+The totals are served in the Prometheus text format on ``/metrics`` by the
+tile server (see tiles.py) and shown by the diagnostics view of app.py,
+opened with ``?diagnostics=1``.
+"""
+
+import collections
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field, replace
+
+from cache import CacheStats
+
+logger = logging.getLogger(__name__)
+
+# statements slower than this are profiled, when DUCKDB_SLOW_QUERY_MS is not set
+DEFAULT_SLOW_QUERY_MS = 500
+# statements kept for the diagnostics view
+MAX_RECENT_QUERIES = 200
+# profiles kept, the oldest are dropped first
+MAX_SLOW_QUERIES = 50
+
+# where the result of a statement came from
+CACHE_OUTCOMES = ("memory", "disk", "miss")
+
+
+def query_id(query: str) -> str:
+    """A short stable identifier of a normalised query, for the labels"""
+    return hashlib.sha256(query.encode()).hexdigest()[:12]
+
+
+@dataclass(frozen=True)
+class QueryRecord:
+    # normalised, see cache.cache_key
+    query: str
+    # unix time the statement started
+    started: float
+    seconds: float
+    rows: int
+    bytes: int
+    cache: str
+
+
+@dataclass
+class QueryTotals:
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    outcomes: collections.Counter = field(default_factory=collections.Counter)
+
+
+@dataclass(frozen=True)
+class SlowQuery:
+    record: QueryRecord
+    profile: str
+
+
+class QueryMetrics:
+    def __init__(self, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS):
+        self.slow_seconds = slow_query_ms / 1000
+        self._lock = threading.Lock()
+        self._recent: collections.deque = collections.deque(maxlen=MAX_RECENT_QUERIES)
+        self._totals: dict[str, QueryTotals] = {}
+        # query -> latest profile, in the order they were captured
+        self._slow: collections.OrderedDict = collections.OrderedDict()
+        # queries being profiled, each is profiled once at a time
+        self._profiling: set[str] = set()
+
+    def record(self, record: QueryRecord) -> bool:
+        """Record a statement, True when its profile should be captured"""
+        with self._lock:
+            self._recent.append(record)
+            totals = self._totals.setdefault(record.query, QueryTotals())
+            totals.count += 1
+            totals.seconds += record.seconds
+            totals.max_seconds = max(totals.max_seconds, record.seconds)
+            totals.rows += record.rows
+            totals.bytes += record.bytes
+            totals.outcomes[record.cache] += 1
+            # the cached results are only read, nothing to profile
+            if record.cache != "miss" or record.seconds < self.slow_seconds:
+                return False
+            logger.warning(
+                "Slow query %s: %.0f ms, %d rows",
+                query_id(record.query),
+                record.seconds * 1000,
+                record.rows,
+            )
+            if record.query in self._slow or record.query in self._profiling:
+                return False
+            self._profiling.add(record.query)
+            return True
+
+    def skip_profile(self, record: QueryRecord):
+        """The profile wasn't captured, it is tried again on the next slow run"""
+        with self._lock:
+            self._profiling.discard(record.query)
+
+    def add_profile(self, record: QueryRecord, profile: str):
+        with self._lock:
+            self._profiling.discard(record.query)
+            self._slow[record.query] = SlowQuery(record, profile)
+            self._slow.move_to_end(record.query)
+            while len(self._slow) > MAX_SLOW_QUERIES:
+                self._slow.popitem(last=False)
+
+    def recent(self) -> list[QueryRecord]:
+        """The latest statements, the most recent first"""
+        with self._lock:
+            return list(reversed(self._recent))
+
+    def totals(self) -> dict[str, QueryTotals]:
+        with self._lock:
+            return {
+                query: replace(totals, outcomes=collections.Counter(totals.outcomes))
+                for query, totals in self._totals.items()
+            }
+
+    def slow_queries(self) -> list[SlowQuery]:
+        """The profiles of the slow queries, the most recent first"""
+        with self._lock:
+            return list(reversed(self._slow.values()))
+
+    def prometheus(self, cache: CacheStats | None = None) -> str:
+        """The totals in the Prometheus text format, with the results cache"""
+        lines = []
+
+        def metric(name: str, kind: str, help: str, samples: list[tuple[str, float]]):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+        totals = self.totals()
+        ids = {query: query_id(query) for query in totals}
+        metric(
+            "dashboard_queries_total",
+            "counter",
+            "Statements run, by where their result came from",
+            [
+                (f'{{query="{ids[query]}",cache="{outcome}"}}', x.outcomes[outcome])
+                for query, x in totals.items()
+                for outcome in CACHE_OUTCOMES
+            ],
+        )
+        for name, kind, help, value in [
+            ("seconds_total", "counter", "Wall time", lambda x: x.seconds),
+            ("seconds_max", "gauge", "Slowest statement", lambda x: x.max_seconds),
+            ("rows_total", "counter", "Rows returned", lambda x: x.rows),
+            ("bytes_total", "counter", "Bytes of the results", lambda x: x.bytes),
+        ]:
+            metric(
+                f"dashboard_query_{name}",
+                kind,
+                help,
+                [
+                    (f'{{query="{ids[query]}"}}', value(x))
+                    for query, x in totals.items()
+                ],
+            )
+        metric(
+            "dashboard_slow_queries",
+            "gauge",
+            "Queries with a captured profile",
+            [("", len(self.slow_queries()))],
+        )
+        if cache is not None:
+            for name, kind in [
+                ("hits", "counter"),
+                ("misses", "counter"),
+                ("evictions", "counter"),
+                ("entries", "gauge"),
+                ("bytes", "gauge"),
+                ("max_bytes", "gauge"),
+            ]:
+                suffix = "_total" if kind == "counter" else ""
+                metric(
+                    f"dashboard_cache_{name}{suffix}",
+                    kind,
+                    f"Results cache {name.replace('_', ' ')}",
+                    [("", getattr(cache, name))],
+                )
+        return "\n".join(lines) + "\n"
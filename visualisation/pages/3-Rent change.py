@@ -1,14 +1,9 @@
 import streamlit as st
 
 import constants
-from constants import (
-    reversed_housing_types,
-    get_postcodes,
-    get_min_max_year,
-)
 import plotly.express as px
 
-from db import get_db
+from db import get_db, rent_trends
 
 st.set_page_config(page_title="Rentals stats", layout="wide")
 
@@ -16,107 +11,15 @@ db = get_db()
 
 st.markdown(constants.disclaimer)
 
-
-header_col1, header_col2 = st.columns(2)
-
-with header_col1:
-    selected_postcodes = st.multiselect(
-        "Postcode", options=get_postcodes(), key="3-postcode"
-    )
-
-with header_col2:
-    selected_dwelling_types = st.multiselect(
-        "Dwelling type", options=reversed_housing_types.keys(), key="3-dwelling-type"
-    )
-selected_dwelling_types = [reversed_housing_types[x] for x in selected_dwelling_types]
-
-# get min max year from rentals
-min_year, max_year = get_min_max_year()
-year_choice = st.slider(
-    "Year",
-    min_value=min_year,
-    max_value=max_year,
-    value=(min_year, max_year),
-    step=1,
-    key="3-year",
-)
+filters = constants.select_filters("3", max_bedrooms=5)
 
 # Select 2 to 12 months for the trend
 month_trend = st.slider("Select the number of months for the trend", 2, 12, 4)
 
 
-# Get the base stats
-rentals_per_bedroom = (
-    db.sql(
-        """
-SELECT 
-    *,
-    datetrunc('month', "lodgement_date") AS "month",
-FROM rentals where 
-    "bedrooms" > 0 and "bedrooms" <= 5
-    -- remove outliers
-    AND "weekly_rent" > (SELECT QUANTILE_CONT(weekly_rent, 0.05) FROM rentals)
-    AND "weekly_rent" < (SELECT QUANTILE_CONT(weekly_rent, 0.95)  FROM rentals) 
-order by "lodgement_date", "bedrooms"
-"""
-    )
-    .filter(f"datepart('year', \"lodgement_date\") >= {year_choice[0]}")
-    .filter(f"datepart('year',\"lodgement_date\") <= {year_choice[1]}")
-)
-
-if len(selected_postcodes) > 0:
-    rentals_per_bedroom = rentals_per_bedroom.filter(
-        f'postcode IN ({",".join(selected_postcodes)})'
-    )
-
-if len(selected_dwelling_types) > 0:
-    # prepare for SQL
-    selected_dwelling_types = ",".join([f"'{x}'" for x in selected_dwelling_types])
-    rentals_per_bedroom = rentals_per_bedroom.filter(
-        '"type" IN ({})'.format(selected_dwelling_types)
-    )
-
-df_rentals = rentals_per_bedroom
-
-
-# Calculate the mean weekly rent per bedroom
-df_rentals = (
-    rentals_per_bedroom.df()
-    .groupby(["month", "bedrooms"])
-    .agg({"weekly_rent": "mean"})
-    .reset_index()
-)
-
-# do a rolling mean of the weekly rent
-df_rentals["weekly_rent_trend"] = (
-    df_rentals.groupby("bedrooms")["weekly_rent"]
-    .rolling(month_trend)
-    .mean()
-    .reset_index(0, drop=True)
-)
-# # fill the NaN with 0
-# df_rentals["weekly_rent_trend"] = df_rentals["weekly_rent_trend"].fillna(0)
-
-# calculate the percentage change
-df_rentals["weekly_rent_pct_change"] = (
-    df_rentals.groupby("bedrooms")["weekly_rent"].pct_change()
-) * 100
-
-# do a cumsum of the pct change
-df_rentals["weekly_rent_pct_change_cumsum"] = df_rentals.groupby("bedrooms")[
-    "weekly_rent_pct_change"
-].cumsum()
-
-# do a percentage change of the rolling mean
-df_rentals["weekly_rent_trend"] = (
-    df_rentals.groupby("bedrooms")["weekly_rent_trend"].pct_change()
-) * 100
-
-
-# do a cumsum of the pct change
-df_rentals["weekly_rent_trend_cumsum"] = df_rentals.groupby("bedrooms")[
-    "weekly_rent_trend"
-].cumsum()
+# Calculate the mean weekly rent per bedroom and month, its rolling mean,
+# percentage changes and their cumsum, all in DuckDB
+df_rentals = rent_trends(db, filters, month_trend)
 
 
 def make_trend_graph(df, y, title):
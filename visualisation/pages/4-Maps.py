@@ -1,17 +1,15 @@
+import math
+
 import pandas as pd
+import pydeck as pdk
 import streamlit as st
 
 import constants
-from constants import (
-    reversed_housing_types,
-    get_min_max_year,
-    get_postcodes,
-)
-import geopandas as gpd
-
-from streamlit_folium import st_folium
 
-from db import get_db
+from db import get_db, has_table, postcode_shapes, postcodes_in_bbox, rent_summary
+from filters import RentalFilters
+from precomputed import TILE_MAX_ZOOM, TILE_MIN_ZOOM
+from tiles import get_tile_server, postcode_metrics, tile_url
 
 st.set_page_config(page_title="Rentals stats", layout="wide")
 
@@ -19,112 +17,115 @@ db = get_db()
 
 st.markdown(constants.disclaimer)
 
-header_col1, header_col2 = st.columns(2)
+filters = constants.select_filters("4")
 
-with header_col1:
-    selected_postcodes = st.multiselect("Postcode", options=get_postcodes())
+area = st.selectbox("Area", options=constants.map_areas.keys(), key="4-area")
+bbox = constants.map_areas[area]
+if bbox is not None:
+    # only the postcodes of the area, their shapes and rents are fetched
+    filters = filters.within_postcodes(postcodes_in_bbox(db, bbox))
+    if filters is None:
+        st.info(f"None of the selected postcodes is in {area}")
+        st.stop()
 
-with header_col2:
-    selected_dwelling_types = st.multiselect(
-        "Dwelling type", options=reversed_housing_types.keys()
-    )
-selected_dwelling_types = [reversed_housing_types[x] for x in selected_dwelling_types]
-
-# get min max year from rentals
-min_year, max_year = get_min_max_year()
-year_choice = st.slider(
-    "Year", min_value=min_year, max_value=max_year, value=(min_year, max_year), step=1
-)
-
-
-@st.cache_data
-def rental_per_bedroom(
-    year_choice: list[int],
-    selected_dwelling_types: list[str],
-    selected_postcodes: list[str],
-) -> pd.DataFrame:
-    args = []
-    if len(selected_dwelling_types) > 0:
-        # prepare for SQL
-        selected_dwellings = ",".join([f"'{x}'" for x in selected_dwelling_types])
-        args.append('"type" IN ({})'.format(selected_dwellings))
-    if len(selected_postcodes) > 0:
-        args.append(f'rentals.postcode IN ({",".join(selected_postcodes)})')
-
-    if len(args) > 0:
-        args = f'AND {" AND ".join(args)}'
-    else:
-        args = ""
-    # bar graph of number of rentals per number of bedrooms
-    # rentals_per_bedroom = db.sql(
-    #     f"""
-    # SELECT
-    #     rentals.postcode as postcode,
-    #     round(AVG("weekly_rent"), 2) AS "Weekly rent"
-    # FROM rentals
-    # WHERE
-    #     datepart('year', \"lodgement_date\") >= {year_choice[0]}
-    #     AND datepart('year',\"lodgement_date\") <= {year_choice[1]}
-    #     {args}
-    # group by 1
-    # """
-    # )
-
-    geo_data = db.sql("""
-SELECT
-            ST_AsWKB(geometry) as geometry,
-            geo.postcode,
-            "Weekly rent"
-            from suburbs as geo
-            inner join rentals_per_bedroom r on geo.postcode = r.postcode
-
-    """)
-
-    df = gpd.GeoDataFrame.from_records(
-        geo_data.fetchall(),
-        columns=["geometry", "postcode", "Weekly rent"],
+
+def rental_per_bedroom(filters: RentalFilters) -> pd.DataFrame:
+    # not in st.cache_data, the rents and the shapes are in the results cache
+    # of the connection, bounded in bytes. Mean weekly rent per postcode, from
+    # the monthly rollup
+    rentals_per_bedroom = rent_summary(db, ["postcode"], filters)
+
+    # shapes simplified for the number of postcodes, with their centroid
+    df = postcode_shapes(db, rentals_per_bedroom["postcode"].tolist())
+    df = df.merge(
+        rentals_per_bedroom[["postcode", "mean_weekly_rent"]].round(2), on="postcode"
     )
-    # convert the geometry to a shapely object
-    df["geometry"] = gpd.GeoSeries.from_wkb(df["geometry"], crs="4326")
-    # Set the geometry column
-    df.set_geometry("geometry", inplace=True)
     df = df.reset_index()
-    # df = rentals_per_bedroom.df()
-    print("rental_per_bedroom")
-    print(df.info())
     # only keep lat, lon and weekly rent
     # df = df[['lat', 'lon', 'Weekly rent']]
-    # rename Weekly rent to weekly_rent
-    df.rename(columns={"Weekly rent": "weekly_rent"}, inplace=True)
+    # rename mean_weekly_rent to weekly_rent
+    df.rename(
+        columns={
+            "mean_weekly_rent": "weekly_rent",
+            "centroid_lat": "lat",
+            "centroid_lon": "lon",
+        },
+        inplace=True,
+    )
     return df
 
 
-print("Getting postcodes")
-
-df = rental_per_bedroom(year_choice, selected_dwelling_types, selected_postcodes)
-
-df["lat"] = df.geometry.centroid.x
-df["lon"] = df.geometry.centroid.y
-
-print(df.info())
+def folium_map(filters: RentalFilters):
+    """The whole layer as one GeoJSON, when the tiles weren't built"""
+    # slow to import, only needed without the tiles
+    from streamlit_folium import st_folium
 
+    df = rental_per_bedroom(filters)
 
-map = df.explore(
-    column="weekly_rent",
-    # scheme="naturalbreaks",
-    cmap="OrRd",
-    k=10,
-    legend=True,
-)
-print("callculated map")
+    map = df.explore(
+        column="weekly_rent",
+        # scheme="naturalbreaks",
+        cmap="OrRd",
+        k=10,
+        legend=True,
+    )
 
-make_map_responsive = """
+    make_map_responsive = """
      <style>
      [title~="st.iframe"] { width: 100%}
      </style>
     """
-st.markdown(make_map_responsive, unsafe_allow_html=True)
+    st.markdown(make_map_responsive, unsafe_allow_html=True)
+
+    st_folium(
+        map, returned_objects=[], width=1000, height=500, use_container_width=True
+    )
+
+
+def tiles_map(filters: RentalFilters, bbox: tuple[float, float, float, float] | None):
+    """Vector tiles of the postcodes, only the tiles in view are downloaded"""
+    # the tile server computes the same metrics from the filters of the URL
+    metrics = postcode_metrics(db, filters)
+    rents = metrics["weekly_rent"].dropna()
+    if rents.empty:
+        st.info("No bond with a rent matches the selection")
+        return
+    server = get_tile_server()
+
+    # light to dark red with the rent
+    low, high = rents.min(), rents.max()
+    scale = f"(properties.weekly_rent - {low}) / {max(high - low, 1)}"
+    layer = pdk.Layer(
+        "MVTLayer",
+        data=tile_url(server, filters),
+        min_zoom=TILE_MIN_ZOOM,
+        max_zoom=TILE_MAX_ZOOM,
+        get_fill_color=f"[255 - 128 * {scale}, 247 - 247 * {scale}, 236 - 236 * {scale}, 180]",
+        get_line_color=[80, 80, 80],
+        line_width_min_pixels=0.5,
+        pickable=True,
+    )
+    if bbox is None:
+        view = pdk.ViewState(latitude=-32.5, longitude=147.0, zoom=TILE_MIN_ZOOM + 1)
+    else:
+        xmin, ymin, xmax, ymax = bbox
+        view = pdk.ViewState(
+            latitude=(ymin + ymax) / 2,
+            longitude=(xmin + xmax) / 2,
+            zoom=math.log2(min(360 / (xmax - xmin), 180 / (ymax - ymin))) + 1,
+        )
+    st.pydeck_chart(
+        pdk.Deck(
+            layers=[layer],
+            initial_view_state=view,
+            map_style=None,
+            tooltip={"text": "{postcode}: ${weekly_rent} per week, {bonds} bonds"},
+        ),
+        use_container_width=True,
+    )
+
 
-st_date = st_folium(
-    map, returned_objects=[], width=1000, height=500, use_container_width=True
-)
+if has_table(db, "postcode_tiles"):
+    tiles_map(filters, bbox)
+else:
+    folium_map(filters)
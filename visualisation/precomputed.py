@@ -0,0 +1,158 @@
+"""Tables computed once when the database is built, and the constants the build
+scripts share with the dashboard.
+
+The build scripts (scripts/build_rollup.py, build_stats.py,
+simplify_geometry.py, build_tiles.py and build_database.py, which runs them
+all) import this module, so the tables are built with the same queries the
+dashboard runs on ``rentals`` when the database was built without them.
+"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import duckdb
+
+# width of the rent_bins bins, in dollars
+RENT_BIN_WIDTH = 10
+
+# size of the cells of the postcode_grid index, in degrees
+GRID_CELL_SIZE = 0.1
+
+# simplification level of the shapes (see scripts/simplify_geometry.py) cut
+# into tiles at each zoom level, the map overzooms the last one
+ZOOM_LEVELS = {4: 2, 5: 2, 6: 2, 7: 1, 8: 1, 9: 0, 10: 0}
+TILE_MIN_ZOOM = min(ZOOM_LEVELS)
+TILE_MAX_ZOOM = max(ZOOM_LEVELS)
+
+# half the size of the world in Web Mercator, in meters
+MERCATOR_HALF_SIZE = 20037508.342789244
+
+# Monthly rollup of the rentals table (rentals_monthly), the dashboard runs
+# it on rentals when the database has no rollup table.
+# The dashboard answers its per-bedroom/per-month/per-postcode counts and
+# means from this table instead of scanning every lodgement on each widget
+# change: the counts and sums add up across rows, in compact integer types
+# (HUGEINT sums are several times slower to scan).
+# There is no rent distribution per row: a (month, postcode, type, bedrooms)
+# cell holds a handful of bonds, so any histogram/sketch of it is about as big
+# as the rows themselves. The medians are computed on rentals (see
+# rent_summary in db.py) and the rent histogram reads rent_bins.
+MONTHLY_ROLLUP_QUERY = """
+SELECT
+    date_trunc('month', "lodgement_date")::DATE AS "month",
+    "postcode",
+    "type",
+    CASE WHEN "bedrooms" > 5 THEN 5 ELSE "bedrooms" END AS "bedrooms_corrected",
+    COUNT(*)::UINTEGER AS "bonds",
+    COUNT("weekly_rent")::UINTEGER AS "rent_count",
+    SUM("weekly_rent")::BIGINT AS "rent_sum",
+    MIN("weekly_rent") AS "rent_min",
+    MAX("weekly_rent") AS "rent_max"
+FROM rentals
+WHERE {where}
+GROUP BY ALL
+"""
+
+# Number of bonds per RENT_BIN_WIDTH weekly rent bin, for the rent histogram:
+# the bins of the chart are multiples of these, whatever the selection.
+# {keys} are the leading columns: the rent_bins table keeps RENT_BINS_KEYS for
+# the filters to apply to, the dashboard computes the bins of the bedrooms
+# only when the database has no rent_bins
+RENT_BINS_QUERY = f"""
+SELECT
+    {{keys}}
+    CASE WHEN "bedrooms" > 5 THEN 5 ELSE "bedrooms" END AS "bedrooms_corrected",
+    ("weekly_rent" // {RENT_BIN_WIDTH})::UINTEGER AS "rent_bin",
+    COUNT(*)::UINTEGER AS "bonds"
+FROM rentals
+WHERE {{where}} AND "weekly_rent" IS NOT NULL
+GROUP BY ALL
+"""
+RENT_BINS_KEYS = """date_trunc('month', "lodgement_date")::DATE AS "month",
+    "postcode",
+    "type","""
+
+# Weekly rent trim bounds of the rentals table (rent_trim_bounds).
+# The dashboard drops the rents outside of the 5%/95% quantiles as outliers,
+# they only change when rentals is built again so they are computed once
+# instead of on every page rerun.
+# One row per bedrooms (5+ merged) and one for all of them ("all_bedrooms").
+TRIM_BOUNDS_QUERY = """
+SELECT
+    GROUPING("bedrooms_corrected") = 1 AS "all_bedrooms",
+    "bedrooms_corrected",
+    QUANTILE_CONT("weekly_rent", 0.05) AS "lower_bound",
+    QUANTILE_CONT("weekly_rent", 0.95) AS "upper_bound"
+FROM (
+    SELECT
+        CASE WHEN "bedrooms" > 5 THEN 5 ELSE "bedrooms" END AS "bedrooms_corrected",
+        "weekly_rent"
+    FROM rentals
+)
+GROUP BY GROUPING SETS (("bedrooms_corrected"), ())
+"""
+
+# Values offered by the filter widgets of the dashboard (rental_domains), read
+# on every first page view instead of scanning rentals for them.
+DOMAINS_QUERY = """
+SELECT
+    list(DISTINCT "postcode"::VARCHAR ORDER BY "postcode"::VARCHAR) AS "postcodes",
+    list(DISTINCT "type"::VARCHAR ORDER BY "type"::VARCHAR) AS "dwelling_types",
+    MIN("lodgement_date") AS "min_date",
+    MAX("lodgement_date") AS "max_date"
+FROM rentals
+"""
+
+# Grid index of the postcode bounding boxes (postcode_grid): the cells of
+# $cell_size degrees (GRID_CELL_SIZE) each postcode of postcode_extents overlaps
+GRID_QUERY = """
+CREATE OR REPLACE TABLE postcode_grid AS
+WITH columns AS (
+    SELECT
+        "postcode",
+        unnest(range(
+            floor("xmin" / $cell_size)::BIGINT, floor("xmax" / $cell_size)::BIGINT + 1
+        )) AS "cell_x",
+        floor("ymin" / $cell_size)::BIGINT AS "first_cell_y",
+        floor("ymax" / $cell_size)::BIGINT AS "last_cell_y"
+    FROM postcode_extents
+)
+SELECT
+    "cell_x",
+    unnest(range("first_cell_y", "last_cell_y" + 1)) AS "cell_y",
+    "postcode"
+FROM columns
+ORDER BY "cell_x", "cell_y"
+"""
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Web Mercator bounds of a tile, y counted from the top"""
+    size = 2 * MERCATOR_HALF_SIZE / 2**z
+    xmin = -MERCATOR_HALF_SIZE + x * size
+    ymax = MERCATOR_HALF_SIZE - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def build_rollup(con: "duckdb.DuckDBPyConnection"):
+    """Build rentals_monthly and rent_bins from rentals"""
+    con.execute(
+        "CREATE OR REPLACE TABLE rentals_monthly AS "
+        f"{MONTHLY_ROLLUP_QUERY.format(where='true')} "
+        'ORDER BY "month", "postcode"'
+    )
+    con.execute(
+        "CREATE OR REPLACE TABLE rent_bins AS "
+        f"{RENT_BINS_QUERY.format(keys=RENT_BINS_KEYS, where='true')} "
+        'ORDER BY "month", "postcode"'
+    )
+
+
+def build_stats(con: "duckdb.DuckDBPyConnection"):
+    """Build rent_trim_bounds and rental_domains from rentals"""
+    con.execute(
+        "CREATE OR REPLACE TABLE rent_trim_bounds AS "
+        f"{TRIM_BOUNDS_QUERY} "
+        'ORDER BY "all_bedrooms", "bedrooms_corrected"'
+    )
+    con.execute(f"CREATE OR REPLACE TABLE rental_domains AS {DOMAINS_QUERY}")
@@ -0,0 +1,159 @@
+"""Vector tiles of the postcodes for the map page.
+
+A small HTTP server runs in a thread of the Streamlit process and serves the
+tiles cut by scripts/build_tiles.py as MVT:
+
+    GET /tiles/{z}/{x}/{y}.pbf?filters=<token>&version=<version>
+
+The token holds the filters of the page (see ``RentalFilters.to_token``), the
+rent metrics per postcode of these filters are attached as properties of the
+features of the tiles. The version of the database (see
+``DuckDBConnection.version``) is only there for the browser, which caches the
+tiles by URL: a rebuilt database gets new URLs instead of the stale tiles. The server computes them from the token through the
+results cache of the connection, so any replica serves the tiles of any page,
+whatever the number of selections. The browser only downloads the tiles in
+view at the current zoom.
+
+The server also serves the metrics of the queries (see metrics.py), in the
+Prometheus text format:
+
+    GET /metrics
+"""
+
+import http.server
+import os
+import re
+import threading
+import urllib.parse
+from typing import TYPE_CHECKING
+
+import streamlit as st
+
+from db import DuckDBConnection, get_db, rent_summary
+from filters import RentalFilters
+from precomputed import tile_bounds
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+TILE_PATTERN = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.pbf$")
+TILE_LAYER = "postcodes"
+
+
+def postcode_metrics(db: DuckDBConnection, filters: RentalFilters) -> "pd.DataFrame":
+    """The properties of the postcodes on the map, for the page and the tiles"""
+    metrics = rent_summary(db, ["postcode"], filters)
+    metrics = metrics[["postcode", "mean_weekly_rent", "bonds"]].round(2)
+    return metrics.rename(columns={"mean_weekly_rent": "weekly_rent"})
+
+
+class TileServer:
+    def __init__(self, db: DuckDBConnection, port: int):
+        self.db = db
+        self.port = port
+        self._server = http.server.ThreadingHTTPServer(
+            ("0.0.0.0", port), self._handler()
+        )
+        self._server.daemon_threads = True
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+
+    def tile(self, z: int, x: int, y: int, token: str) -> bytes | None:
+        """The MVT tile, None if the filters token is invalid"""
+        # imported by the first tile request, not by every run of the page
+        import mapbox_vector_tile
+        import shapely
+
+        try:
+            filters = RentalFilters.from_token(token)
+        except ValueError:
+            return None
+        # from the results cache, computed by the page of the token
+        metrics = (
+            postcode_metrics(self.db, filters)
+            .astype({"postcode": str})
+            .set_index("postcode")
+            .to_dict("index")
+        )
+
+        with self.db.lease() as cursor:
+            pieces = cursor.execute(
+                """
+SELECT "postcode", "geometry" FROM postcode_tiles
+WHERE "z" = $z AND "x" = $x AND "y" = $y
+""",
+                {"z": z, "x": x, "y": y},
+            ).fetchall()
+
+        features = [
+            {
+                "geometry": shapely.from_wkb(geometry),
+                "properties": {"postcode": postcode, **metrics[postcode]},
+            }
+            for postcode, geometry in pieces
+            # only the postcodes matching the filters
+            if postcode in metrics
+        ]
+        return mapbox_vector_tile.encode(
+            [{"name": TILE_LAYER, "features": features}],
+            default_options={"quantize_bounds": tile_bounds(z, x, y)},
+        )
+
+    def _handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                if url.path == "/metrics":
+                    self.send_metrics()
+                    return
+                match = TILE_PATTERN.match(url.path)
+                token = urllib.parse.parse_qs(url.query).get("filters", [""])[0]
+                data = None
+                if match is not None:
+                    z, x, y = map(int, match.groups())
+                    data = server.tile(z, x, y, token)
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+                self.send_header("Content-Length", str(len(data)))
+                # the map is drawn by the page, served from another port
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.send_header("Cache-Control", "private, max-age=3600")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_metrics(self):
+                data = server.db.metrics.prometheus(server.db.cache.stats()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@st.cache_resource
+def get_tile_server() -> TileServer:
+    """Start the tile and metrics server once per Streamlit process"""
+    server = TileServer(get_db(), int(os.environ.get("TILE_SERVER_PORT", "8765")))
+    server.start()
+    return server
+
+
+def tile_url(server: TileServer, filters: RentalFilters) -> str:
+    """URL template of the tiles of ``filters``, as seen from the browser"""
+    base_url = os.environ.get("TILE_SERVER_URL", f"http://localhost:{server.port}")
+    query = urllib.parse.urlencode(
+        {"filters": filters.to_token(), "version": server.db.version}
+    )
+    return f"{base_url}/tiles/{{z}}/{{x}}/{{y}}.pbf?{query}"
@@ -0,0 +1,51 @@
+"""Run the queries of the pages with their default filters before serving.
+
+The first visitor after a deploy would otherwise wait for the filter domains
+and the unfiltered aggregates of every page. Run before Streamlit starts (see
+the Dockerfile), the results end up in the disk cache (DUCKDB_CACHE_DIR) the
+dashboard reads, and the database file in the page cache of the OS.
+
+    python visualisation/warmup.py
+"""
+
+import time
+
+import db as dashboard_db
+from db import DuckDBConnection
+from filters import RentalFilters
+
+# default of the trend slider of the rent change page
+DEFAULT_TREND_MONTHS = 4
+
+
+def warm_up(db: DuckDBConnection):
+    domains = dashboard_db.rental_domains(db)
+    years = (domains["min_date"].year, domains["max_date"].year)
+    filters = RentalFilters.from_selection(years)
+
+    # Globals stats
+    dashboard_db.rent_summary(db, ["bedrooms_corrected"], filters, median=True)
+    dashboard_db.rent_summary(db, ["month_of_year"], filters)
+    # Rent stats
+    bounds = dashboard_db.rent_bounds(db, filters, lower=0.05, upper=0.95)
+    dashboard_db.trimmed_monthly_stats(db, filters, bounds)
+    dashboard_db.rent_histogram(db, filters, bounds, nbins=20)
+    # Rent change
+    dashboard_db.rent_trends(
+        db, RentalFilters.from_selection(years, max_bedrooms=5), DEFAULT_TREND_MONTHS
+    )
+    # Maps
+    metrics = dashboard_db.rent_summary(db, ["postcode"], filters)
+    if not dashboard_db.has_table(db, "postcode_tiles"):
+        dashboard_db.postcode_shapes(db, metrics["postcode"].tolist())
+
+
+def main():
+    start = time.perf_counter()
+    # same database as get_db, which needs the Streamlit runtime
+    warm_up(DuckDBConnection("rentals", database="rentals.duckdb", read_only=True))
+    print(f"Warmed up in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()